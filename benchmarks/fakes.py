@@ -0,0 +1,233 @@
+import base64
+import hashlib
+import io
+import os
+import time
+from types import SimpleNamespace
+
+# Size of the blocks written by write_local_file
+WRITE_BLOCK_SIZE = 1024 * 1024
+
+
+class FakeCollection:
+    """Stand-in for irods.collection.iRODSCollection"""
+
+    def __init__(self, path):
+        self.path = path
+
+
+class FakeDataObject:
+    """
+    Stand-in for irods.data_object.iRODSDataObject, backed by an in-memory or a local file content.
+
+    The content is made of a random part (entropy) followed by a repeated pattern, so the compressibility of the
+    file can be configured.
+    """
+
+    def __init__(
+        self,
+        name,
+        size,
+        entropy=1.0,
+        collection_path="/nlmumc/projects/P000000001/C000000001",
+        path=None,
+        checksum=None,
+        read_latency=0.0,
+    ):
+        """
+        Parameters
+        ----------
+        name: str
+            The file name
+        size: int
+            The file size in bytes
+        entropy: float
+            Ratio of random bytes in the file content, between 0 and 1
+        collection_path: str
+            The iRODS parent collection path
+        path: str
+            Optional local file path to read the content from, instead of generating it
+        checksum: str
+            The checksum stored in the catalog (e.g. 'sha2:...'), None if not calculated yet
+        read_latency: float
+            Number of seconds added to each read, like an iRODS read round trip
+        """
+        self.name = name
+        self.size = size
+        self.collection = FakeCollection(collection_path)
+        self.path = f"{collection_path}/{name}"
+        self.local_path = path
+        self.checksum = checksum
+        self.read_latency = read_latency
+
+        self._content = None
+        if path is None:
+            random_size = int(size * entropy)
+            self._content = os.urandom(random_size) + b"datahub " * ((size - random_size) // 8 + 1)
+            self._content = self._content[:size]
+
+    def open(self, mode="r"):
+        if self.local_path is not None:
+            file_buffer = open(self.local_path, "rb")
+        else:
+            file_buffer = io.BytesIO(self._content)
+        if self.read_latency > 0:
+            return LatencyReader(file_buffer, self.read_latency)
+        return file_buffer
+
+    def chksum(self, **options) -> str:
+        sha = hashlib.sha256()
+        with self.open("r") as f:
+            for block in iter(lambda: f.read(WRITE_BLOCK_SIZE), b""):
+                sha.update(block)
+        self.checksum = "sha2:" + base64.b64encode(sha.digest()).decode()
+
+        return self.checksum
+
+
+class LatencyReader(io.RawIOBase):
+    """File-like object adding a fixed latency to each read"""
+
+    def __init__(self, file_buffer, latency):
+        self.file_buffer = file_buffer
+        self.latency = latency
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def read(self, size=-1):
+        time.sleep(self.latency)
+        return self.file_buffer.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        time.sleep(self.latency)
+        return self.file_buffer.seek(offset, whence)
+
+    def close(self):
+        self.file_buffer.close()
+        super().close()
+
+
+class FakeIrodsClient:
+    """Stand-in for etl.irodsManager.irodsClient.irodsClient, records the status updates instead of writing AVUs"""
+
+    def __init__(self, file_objs=(), project_id="P000000001", collection_id="C000000001"):
+        """
+        Parameters
+        ----------
+        file_objs: list[FakeDataObject]
+            The collection data objects
+        project_id: str
+        collection_id: str
+        """
+        self.session = None
+        self.project_id = project_id
+        self.collection_id = collection_id
+        self.instance = make_fake_instance()
+        self.file_objs = list(file_objs)
+        self.statuses = []
+        self.errors = []
+
+    def update_metadata_status(self, attribute, value, progress=None):
+        self.statuses.append(value)
+
+    def set_error_status(self, attribute, value, depositor, repository, message):
+        self.errors.append(message)
+
+
+def write_local_file(path, size, entropy=1.0):
+    """
+    Write a local file to back a FakeDataObject, block by block to keep the memory usage flat.
+    Each block is made of a random part (entropy) followed by a repeated pattern, so the compressibility is even
+    along the file.
+
+    Parameters
+    ----------
+    path: str
+        The local file path
+    size: int
+        The file size in bytes
+    entropy: float
+        Ratio of random bytes in the file content, between 0 and 1
+
+    Returns
+    -------
+    str
+        The iRODS checksum value of the file content, 'sha2:' followed by the base64 encoded sha256 digest
+    """
+    sha = hashlib.sha256()
+    pattern = b"datahub " * (WRITE_BLOCK_SIZE // 8)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            block_size = min(WRITE_BLOCK_SIZE, remaining)
+            random_size = int(block_size * entropy)
+            block = os.urandom(random_size) + pattern[: block_size - random_size]
+            f.write(block)
+            sha.update(block)
+            remaining -= block_size
+
+    return "sha2:" + base64.b64encode(sha.digest()).decode()
+
+
+def make_fake_instance(contributors=10, keywords=10, publications=10):
+    """
+    Build a stand-in for the collection metadata instance read by the MetadataMapper.
+
+    Parameters
+    ----------
+    contributors: int
+        The number of contributors
+    keywords: int
+        The number of keywords, half of them from an ontology
+    publications: int
+        The number of related resources, half of them with an URL identifier
+
+    Returns
+    -------
+    SimpleNamespace
+        The fake metadata instance
+    """
+
+    def label(value):
+        return SimpleNamespace(label=value)
+
+    return SimpleNamespace(
+        creator=SimpleNamespace(full_name="Jonathan Melius"),
+        identifier=SimpleNamespace(pid="https://hdl.handle.net/21.T12996/P000000001C000000001"),
+        description=SimpleNamespace(description="Benchmark collection " * 50),
+        date=SimpleNamespace(date="2024-01-01"),
+        title=SimpleNamespace(title="Benchmark collection"),
+        contacts=SimpleNamespace(
+            contacts=[SimpleNamespace(full_name="Data Steward", email="steward@example.org", affiliation=label("UM"))]
+        ),
+        contributors=SimpleNamespace(
+            contributors=[
+                SimpleNamespace(full_name=f"Contributor {i}", type=label("data curator" if i % 2 else "other"))
+                for i in range(contributors)
+            ]
+        ),
+        subjects=SimpleNamespace(
+            subjects=[
+                SimpleNamespace(
+                    keyword=f"keyword {i}",
+                    scheme_iri="http://purl.obolibrary.org/obo/ncit.owl" if i % 2 else None,
+                    value_uri=SimpleNamespace(uri=f"http://purl.obolibrary.org/obo/NCIT_C{i}"),
+                )
+                for i in range(keywords)
+            ]
+        ),
+        related_resources=SimpleNamespace(
+            related_resources=[
+                SimpleNamespace(
+                    identifier=f"https://doi.org/10.1000/{i}" if i % 2 else f"10.1000/{i}",
+                    identifier_type=label("DOI"),
+                )
+                for i in range(publications)
+            ]
+        ),
+        resource_type=SimpleNamespace(type_detail="Imaging"),
+    )
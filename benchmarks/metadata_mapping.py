@@ -0,0 +1,86 @@
+"""
+Measure the metadata stage: map a collection metadata instance to the Dataverse dataset JSON.
+
+    * legacy: template.json re-read from disk for each export, fields appended one by one, debug dump always built
+    * current: preloaded template copy & compiled mapping plan
+
+Usage:
+    python -m benchmarks.metadata_mapping [entries] [exports]
+
+entries is the number of contributors, keywords and publications of the instance.
+"""
+
+import json
+import logging
+import sys
+import time
+
+from benchmarks.fakes import make_fake_instance
+from etl.dataverseManager.controlledVocabulary import BUNDLED_CITATION_TSV, ControlledVocabulary
+from etl.dataverseManager.dataverseMetadataMapper import TEMPLATE_PATH, MetadataMapper, preload_metadata_template
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class LegacyMetadataMapper(MetadataMapper):
+    """MetadataMapper with the former read_metadata"""
+
+    def read_metadata(self):
+        self.get_controlled_vocabulary()
+
+        with open(TEMPLATE_PATH) as f:
+            self.dataset_json = json.load(f)
+
+        self.md = self.dataset_json["datasetVersion"]
+        self.map_author()
+        self.map_alternative_url()
+        self.map_description()
+        self.map_date()
+        self.map_title()
+        self.map_subject()
+        self.map_depositor()
+        self.map_contacts()
+        self.map_contributors()
+        self.map_keywords()
+        self.map_publications()
+        self.map_resource_type()
+
+        self.dataset_json["datasetVersion"] = self.md
+        logger.debug(json.dumps(self.dataset_json, indent=4))
+
+        return self.dataset_json
+
+
+def run(mapper_class, instance, vocabulary, exports) -> (float, dict):
+    start = time.perf_counter()
+    for _ in range(exports):
+        dataset_json = mapper_class("depositor@example.org", instance, vocabulary).read_metadata()
+
+    return (time.perf_counter() - start) / exports, dataset_json
+
+
+def main(entries=5000, exports=20):
+    # The worker runs at INFO level: the metadata debug dump is not logged
+    logging.basicConfig(level=logging.INFO)
+    logger.setLevel(logging.WARNING)
+
+    with open(BUNDLED_CITATION_TSV, "rb") as f:
+        vocabulary = ControlledVocabulary.parse(f.readlines())
+    instance = make_fake_instance(entries, entries, entries)
+    preload_metadata_template()
+
+    print(f"Instance: {entries} contributors, keywords & publications - {exports} exports")
+    print(f"{'mapper':<10}{'ms / export':>15}")
+    results = []
+    for name, mapper_class in (("legacy", LegacyMetadataMapper), ("current", MetadataMapper)):
+        seconds, dataset_json = run(mapper_class, instance, vocabulary, exports)
+        results.append(dataset_json)
+        print(f"{name:<10}{seconds * 1000:>15.2f}")
+
+    if results[0] != results[1]:
+        print("The legacy and current dataset JSON differ!")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
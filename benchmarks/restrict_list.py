@@ -0,0 +1,58 @@
+"""
+Measure the per-file lookup cost of the restrict list as the user selection grows.
+
+    * legacy: selected folders expanded into a list, 'min_path in list' for each data object
+    * current: RestrictList hashed set of files & prefix trie of folders
+
+Usage:
+    python -m benchmarks.restrict_list [lookups]
+"""
+
+import sys
+import time
+
+from etl.irodsManager.restrictList import RestrictList
+
+COLLECTION = "P000000001/C000000001"
+
+
+def make_selection(selected_files, selected_folders):
+    files = [f"{COLLECTION}/data/run{i % 100}/file{i}.bin" for i in range(selected_files)]
+    folders = [f"{COLLECTION}/folder{i}" for i in range(selected_folders)]
+    return files, folders
+
+
+def make_lookups(lookups):
+    # Half of the data objects are under a selected folder (or selected), half of them are not selected
+    paths = []
+    for i in range(lookups):
+        if i % 2:
+            paths.append(f"{COLLECTION}/folder{i % 10}/sub/file{i}.bin")
+        else:
+            paths.append(f"{COLLECTION}/other/run{i % 100}/file{i}.bin")
+    return paths
+
+
+def measure(restrict_list, paths) -> float:
+    start = time.perf_counter()
+    for path in paths:
+        _ = path in restrict_list
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main(lookups=2000):
+    paths = make_lookups(lookups)
+    print(f"{'selected files':>15}{'legacy us / file':>20}{'current us / file':>20}")
+    for selected_files in (100, 1000, 10000, 100000):
+        files, folders = make_selection(selected_files, 10)
+        # The legacy expansion enumerates each selected folder, with 1000 files per folder
+        legacy = files + [f"{folder}/sub/file{i}.bin" for folder in folders for i in range(1000)]
+        current = RestrictList(files, folders)
+
+        legacy_seconds = measure(legacy, paths[:200])
+        current_seconds = measure(current, paths)
+        print(f"{selected_files:>15}{legacy_seconds * 1e6:>20.2f}{current_seconds * 1e6:>20.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,410 @@
+"""
+Local stand-in for the Dataverse file upload API, to benchmark the upload pipeline without a Dataverse instance.
+
+POST /api/datasets/:persistentId/add reads the multipart body (with a Content-Length or chunked), unpacks the zip
+file field on the fly and answers the Dataverse response format, with the MD5 checksum of each unpacked file:
+
+    {"status": "OK", "data": {"files": [{"directoryLabel": "...", "dataFile": {"filename": "...", "md5": "..."}}]}}
+
+The zip is parsed while it is received, like Dataverse the body is never buffered in memory or on disk.
+A zip written to an unseekable stream has no entry sizes in its local headers, and a data descriptor after each entry.
+Like java.util.zip.ZipInputStream, used by Dataverse, a STORED entry with a data descriptor is rejected, unless the
+stub is started to accept them (to measure the opt-in stored compression policy): the end of the stored entry is then
+found by its data descriptor, checked against the CRC-32 & size of the data read so far.
+
+Usage:
+    python -m benchmarks.stub_dataverse [port]
+"""
+
+import hashlib
+import json
+import multiprocessing
+import struct
+import sys
+import zipfile
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BLOCK_SIZE = 1024 * 1024
+ADD_FILE_PATH = "/api/datasets/:persistentId/add"
+
+LOCAL_FILE_HEADER_SIGNATURE = b"PK\x03\x04"
+CENTRAL_DIRECTORY_SIGNATURE = b"PK\x01\x02"
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+LOCAL_FILE_HEADER = struct.Struct("<4s2B4HL2L2H")
+ZIP64_EXTRA_ID = 0x0001
+
+
+class RequestBody:
+    """Readable request body, with a Content-Length or chunked transfer encoding, and a push back buffer"""
+
+    def __init__(self, rfile, content_length=None, chunked=False):
+        self.rfile = rfile
+        self.chunked = chunked
+        # Bytes left in the body, or in the current chunk
+        self.remaining = content_length or 0
+        self.ended = not chunked and not content_length
+        self._chunks_read = 0
+        self._pushed_back = b""
+
+    def read(self, size=BLOCK_SIZE) -> bytes:
+        """Read up to size bytes, b'' at the end of the body"""
+        if self._pushed_back:
+            data, self._pushed_back = self._pushed_back[:size], self._pushed_back[size:]
+            return data
+        if self.remaining == 0 and not self._next_chunk():
+            return b""
+
+        data = self.rfile.read(min(size, self.remaining))
+        if not data:
+            raise ConnectionError("Request body truncated")
+        self.remaining -= len(data)
+
+        return data
+
+    def read_exact(self, size) -> bytes:
+        data = b""
+        while len(data) < size:
+            block = self.read(size - len(data))
+            if not block:
+                raise ValueError("Unexpected end of the request body")
+            data += block
+
+        return data
+
+    def read_line(self) -> bytes:
+        line = b""
+        while not line.endswith(b"\r\n"):
+            block = self.read(1024)
+            if not block:
+                break
+            end = block.find(b"\n")
+            if end >= 0:
+                self.push_back(block[end + 1 :])
+                block = block[: end + 1]
+            line += block
+
+        return line
+
+    def push_back(self, data):
+        self._pushed_back = data + self._pushed_back
+
+    def drain(self):
+        while self.read():
+            pass
+
+    def _next_chunk(self) -> bool:
+        if self.ended:
+            return False
+        if not self.chunked:
+            self.ended = True
+            return False
+
+        if self._chunks_read > 0:
+            # The CRLF after the previous chunk data
+            self.rfile.readline()
+        self._chunks_read += 1
+        self.remaining = int(self.rfile.readline().split(b";")[0], 16)
+        if self.remaining == 0:
+            # Skip the trailer headers
+            while self.rfile.readline() not in (b"\r\n", b""):
+                pass
+            self.ended = True
+            return False
+
+        return True
+
+
+def unpack_zip_stream(body, stored_data_descriptor=False) -> list:
+    """
+    Unpack the zip entries from the body, and calculate their MD5 checksum.
+
+    Parameters
+    ----------
+    body: RequestBody
+        The body, positioned at the start of the zip
+    stored_data_descriptor: bool
+        If True, accept the STORED entries with a data descriptor, which Dataverse rejects
+
+    Returns
+    -------
+    list[tuple(str, str)]
+        The zip entry path & MD5 checksum value of each file
+    """
+    files = []
+    while True:
+        signature = body.read_exact(4)
+        if signature == CENTRAL_DIRECTORY_SIGNATURE:
+            return files
+        if signature != LOCAL_FILE_HEADER_SIGNATURE:
+            raise ValueError(f"Unexpected zip signature {signature!r}")
+
+        header = LOCAL_FILE_HEADER.unpack(signature + body.read_exact(LOCAL_FILE_HEADER.size - 4))
+        flag_bits, compress_type, crc, compress_size = header[3], header[4], header[7], header[8]
+        name = body.read_exact(header[10]).decode("utf-8" if flag_bits & 0x800 else "cp437")
+        extra = body.read_exact(header[11])
+        zip64 = _has_zip64_extra(extra)
+
+        md5 = hashlib.md5()
+        if compress_type == zipfile.ZIP_DEFLATED:
+            crc_value, size = _read_deflated(body, md5)
+        elif compress_type == zipfile.ZIP_STORED and flag_bits & zipfile._MASK_USE_DATA_DESCRIPTOR:
+            if not stored_data_descriptor:
+                raise ValueError(f"only DEFLATED entries can have EXT descriptor: {name}")
+            crc_value, size = _read_stored_until_data_descriptor(body, md5, zip64)
+            crc = crc_value
+        elif compress_type == zipfile.ZIP_STORED:
+            crc_value, size = _read_stored(body, md5, compress_size)
+        else:
+            raise ValueError(f"Unsupported compression method {compress_type} for {name}")
+
+        if flag_bits & zipfile._MASK_USE_DATA_DESCRIPTOR and compress_type != zipfile.ZIP_STORED:
+            crc = _read_data_descriptor(body, zip64)
+        if crc != crc_value:
+            raise ValueError(f"Bad CRC-32 for {name}")
+
+        files.append((name, md5.hexdigest()))
+
+
+def _has_zip64_extra(extra) -> bool:
+    offset = 0
+    while offset + 4 <= len(extra):
+        header_id, size = struct.unpack_from("<HH", extra, offset)
+        if header_id == ZIP64_EXTRA_ID:
+            return True
+        offset += 4 + size
+
+    return False
+
+
+def _read_stored(body, md5, size) -> (int, int):
+    crc = 0
+    remaining = size
+    while remaining > 0:
+        block = body.read(min(BLOCK_SIZE, remaining))
+        if not block:
+            raise ValueError("Unexpected end of the request body")
+        md5.update(block)
+        crc = zlib.crc32(block, crc)
+        remaining -= len(block)
+
+    return crc, size
+
+
+def _read_deflated(body, md5) -> (int, int):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    crc = 0
+    size = 0
+    while not decompressor.eof:
+        block = decompressor.unconsumed_tail or body.read()
+        if not block:
+            raise ValueError("Unexpected end of the request body")
+        # Bound the decompressed block size, a highly compressible block can expand a thousand times
+        data = decompressor.decompress(block, BLOCK_SIZE)
+        md5.update(data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+    body.push_back(decompressor.unused_data)
+
+    return crc, size
+
+
+def _read_data_descriptor(body, zip64) -> int:
+    signature = body.read_exact(4)
+    if signature != DATA_DESCRIPTOR_SIGNATURE:
+        # The data descriptor signature is optional
+        body.push_back(signature)
+    crc = struct.unpack("<L", body.read_exact(4))[0]
+    body.read_exact(16 if zip64 else 8)
+
+    return crc
+
+
+def _read_stored_until_data_descriptor(body, md5, zip64) -> (int, int):
+    """
+    Read a stored entry of unknown size: the data ends at the first data descriptor signature followed by the
+    CRC-32 & size of the data read so far.
+    """
+    descriptor = struct.Struct("<4sLQQ" if zip64 else "<4sLLL")
+    crc = 0
+    size = 0
+    pending = b""
+    while True:
+        block = body.read()
+        if not block:
+            raise ValueError("Unexpected end of the request body")
+        pending += block
+
+        start = 0
+        while True:
+            position = pending.find(DATA_DESCRIPTOR_SIGNATURE, start)
+            if position < 0 or position + descriptor.size > len(pending):
+                break
+            data = memoryview(pending)[start:position]
+            md5.update(data)
+            crc = zlib.crc32(data, crc)
+            size += len(data)
+            _, descriptor_crc, compress_size, file_size = descriptor.unpack_from(pending, position)
+            if descriptor_crc == crc and compress_size == size and file_size == size:
+                body.push_back(pending[position + descriptor.size :])
+                return crc, size
+
+            # Not a data descriptor: the signature bytes are part of the file data
+            data = pending[position : position + 1]
+            md5.update(data)
+            crc = zlib.crc32(data, crc)
+            size += 1
+            start = position + 1
+
+        if position >= 0:
+            # A signature too close to the end to read its data descriptor: keep it for the next block
+            keep = position
+        else:
+            # Keep the tail, which may be the start of a signature
+            keep = max(start, len(pending) - len(DATA_DESCRIPTOR_SIGNATURE) + 1)
+        data = memoryview(pending)[start:keep]
+        md5.update(data)
+        crc = zlib.crc32(data, crc)
+        size += len(data)
+        pending = pending[keep:]
+
+
+def get_dataverse_file_json(zip_file_path, md5) -> dict:
+    """
+    Build the Dataverse file json of an unpacked zip entry, see DataverseClient._get_dataverse_file_path.
+
+    Parameters
+    ----------
+    zip_file_path: str
+        The zip entry path
+    md5: str
+        The MD5 checksum value
+
+    Returns
+    -------
+    dict
+        The Dataverse file json
+    """
+    directory_label, _, filename = zip_file_path.strip("/").rpartition("/")
+    file_json = {"dataFile": {"filename": filename, "md5": md5}}
+    if directory_label:
+        # Dataverse removes the leading '.' of the folder names
+        file_json["directoryLabel"] = "/".join(folder.lstrip(".") for folder in directory_label.split("/"))
+
+    return file_json
+
+
+class StubDataverseHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # The response headers & body are written separately: with Nagle, each response waits for a delayed ACK
+    disable_nagle_algorithm = True
+    # Accept the STORED zip entries with a data descriptor, see unpack_zip_stream
+    stored_data_descriptor = False
+
+    def do_POST(self):
+        if not self.path.startswith(ADD_FILE_PATH):
+            self._send_json(404, {"status": "ERROR", "message": f"API endpoint does not exist: {self.path}"})
+            return
+
+        content_length = self.headers.get("Content-Length")
+        chunked = "chunked" in self.headers.get("Transfer-Encoding", "").lower()
+        body = RequestBody(self.rfile, int(content_length) if content_length else None, chunked)
+        try:
+            files = self._read_multipart_zip(body)
+            body.drain()
+        except (ValueError, zlib.error) as error:
+            self.close_connection = True
+            self._send_json(400, {"status": "ERROR", "message": str(error)})
+            return
+
+        data = {"files": [get_dataverse_file_json(path, md5) for path, md5 in files if not path.endswith("/")]}
+        self._send_json(200, {"status": "OK", "data": data})
+
+    def do_GET(self):
+        self._send_json(404, {"status": "ERROR", "message": f"API endpoint does not exist: {self.path}"})
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_multipart_zip(self, body) -> list:
+        boundary = self.headers.get_param("boundary")
+        if not boundary:
+            raise ValueError("Missing multipart boundary")
+
+        # Skip the parts until the 'file' part headers end
+        file_part = False
+        while True:
+            line = body.read_line()
+            if not line:
+                raise ValueError("Missing 'file' field")
+            if line.lower().startswith(b"content-disposition") and b'name="file"' in line:
+                file_part = True
+            elif file_part and line == b"\r\n":
+                return unpack_zip_stream(body, self.stored_data_descriptor)
+
+    def _send_json(self, status, content):
+        response = json.dumps(content).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+def serve(port=0, connection=None, stored_data_descriptor=False):
+    """
+    Run the stub Dataverse server until the process is terminated.
+
+    Parameters
+    ----------
+    port: int
+        The listening port, a free port if 0
+    connection: multiprocessing.connection.Connection
+        Optional pipe end to send the listening port to
+    stored_data_descriptor: bool
+        If True, accept the STORED zip entries with a data descriptor, which Dataverse rejects
+    """
+    StubDataverseHandler.stored_data_descriptor = stored_data_descriptor
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubDataverseHandler)
+    server.daemon_threads = True
+    if connection is not None:
+        connection.send(server.server_address[1])
+    server.serve_forever()
+
+
+class StubDataverse:
+    """
+    Run the stub Dataverse server in a child process, so its CPU & memory usage isn't measured with the benchmark.
+
+    Usage:
+        with StubDataverse() as url:
+            ...
+    """
+
+    def __init__(self, stored_data_descriptor=False):
+        """
+        Parameters
+        ----------
+        stored_data_descriptor: bool
+            If True, accept the STORED zip entries with a data descriptor, which Dataverse rejects
+        """
+        self.stored_data_descriptor = stored_data_descriptor
+        self.process = None
+        self.url = None
+
+    def __enter__(self) -> str:
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=serve, args=(0, sender, self.stored_data_descriptor), daemon=True)
+        self.process.start()
+        self.url = f"http://127.0.0.1:{receiver.recv()}"
+
+        return self.url
+
+    def __exit__(self, *exc_info):
+        self.process.terminate()
+        self.process.join()
+
+
+if __name__ == "__main__":
+    serve(*[int(arg) for arg in sys.argv[1:]])
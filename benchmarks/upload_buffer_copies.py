@@ -0,0 +1,165 @@
+"""
+Measure the number of bytes copied per uploaded byte by the upload buffer layers.
+
+    * legacy: UnseekableStream + IteratorAsBinaryFile + requests_toolbelt MultipartEncoder
+    * current: ChunkBuffer + MultipartZipStream
+
+Usage:
+    python -m benchmarks.upload_buffer_copies [size_in_MB]
+"""
+
+import json
+import sys
+import time
+import zipfile
+from io import RawIOBase
+
+from requests.utils import super_len
+from requests_toolbelt.multipart import encoder
+from requests_toolbelt.multipart.encoder import CustomBytesIO, MultipartEncoder, encode_with
+
+from benchmarks.fakes import FakeDataObject
+from etl.dataverseManager.uploadUtils import (
+    ChunkBuffer,
+    MultipartZipStream,
+    calculate_stored_zip_size,
+    create_zip_buffer_generator,
+    upload_zip_generator,
+)
+
+# http.client reads file-like bodies by blocks of 8 KB
+HTTP_BLOCK_SIZE = 8192
+
+
+class CopyCounter:
+    copied = 0
+
+
+class LegacyUnseekableStream(RawIOBase):
+    """Copy of the former uploadUtils.UnseekableStream, instrumented"""
+
+    def __init__(self):
+        self._buffer = b""
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        # bytes concatenation copies the whole buffer
+        CopyCounter.copied += len(self._buffer) + len(b)
+        self._buffer += b
+        return len(b)
+
+    def get(self):
+        chunk = self._buffer
+        self._buffer = b""
+        return chunk
+
+
+class LegacyIteratorAsBinaryFile(object):
+    """Copy of the former uploadUtils.IteratorAsBinaryFile"""
+
+    def __init__(self, size, iterator, encoding="utf-8"):
+        self.size = int(size)
+        self.len = self.size
+        self.iterator = iterator
+        self.encoding = encoding
+        self._buffer = CustomBytesIO()
+
+    def _get_bytes(self):
+        try:
+            return encode_with(next(self.iterator), self.encoding)
+        except StopIteration:
+            return b""
+
+    def _load_bytes(self, size):
+        self._buffer.smart_truncate()
+        amount_to_load = size - super_len(self._buffer)
+        bytes_to_append = True
+
+        while amount_to_load > 0 and bytes_to_append:
+            bytes_to_append = self._get_bytes()
+            amount_to_load -= self._buffer.append(bytes_to_append)
+
+    def read(self, size=-1):
+        size = int(size)
+        self._load_bytes(size)
+        s = self._buffer.read(size)
+        if not s:
+            self.len = 0
+        return s
+
+
+def count_custom_bytes_io_copies():
+    """Instrument requests_toolbelt CustomBytesIO: each write & read copies the bytes"""
+    write = encoder.CustomBytesIO.write
+    read = encoder.CustomBytesIO.read
+
+    def counted_write(self, b):
+        CopyCounter.copied += len(b)
+        return write(self, b)
+
+    def counted_read(self, *args):
+        chunk = read(self, *args)
+        CopyCounter.copied += len(chunk)
+        return chunk
+
+    encoder.CustomBytesIO.write = counted_write
+    encoder.CustomBytesIO.read = counted_read
+
+
+def run_legacy(file_obj) -> (int, float):
+    CopyCounter.copied = 0
+    checksums = {}
+    stream_buffer = LegacyUnseekableStream()
+    zip_generator = create_zip_buffer_generator(file_obj, stream_buffer, checksums, zipfile.ZIP_STORED)
+
+    def legacy_upload_zip_generator():
+        for _ in zip_generator:
+            chunk = stream_buffer.get()
+            if len(chunk) > 0:
+                yield chunk
+
+    iterator = LegacyIteratorAsBinaryFile(calculate_stored_zip_size(file_obj), legacy_upload_zip_generator())
+    multipart_encoder = MultipartEncoder(fields={"jsonData": json.dumps({}), "file": ("bench.zip", iterator)})
+
+    start = time.perf_counter()
+    sent = 0
+    for chunk in iter(lambda: multipart_encoder.read(HTTP_BLOCK_SIZE), b""):
+        sent += len(chunk)
+
+    return CopyCounter.copied, time.perf_counter() - start
+
+
+def run_current(file_obj) -> (int, float):
+    checksums = {}
+    stream_buffer = ChunkBuffer()
+    zip_generator = create_zip_buffer_generator(file_obj, stream_buffer, checksums, zipfile.ZIP_STORED)
+    multipart_stream = MultipartZipStream(
+        json.dumps({}),
+        "bench.zip",
+        upload_zip_generator(zip_generator, stream_buffer),
+        calculate_stored_zip_size(file_obj),
+    )
+
+    start = time.perf_counter()
+    sent = 0
+    for chunk in multipart_stream:
+        sent += len(chunk)
+
+    return stream_buffer.bytes_copied, time.perf_counter() - start
+
+
+def main(size_mb=64):
+    count_custom_bytes_io_copies()
+    file_obj = FakeDataObject("bench.bin", size_mb * 1024 * 1024)
+
+    print(f"File size: {size_mb} MB")
+    print(f"{'pipeline':<10}{'copied bytes / uploaded byte':>30}{'seconds':>10}")
+    for name, run in (("legacy", run_legacy), ("current", run_current)):
+        copied, seconds = run(file_obj)
+        print(f"{name:<10}{copied / file_obj.size:>30.2f}{seconds:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
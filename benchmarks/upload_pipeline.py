@@ -0,0 +1,326 @@
+"""
+Measure the upload pipeline throughput, peak RSS and CPU time per GB, for several file size distributions.
+
+The files are local files of configurable entropy, read through FakeDataObject. Each scenario runs in a fresh
+process, so its peak RSS isn't inflated by the previous scenarios, in two modes:
+    * zip: uploadUtils only, the multipart zip stream is read without any network
+    * upload: DataverseClient._upload_file, against the local stub Dataverse server, and the upload checksums are
+      validated against the stub response
+
+The results are compared to a stored baseline, and a regression beyond the tolerance fails the benchmark.
+The baseline is machine dependent: save a new one (--save-baseline) before comparing on another machine.
+
+Usage:
+    python -m benchmarks.upload_pipeline [--scale 1.0] [--entropy 0.5] [--read-latency 0.0] [--scenario mixed]
+                                         [--mode upload] [--tolerance 0.15] [--baseline PATH] [--save-baseline]
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+from benchmarks.fakes import FakeDataObject, write_local_file
+from benchmarks.stub_dataverse import StubDataverse
+
+COLLECTION_PATH = "/nlmumc/projects/P000000001/C000000001"
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "upload_pipeline.json")
+KB = 1024
+MB = 1024**2
+GB = 1024**3
+
+# name => (number of files, minimum size, maximum size), the sizes are log-uniform distributed
+SCENARIOS = {
+    "small-files": (1000, 1 * KB, 256 * KB),
+    "mixed": (100, 4 * KB, 32 * MB),
+    "large-files": (2, 256 * MB, 256 * MB),
+}
+MODES = ("zip", "upload")
+# metric => True if higher is better
+METRICS = {
+    "throughput_mb_s": True,
+    "peak_rss_mb": False,
+    "cpu_s_per_gb": False,
+}
+
+
+def get_file_sizes(scenario, scale=1.0, seed=0) -> list:
+    """
+    Parameters
+    ----------
+    scenario: str
+        The scenario name
+    scale: float
+        The ratio of the number of files to generate
+    seed: int
+        The random seed, the same sizes are generated for the same parameters
+
+    Returns
+    -------
+    list[int]
+        The file sizes in bytes
+    """
+    count, min_size, max_size = SCENARIOS[scenario]
+    generator = random.Random(seed)
+    return [
+        int(math.exp(generator.uniform(math.log(min_size), math.log(max_size))))
+        for _ in range(max(1, round(count * scale)))
+    ]
+
+
+def create_local_files(directory, scenario, scale, entropy, read_latency=0.0) -> list:
+    """
+    Write the scenario local files, half of them in a sub-collection.
+
+    Returns
+    -------
+    list[dict]
+        The FakeDataObject arguments of each file
+    """
+    files = []
+    for index, size in enumerate(get_file_sizes(scenario, scale)):
+        name = f"{scenario}_{index:05}.bin"
+        path = os.path.join(directory, name)
+        checksum = write_local_file(path, size, entropy)
+        collection_path = COLLECTION_PATH if index % 2 else f"{COLLECTION_PATH}/sub-folder"
+        files.append(
+            {
+                "name": name,
+                "size": size,
+                "collection_path": collection_path,
+                "path": path,
+                "checksum": checksum,
+                "read_latency": read_latency,
+            }
+        )
+
+    return files
+
+
+def run_zip(file_objs) -> int:
+    """Read the multipart zip stream of each file, without any network"""
+    from etl.dataverseManager.compressionPolicy import get_compression_policy
+    from etl.dataverseManager.parallelDeflate import get_parallel_deflate
+    from etl.dataverseManager.uploadUtils import get_hashing_executor, get_zip_bundle_multipart_stream
+    from etl.irodsManager.dataObjectReader import get_read_policy
+
+    compression_policy = get_compression_policy()
+    read_policy = get_read_policy()
+    validated = 0
+    for file_obj in file_objs:
+        compression = compression_policy.decide(file_obj)
+        checksums = {}
+        multipart_stream = get_zip_bundle_multipart_stream(
+            [file_obj],
+            checksums,
+            "{}",
+            "bench.zip",
+            [(compression.compress_type, compression.compress_level)],
+            read_policy=read_policy,
+            hashing_executor=get_hashing_executor(),
+            parallel_deflate=get_parallel_deflate(),
+        )
+        for _ in multipart_stream:
+            pass
+        if checksums.get(file_obj.path):
+            validated += 1
+
+    return validated
+
+
+def run_upload(file_objs, url) -> int:
+    """Upload each file with DataverseClient._upload_file to the stub Dataverse server, and validate it"""
+    from benchmarks.fakes import FakeIrodsClient
+    from etl.dataverseManager.dataverseClient import DataverseClient
+    from etl.dataverseManager.uploadUtils import get_zip_file_path
+    from etl.irodsManager.irodsUtils import decode_irods_checksum
+
+    irods_client = FakeIrodsClient(file_objs)
+    dataverse_client = DataverseClient(url, "benchmark-token", "DataHub", irods_client, "benchmark@example.org")
+    dataverse_client._set_dataset("doi:10.5072/FK2/BENCHMARK")
+
+    validated = 0
+    for file_obj in file_objs:
+        response = dataverse_client._upload_file(file_obj)
+        validated_paths = dataverse_client._validate_upload_checksum(response)
+        validated_checksum = dataverse_client._validate_buffer_checksum(
+            file_obj.path, decode_irods_checksum(file_obj.checksum)
+        )
+        if validated_checksum and get_zip_file_path(file_obj) in validated_paths:
+            validated += 1
+
+    return validated
+
+
+def run_scenario(files, mode, url, connection):
+    """
+    Run a scenario mode in the current process, and send the measures to the parent process.
+
+    Parameters
+    ----------
+    files: list[dict]
+        The FakeDataObject arguments of each file
+    mode: str
+        zip or upload
+    url: str
+        The stub Dataverse server URL
+    connection: multiprocessing.connection.Connection
+        The pipe end to send the measures to
+    """
+    file_objs = [FakeDataObject(**file) for file in files]
+    total_size = sum(file_obj.size for file_obj in file_objs)
+
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    if mode == "zip":
+        validated = run_zip(file_objs)
+    else:
+        validated = run_upload(file_objs, url)
+    seconds = time.perf_counter() - start
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    cpu_seconds = (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime)
+    connection.send(
+        {
+            "files": len(file_objs),
+            "validated_files": validated,
+            "bytes": total_size,
+            "seconds": round(seconds, 3),
+            "throughput_mb_s": round(total_size / MB / seconds, 2),
+            # ru_maxrss is in KB on Linux
+            "peak_rss_mb": round(usage_end.ru_maxrss / KB, 1),
+            "cpu_s_per_gb": round(cpu_seconds / (total_size / GB), 3),
+        }
+    )
+
+
+def measure(files, mode, url) -> dict:
+    context = multiprocessing.get_context("spawn")
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=run_scenario, args=(files, mode, url, sender))
+    process.start()
+    result = receiver.recv()
+    process.join()
+
+    return result
+
+
+def compare(results, baseline, tolerance) -> list:
+    """
+    Parameters
+    ----------
+    results: dict
+        scenario/mode => measures
+    baseline: dict
+        scenario/mode => measures of the baseline
+    tolerance: float
+        The relative change of a metric accepted before it's reported as a regression
+
+    Returns
+    -------
+    list[str]
+        The regressions
+    """
+    regressions = []
+    for key, measures in results.items():
+        if key not in baseline:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            reference = baseline[key][metric]
+            change = (measures[metric] - reference) / reference if reference else 0
+            if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+                regressions.append(f"{key} {metric}: {measures[metric]} vs {reference} baseline ({change:+.0%})")
+
+    return regressions
+
+
+def get_parameters(arguments) -> dict:
+    return {
+        "scale": arguments.scale,
+        "entropy": arguments.entropy,
+        "read_latency": arguments.read_latency,
+        "compression_policy": os.environ.get("EXPORT_COMPRESSION_POLICY", "fixed"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload pipeline benchmark")
+    parser.add_argument("--scale", type=float, default=1.0, help="ratio of the number of files per scenario")
+    parser.add_argument("--entropy", type=float, default=0.5, help="ratio of random bytes in the files")
+    parser.add_argument("--read-latency", type=float, default=0.0, help="seconds added to each data object read")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="scenario to run, all by default")
+    parser.add_argument("--mode", action="append", choices=MODES, help="mode to run, all by default")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="relative change reported as a regression")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--save-baseline", action="store_true", help="save the results as the new baseline")
+    arguments = parser.parse_args()
+
+    # The status updates & the retries aren't part of the measure
+    os.environ.setdefault("EXPORT_STATUS_INTERVAL", "3600")
+    os.environ.setdefault("HTTP_RETRIES", "0")
+
+    baseline = {}
+    if os.path.exists(arguments.baseline):
+        with open(arguments.baseline) as f:
+            baseline = json.load(f)
+    parameters = get_parameters(arguments)
+    if baseline and baseline["parameters"] != parameters:
+        print(f"Baseline parameters {baseline['parameters']} differ from {parameters}: comparison skipped")
+        baseline = {}
+
+    print(f"{'scenario/mode':<22}{'files':>7}{'MB':>9}{'MB/s':>9}{'peak RSS MB':>13}{'CPU s/GB':>10}")
+    results = {}
+    # Like Dataverse, the stub rejects the STORED entries with a data descriptor, unless the stored policy is measured
+    stub_dataverse = StubDataverse(stored_data_descriptor=parameters["compression_policy"] == "stored")
+    with tempfile.TemporaryDirectory(prefix="upload-pipeline-") as directory, stub_dataverse as url:
+        os.environ["EXPORT_JOURNAL_DIR"] = os.path.join(directory, "journal")
+        for scenario in arguments.scenario or SCENARIOS:
+            files = create_local_files(directory, scenario, arguments.scale, arguments.entropy, arguments.read_latency)
+            for mode in arguments.mode or MODES:
+                key = f"{scenario}/{mode}"
+                result = measure(files, mode, url)
+                if result["validated_files"] != result["files"]:
+                    sys.exit(f"{key}: {result['files'] - result['validated_files']} file(s) not validated")
+                results[key] = result
+                print(
+                    f"{key:<22}{result['files']:>7}{result['bytes'] / MB:>9.1f}{result['throughput_mb_s']:>9.1f}"
+                    f"{result['peak_rss_mb']:>13.1f}{result['cpu_s_per_gb']:>10.2f}"
+                )
+            for file in files:
+                os.remove(file["path"])
+
+    if arguments.save_baseline:
+        os.makedirs(os.path.dirname(arguments.baseline), exist_ok=True)
+        with open(arguments.baseline, "w") as f:
+            json.dump(
+                {
+                    "machine": f"{platform.machine()} {os.cpu_count()} CPU(s)",
+                    "python": platform.python_version(),
+                    "parameters": parameters,
+                    "results": {key: {metric: result[metric] for metric in METRICS} for key, result in results.items()},
+                },
+                f,
+                indent=2,
+            )
+        print(f"Baseline saved: {arguments.baseline}")
+        return
+
+    if not baseline:
+        return
+    regressions = compare(results, baseline["results"], arguments.tolerance)
+    for regression in regressions:
+        print(f"Regression: {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"No regression against the baseline ({arguments.tolerance:.0%} tolerance)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Measure the CPU-bound throughput of the zip generator stages for a single file, in memory:
+
+    * each stage alone: SHA256, MD5, deflate
+    * the zip generator, with the hashes calculated in the generator thread (inline) or on the hashing threads
+      (parallel), for a stored and a deflated zip entry
+
+    * the zip generator, with the deflate compressed by blocks on a thread pool (parallel deflate)
+
+With the parallel hashing, the zip generator throughput should be close to the slowest stage alone, instead of the
+sum of the stages. This requires at least 3 CPU cores. With the parallel deflate, the deflated zip generator
+throughput should grow with the number of CPU cores.
+
+The parallel deflate upload body, built like DataverseClient builds it, is also read back with zipfile and with the
+stub Dataverse server, to check its content, CRC-32 & MD5.
+
+Usage:
+    python -m benchmarks.zip_stages [size_in_MB]
+"""
+
+import hashlib
+import io
+import os
+import sys
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeDataObject
+from benchmarks.stub_dataverse import RequestBody, unpack_zip_stream
+from etl.dataverseManager.parallelDeflate import ParallelDeflate
+from etl.dataverseManager.uploadUtils import (
+    ChunkBuffer,
+    create_zip_bundle_generator,
+    get_zip_bundle_multipart_stream,
+    upload_zip_generator,
+)
+from etl.irodsManager.dataObjectReader import BLOCK_SIZE
+
+MB = 1024**2
+
+
+def measure(function, size) -> float:
+    start = time.perf_counter()
+    function()
+    return size / MB / (time.perf_counter() - start)
+
+
+def run_stage(content, update):
+    for offset in range(0, len(content), BLOCK_SIZE):
+        update(content[offset : offset + BLOCK_SIZE])
+
+
+def run_zip_generator(file_obj, compress_type, hashing_executor=None, parallel_deflate=None, output=None):
+    stream_buffer = ChunkBuffer()
+    zip_generator = create_zip_bundle_generator(
+        [file_obj],
+        stream_buffer,
+        {},
+        [(compress_type, None)],
+        hashing_executor=hashing_executor,
+        parallel_deflate=parallel_deflate,
+    )
+    for chunk in upload_zip_generator(zip_generator, stream_buffer):
+        if output is not None:
+            output.write(chunk)
+
+
+def check_round_trip(file_obj, parallel_deflate) -> bool:
+    """
+    Build the multipart upload body of the file with get_zip_bundle_multipart_stream, as DataverseClient does, and
+    read its zip back with zipfile, which checks the CRC-32, and with the stub Dataverse server, which checks the MD5
+    """
+    checksums = {}
+    multipart_stream = get_zip_bundle_multipart_stream(
+        [file_obj], checksums, "{}", "bench.zip", [(zipfile.ZIP_DEFLATED, None)], parallel_deflate=parallel_deflate
+    )
+    body = b"".join(multipart_stream)
+    zip_content = body[len(multipart_stream.header) : -len(multipart_stream.trailer)]
+
+    with zipfile.ZipFile(io.BytesIO(zip_content)) as zip_file:
+        zip_info = zip_file.infolist()[0]
+        if zip_file.testzip() is not None or zip_file.read(zip_info) != file_obj._content:
+            return False
+
+    files = unpack_zip_stream(RequestBody(io.BytesIO(zip_content), len(zip_content)))
+    return files == [(zip_info.filename, checksums[zip_info.filename])]
+
+
+def main(size_mb=256):
+    file_obj = FakeDataObject("bench.bin", size_mb * MB, entropy=0.5)
+    content = file_obj._content
+    size = file_obj.size
+
+    print(f"File size: {size_mb} MB")
+    print(f"{'stage':<28}{'MB/s':>10}")
+    stages = {
+        "sha256": lambda: run_stage(content, hashlib.sha256().update),
+        "md5": lambda: run_stage(content, hashlib.md5().update),
+        "deflate": lambda: run_stage(
+            content, zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15).compress
+        ),
+    }
+    for name, function in stages.items():
+        print(f"{name:<28}{measure(function, size):>10.1f}")
+
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="hashing") as executor:
+        for compress_type in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            method = zipfile.compressor_names[compress_type]
+            for hashing, hashing_executor in (("inline", None), ("parallel", executor)):
+                throughput = measure(lambda: run_zip_generator(file_obj, compress_type, hashing_executor), size)
+                print(f"{f'zip {method} {hashing}':<28}{throughput:>10.1f}")
+
+    workers = os.cpu_count()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deflate") as executor:
+        parallel_deflate = ParallelDeflate(executor, 0, 2 * workers)
+        throughput = measure(lambda: run_zip_generator(file_obj, zipfile.ZIP_DEFLATED, None, parallel_deflate), size)
+        print(f"{f'zip deflate {workers} thread(s)':<28}{throughput:>10.1f}")
+        print(f"Parallel deflate round trip: {'ok' if check_round_trip(file_obj, parallel_deflate) else 'FAILED'}")
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,280 @@
+import abc
+import logging
+import os
+import zipfile
+import zlib
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# Extensions of formats that are already compressed: deflating them again burns CPU for almost no size gain
+COMPRESSED_EXTENSIONS = {
+    ".7z",
+    ".avi",
+    ".bz2",
+    ".docx",
+    ".gif",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".nii.gz",
+    ".npz",
+    ".parquet",
+    ".pdf",
+    ".png",
+    ".pptx",
+    ".rar",
+    ".tgz",
+    ".webm",
+    ".xlsx",
+    ".xz",
+    ".zip",
+    ".zst",
+}
+
+# Extensions of text formats that are known to compress well
+COMPRESSIBLE_EXTENSIONS = {
+    ".csv",
+    ".json",
+    ".log",
+    ".md",
+    ".nii",
+    ".py",
+    ".r",
+    ".tsv",
+    ".txt",
+    ".xml",
+}
+
+# A zip written to the upload stream has a data descriptor after each entry: Dataverse unpacks the upload with
+# java.util.zip.ZipInputStream, which rejects the STORED entries with a data descriptor. Store the data as is in a
+# DEFLATED entry instead, with deflate level 0 (5 bytes of overhead per 64 KB block).
+STORE_LEVEL = 0
+
+# Compression methods Dataverse unpacks: java.util.zip only supports STORED & DEFLATED, see STORE_LEVEL for STORED
+COMPRESSION_METHODS = {
+    "deflate": zipfile.ZIP_DEFLATED,
+}
+
+
+class CompressionDecision:
+    """Store the zip compression method selected for a single file, and why it was selected"""
+
+    def __init__(self, compress_type, compress_level=None, reason=""):
+        """
+        Parameters
+        ----------
+        compress_type: int
+            The zipfile compression method constant
+        compress_level: int
+            The compression level, None for the method default level
+        reason: str
+            Why this compression method was selected
+        """
+        self.compress_type = compress_type
+        self.compress_level = compress_level
+        self.reason = reason
+
+    @property
+    def is_stored(self) -> bool:
+        return self.compress_type == zipfile.ZIP_STORED
+
+    def __str__(self):
+        method = zipfile.compressor_names.get(self.compress_type, str(self.compress_type))
+        level = "default" if self.compress_level is None else self.compress_level
+        return f"{method} (level: {level}) - {self.reason}"
+
+
+class CompressionPolicy(abc.ABC):
+    """Base compression policy: select the zip compression method used to wrap each uploaded file"""
+
+    @abc.abstractmethod
+    def decide(self, file_obj) -> CompressionDecision:
+        """
+        Select the compression method for the file to upload.
+
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        CompressionDecision
+            The compression method to use
+        """
+
+
+class StoredCompressionPolicy(CompressionPolicy):
+    """
+    Never compress: the zip length is known before the upload and the file is sent with a Content-Length.
+
+    Opt-in: the STORED entries have a data descriptor, which java.util.zip.ZipInputStream rejects ("only DEFLATED
+    entries can have EXT descriptor"), and Dataverse unpacks the uploaded zip with it. No Dataverse version is known to
+    accept them: only use this policy with a Dataverse installation that was checked to unpack them.
+    """
+
+    def decide(self, file_obj) -> CompressionDecision:
+        return CompressionDecision(zipfile.ZIP_STORED, reason="policy stored")
+
+
+class FixedCompressionPolicy(CompressionPolicy):
+    """Always use the same compression method & level"""
+
+    def __init__(self, compress_type=zipfile.ZIP_DEFLATED, compress_level=None):
+        self.compress_type = compress_type
+        self.compress_level = compress_level
+
+    def decide(self, file_obj) -> CompressionDecision:
+        return CompressionDecision(self.compress_type, self.compress_level, reason="policy fixed")
+
+
+class ContentAwareCompressionPolicy(CompressionPolicy):
+    """
+    Select the compression method per file, based on:
+        * the file size: small files are stored
+        * the file extension: already compressed formats are stored, known text formats are compressed
+        * the compressibility of the first bytes of the file, for the other extensions
+
+    A stored file is deflated at level 0, see STORE_LEVEL: the zip entries are always DEFLATED, and the bundle is sent
+    with chunked transfer encoding.
+
+    Sampling costs an extra iRODS open & read of sample_size bytes per file, before the upload opens it again: it's
+    done for the files of at least min_size bytes with an unknown extension only. The sample is read separately,
+    because the compression method is written in the zip entry header, before the upload reads the file data.
+    """
+
+    def __init__(
+        self,
+        compress_type=zipfile.ZIP_DEFLATED,
+        compress_level=None,
+        min_size=64 * 1024,
+        sample_size=64 * 1024,
+        min_ratio=0.9,
+        compressed_extensions=None,
+        compressible_extensions=None,
+    ):
+        """
+        Parameters
+        ----------
+        compress_type: int
+            The zipfile compression method constant used for compressible files
+        compress_level: int
+            The compression level used for compressible files, None for the method default level
+        min_size: int
+            Files smaller than this size (in bytes) are stored
+        sample_size: int
+            The number of bytes read at the start of the file to estimate its compressibility
+        min_ratio: float
+            If the compressed sample size divided by the sample size is above this ratio, the file is stored
+        compressed_extensions: set
+            Extensions of the files that are always stored
+        compressible_extensions: set
+            Extensions of the files that are always compressed
+        """
+        self.compress_type = compress_type
+        self.compress_level = compress_level
+        self.min_size = min_size
+        self.sample_size = sample_size
+        self.min_ratio = min_ratio
+        self.compressed_extensions = compressed_extensions or COMPRESSED_EXTENSIONS
+        self.compressible_extensions = compressible_extensions or COMPRESSIBLE_EXTENSIONS
+
+    def decide(self, file_obj) -> CompressionDecision:
+        name = file_obj.name.lower()
+        if file_obj.size < self.min_size:
+            return self._store(f"size {file_obj.size} < {self.min_size}")
+
+        for extension in self.compressed_extensions:
+            if name.endswith(extension):
+                return self._store(f"compressed extension {extension}")
+
+        for extension in self.compressible_extensions:
+            if name.endswith(extension):
+                return CompressionDecision(
+                    self.compress_type, self.compress_level, reason=f"compressible extension {extension}"
+                )
+
+        ratio = self.sample_ratio(file_obj)
+        if ratio > self.min_ratio:
+            return self._store(f"sample ratio {ratio:.2f} > {self.min_ratio}")
+
+        return CompressionDecision(
+            self.compress_type, self.compress_level, reason=f"sample ratio {ratio:.2f} <= {self.min_ratio}"
+        )
+
+    @staticmethod
+    def _store(reason) -> CompressionDecision:
+        return CompressionDecision(zipfile.ZIP_DEFLATED, STORE_LEVEL, reason=reason)
+
+    def sample_ratio(self, file_obj) -> float:
+        """
+        Estimate the file compressibility by compressing the first bytes of the file with a fast deflate level.
+        The data object is opened for the sample only, one more iRODS open per sampled file.
+
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        float
+            The compressed sample size divided by the sample size
+        """
+        file_buffer = file_obj.open("r")
+        try:
+            sample = file_buffer.read(self.sample_size)
+        finally:
+            file_buffer.close()
+
+        if len(sample) == 0:
+            return 1.0
+
+        return len(zlib.compress(sample, 1)) / len(sample)
+
+
+def get_compression_policy() -> CompressionPolicy:
+    """
+    Create the compression policy configured with the environment variables:
+        * EXPORT_COMPRESSION_POLICY: fixed (default), content-aware or stored (opt-in, see StoredCompressionPolicy)
+        * EXPORT_COMPRESSION_METHOD: deflate (default), the only compression method Dataverse unpacks
+        * EXPORT_COMPRESSION_LEVEL: the compression level, the method default level if not set
+        * EXPORT_COMPRESSION_MIN_SIZE: content-aware minimum file size in bytes to compress
+        * EXPORT_COMPRESSION_SAMPLE_SIZE: content-aware number of bytes sampled to estimate the compressibility,
+          each sampled file is opened one more time in iRODS
+        * EXPORT_COMPRESSION_MIN_RATIO: content-aware maximum sample ratio to compress
+
+    Returns
+    -------
+    CompressionPolicy
+        The configured compression policy
+    """
+    policy = os.environ.get("EXPORT_COMPRESSION_POLICY", "fixed").lower()
+    method = os.environ.get("EXPORT_COMPRESSION_METHOD", "deflate").lower()
+    level = os.environ.get("EXPORT_COMPRESSION_LEVEL")
+
+    if method not in COMPRESSION_METHODS:
+        logger.error(f"Unknown EXPORT_COMPRESSION_METHOD '{method}', fallback to deflate")
+        method = "deflate"
+    compress_type = COMPRESSION_METHODS[method]
+    compress_level = int(level) if level else None
+
+    if policy == "stored":
+        logger.warning(
+            "EXPORT_COMPRESSION_POLICY stored: the Dataverse unzip must accept STORED entries with a data descriptor"
+        )
+        return StoredCompressionPolicy()
+    if policy == "content-aware":
+        return ContentAwareCompressionPolicy(
+            compress_type,
+            compress_level,
+            min_size=int(os.environ.get("EXPORT_COMPRESSION_MIN_SIZE", 64 * 1024)),
+            sample_size=int(os.environ.get("EXPORT_COMPRESSION_SAMPLE_SIZE", 64 * 1024)),
+            min_ratio=float(os.environ.get("EXPORT_COMPRESSION_MIN_RATIO", 0.9)),
+        )
+    if policy != "fixed":
+        logger.error(f"Unknown EXPORT_COMPRESSION_POLICY '{policy}', fallback to fixed")
+
+    return FixedCompressionPolicy(compress_type, compress_level)
@@ -0,0 +1,202 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from etl.httpManager.httpSession import get_http_session
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+CITATION_TSV_URL = (
+    "https://raw.githubusercontent.com/IQSS/dataverse/develop/scripts/api/data/metadatablocks/citation.tsv"
+)
+# Snapshot of the citation.tsv controlled vocabulary, used until a cached or remote version is available
+BUNDLED_CITATION_TSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "citation.tsv")
+
+
+class ControlledVocabulary:
+    """Store the parsed Dataverse controlled vocabularies used by the MetadataMapper"""
+
+    def __init__(self, contributor_type=None, publication_id_type=None):
+        """
+        Parameters
+        ----------
+        contributor_type: dict
+            lower case contributor type => Dataverse contributor type
+        publication_id_type: dict
+            lower case publication id type => Dataverse publication id type
+        """
+        self.contributor_type = contributor_type or {}
+        self.publication_id_type = publication_id_type or {}
+
+    @classmethod
+    def parse(cls, lines):
+        """
+        Parse the citation.tsv metadata block.
+
+        Parameters
+        ----------
+        lines: list[bytes]
+            The citation.tsv lines
+
+        Returns
+        -------
+        ControlledVocabulary
+            The parsed controlled vocabularies
+        """
+        vocabulary = cls()
+        for line in lines:
+            decoded_line = line.decode()
+            if "publicationIDType" in decoded_line:
+                value = decoded_line.split("\t")[2]
+                vocabulary.publication_id_type[value.lower()] = value
+            elif "contributorType" in decoded_line:
+                value = decoded_line.split("\t")[2]
+                vocabulary.contributor_type[value.lower()] = value
+
+        return vocabulary
+
+
+class ControlledVocabularyCache:
+    """
+    Process-wide cache of the Dataverse citation.tsv controlled vocabulary.
+
+    The parsed vocabulary is shared in memory across the exports, and never waits for the remote citation.tsv:
+        * it is first loaded from the on-disk cache, or from the bundled snapshot
+        * once the on-disk cache is older than the TTL, a background thread revalidates it with the remote
+          citation.tsv (ETag/If-Modified-Since), and replaces the in-memory vocabulary if it changed
+    """
+
+    def __init__(self, cache_dir, ttl, url=CITATION_TSV_URL, snapshot_path=BUNDLED_CITATION_TSV):
+        """
+        Parameters
+        ----------
+        cache_dir: str
+            The directory of the on-disk cache
+        ttl: float
+            The number of seconds before the on-disk cache is revalidated
+        url: str
+            The remote citation.tsv URL
+        snapshot_path: str
+            The bundled citation.tsv snapshot path
+        """
+        self.ttl = ttl
+        self.url = url
+        self.snapshot_path = snapshot_path
+        self.cache_path = os.path.join(cache_dir, "citation.tsv")
+        self.metadata_path = os.path.join(cache_dir, "citation.tsv.json")
+
+        self._vocabulary = None
+        self._lock = threading.Lock()
+        self._refresh_thread = None
+
+    def get(self) -> ControlledVocabulary:
+        """
+        Get the parsed controlled vocabulary, and start a background revalidation if the cache is stale.
+
+        Returns
+        -------
+        ControlledVocabulary
+            The shared parsed controlled vocabulary, read-only
+        """
+        with self._lock:
+            if self._vocabulary is None:
+                self._vocabulary = self._load()
+            if self._is_stale() and (self._refresh_thread is None or not self._refresh_thread.is_alive()):
+                self._refresh_thread = threading.Thread(target=self.refresh, name="vocabulary-refresh", daemon=True)
+                self._refresh_thread.start()
+
+            return self._vocabulary
+
+    def refresh(self):
+        """Revalidate the on-disk cache with the remote citation.tsv, and update the in-memory vocabulary"""
+        metadata = self._read_metadata()
+        headers = {}
+        if os.path.exists(self.cache_path):
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+
+        try:
+            response = get_http_session().get(self.url, headers=headers, timeout=(5, 30))
+        except Exception as error:
+            logger.warning(f"--\t Controlled vocabulary refresh failed: {error}")
+            return
+
+        if response.status_code == 304:
+            logger.info("--\t Controlled vocabulary not modified")
+        elif response.ok:
+            vocabulary = ControlledVocabulary.parse(response.content.splitlines(keepends=True))
+            try:
+                self._write_file(self.cache_path, response.content)
+            except OSError as error:
+                logger.warning(f"--\t Controlled vocabulary cache write failed: {error}")
+            with self._lock:
+                self._vocabulary = vocabulary
+            metadata = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+            }
+            logger.info("--\t Controlled vocabulary updated")
+        else:
+            logger.warning(f"--\t Controlled vocabulary refresh failed: HTTP {response.status_code}")
+            return
+
+        metadata["fetched_at"] = time.time()
+        try:
+            self._write_file(self.metadata_path, json.dumps(metadata).encode())
+        except OSError as error:
+            logger.warning(f"--\t Controlled vocabulary cache write failed: {error}")
+
+    def _load(self) -> ControlledVocabulary:
+        path = self.cache_path if os.path.exists(self.cache_path) else self.snapshot_path
+        logger.info(f"--\t Load controlled vocabulary {path}")
+        with open(path, "rb") as f:
+            return ControlledVocabulary.parse(f.readlines())
+
+    def _is_stale(self) -> bool:
+        return time.time() - self._read_metadata().get("fetched_at", 0) > self.ttl
+
+    def _read_metadata(self) -> dict:
+        try:
+            with open(self.metadata_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_file(path, content):
+        # Write to a temporary file first, so a concurrent reader never reads a partial file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(content)
+        os.replace(temporary_path, path)
+
+
+_vocabulary_cache = None
+_vocabulary_cache_lock = threading.Lock()
+
+
+def get_controlled_vocabulary() -> ControlledVocabulary:
+    """
+    Get the process-wide controlled vocabulary, configured with the environment variables:
+        * VOCABULARY_CACHE_DIR: the directory of the on-disk cache (default /tmp/controlled-vocabulary)
+        * VOCABULARY_CACHE_TTL: the number of seconds before the cache is revalidated (default 86400)
+
+    Returns
+    -------
+    ControlledVocabulary
+        The shared parsed controlled vocabulary, read-only
+    """
+    global _vocabulary_cache
+    with _vocabulary_cache_lock:
+        if _vocabulary_cache is None:
+            _vocabulary_cache = ControlledVocabularyCache(
+                os.environ.get("VOCABULARY_CACHE_DIR", "/tmp/controlled-vocabulary"),
+                float(os.environ.get("VOCABULARY_CACHE_TTL", 86400)),
+            )
+
+    return _vocabulary_cache.get()
@@ -2,22 +2,48 @@ import io
 import json
 import logging
 import os
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from http import HTTPStatus
 
-import requests
 from requests import Response
-from requests.exceptions import ProxyError
-from requests_toolbelt.multipart.encoder import MultipartEncoder
-
-from etl.dataverseManager.uploadUtils import calculate_zip_buffer_size, get_zip_iterator
+from requests.exceptions import RequestException
+
+from etl.dataverseManager.compressionPolicy import get_compression_policy
+from etl.dataverseManager.exportJournal import ExportJournal
+from etl.dataverseManager.exportPipeline import ExportPipeline, PipelineStage
+from etl.dataverseManager.parallelDeflate import get_parallel_deflate
+from etl.dataverseManager.uploadUtils import (
+    InFlightBudget,
+    get_hashing_executor,
+    get_zip_bundle_multipart_stream,
+    get_zip_file_path,
+)
+from etl.httpManager.httpSession import RETRY_STATUS_CODES, get_http_session
+from etl.httpManager.outbox import DeliveryError, get_outbox, outbox_handler
+from etl.irodsManager.checksumPolicy import get_checksum_policy
+from etl.irodsManager.dataObjectReader import get_read_policy
 from etl.irodsManager.irodsUtils import (
     ExporterState as Status,
+    decode_irods_checksum,
     get_irods_data_object_checksum_value,
+    submit_service_desk_ticket,
 )
+from etl.irodsManager.restrictList import RestrictList
+from etl.irodsManager.statusReporter import StatusReporter
+from etl.metricsManager.exportProfiler import get_export_profiler
+from etl.metricsManager.exporterMetrics import UPLOAD_DURATION, get_upload_files_label
 
 logger = logging.getLogger("iRODS to Dataverse")
 
+# Outbox message kinds, see etl.httpManager.outbox
+EMAIL_CONFIRMATION = "email-confirmation"
+SUBMIT_FOR_REVIEW = "submit-for-review"
+
+# Number of seconds the exported status AVU is left for the frontends, when the exported event isn't published
+EXPORTED_STATUS_DELAY = 5
+
 BLOCK_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
 
 
@@ -48,7 +74,7 @@ class DataverseClient:
         self.depositor = depositor
 
         self.restrict = False
-        self.restrict_list = []
+        self.restrict_list = RestrictList()
 
         self.irods_client = irods_client
         self.session = irods_client.session
@@ -60,9 +86,51 @@ class DataverseClient:
         # str: irods data object path => sha_hex_digest
         # str: dataverse relative file path => md5_hex_digest
         self.upload_checksums_dict = {}
+        self.upload_checksums_lock = threading.Lock()
+
+        # Number of files uploaded in parallel & maximum total size of the files being uploaded
+        self.upload_workers = int(os.environ.get("EXPORT_UPLOAD_WORKERS", 1))
+        self.upload_max_in_flight_bytes = int(os.environ.get("EXPORT_UPLOAD_MAX_IN_FLIGHT_BYTES", 2 * 1024**3))
+        # Number of uploaded bundles validated in parallel, while the upload workers send the next bundles
+        self.validate_workers = int(os.environ.get("EXPORT_VALIDATE_WORKERS", 1))
+
+        # Small files are packed into a single zip upload, up to a maximum number of files & total size
+        self.bundle_file_max_bytes = int(os.environ.get("EXPORT_BUNDLE_FILE_MAX_BYTES", 16 * 1024**2))
+        self.bundle_max_bytes = int(os.environ.get("EXPORT_BUNDLE_MAX_BYTES", 256 * 1024**2))
+        self.bundle_max_files = int(os.environ.get("EXPORT_BUNDLE_MAX_FILES", 500))
+
+        self.compression_policy = get_compression_policy()
+
+        # The data objects are read by blocks, and the next blocks are read ahead while the current one is uploaded
+        self.read_policy = get_read_policy()
+        # The blocks are hashed on the shared hashing threads, while they are compressed
+        self.hashing_executor = get_hashing_executor()
+        # Opt-in: the large deflated files are compressed by blocks on the shared compression threads
+        self.parallel_deflate = get_parallel_deflate()
+
+        # The missing or recomputed iRODS checksums are requested in parallel with the uploads
+        self.checksum_policy = get_checksum_policy()
+        self.checksum_workers = int(os.environ.get("EXPORT_CHECKSUM_WORKERS", 2))
+        self.checksum_executor = None
+
+        self.http_session = get_http_session()
+        # The upload response is only sent once Dataverse has processed the uploaded zip
+        self.upload_read_timeout = float(os.environ.get("HTTP_UPLOAD_READ_TIMEOUT", 3600))
 
         self.zip_name = irods_client.instance.title.title + ".zip"
 
+        # The upload progress is written to the exporterState AVU at most once per interval
+        self.status_reporter = StatusReporter(irods_client, float(os.environ.get("EXPORT_STATUS_INTERVAL", 10)))
+
+        # Opt-in: records the time spent per zip/upload pipeline stage, switched on at the start of each export
+        self.profiler = get_export_profiler()
+        self.profiling_dir = os.environ.get("EXPORT_PROFILING_DIR", "/tmp/exporter-profiling")
+
+        # Records the dataset & the uploaded files, to resume the export after a failure. Data exports only.
+        self.journal = None
+        # str: dataverse relative file path => dataverse file json, of the resumed dataset
+        self.dataverse_files = {}
+
     def create_dataset(self, metadata, data_export=False):
         """
         Request a dataset creation with the input metadata.
@@ -73,47 +141,108 @@ class DataverseClient:
             The iRODS collection metadata mapped to match Dataverse metadata.
         data_export: bool
             If false, finalize the export process after the dataset creation.
+            If true, open the export journal, to resume the dataset of a previous attempt.
         """
         logger.info(f"{'--':<10}Dataset - request creation")
 
-        self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, Status.CREATE_DATASET.value)
-        url = f"{self.host}/api/dataverses/{self.alias}/datasets/"
+        if data_export:
+            self.journal = ExportJournal.open(self.irods_client.project_id, self.irods_client.collection_id, self.alias)
 
-        try:
-            response = requests.post(
-                url,
-                data=json.dumps(metadata),
-                headers={"Content-type": "application/json", "X-Dataverse-key": self.token},
-            )
-        except ProxyError:
-            error_message = self.host + " cannot be reached. Create dataset failed"
-            logger.error(error_message)
-            self.irods_client.set_error_status(
-                Status.ATTRIBUTE.value, Status.CREATE_DATASET_FAILED.value, self.depositor, self.alias, error_message
-            )
+        self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, Status.CREATE_DATASET.value)
+        if not self._resume_dataset():
+            url = f"{self.host}/api/dataverses/{self.alias}/datasets/"
+
+            try:
+                response = self.http_session.post(
+                    url,
+                    data=json.dumps(metadata),
+                    headers={"Content-type": "application/json", "X-Dataverse-key": self.token},
+                )
+            except RequestException as error:
+                error_message = f"{self.host} cannot be reached. Create dataset failed: {error}"
+                logger.error(error_message)
+                self.irods_client.set_error_status(
+                    Status.ATTRIBUTE.value,
+                    Status.CREATE_DATASET_FAILED.value,
+                    self.depositor,
+                    self.alias,
+                    error_message,
+                )
 
-            return
+                return
 
-        if response.status_code == HTTPStatus.CREATED.value:
-            self.dataset_pid = response.json()["data"]["persistentId"]
-            self.dataset_url = f"{self.host}/dataset.xhtml?persistentId={self.dataset_pid}&version=DRAFT"
-            self.dataset_deposit_url = f"{self.host}/api/datasets/:persistentId/add?persistentId={self.dataset_pid}"
-            logger.info(f"{'--':<20}Dataset created with pid: {self.dataset_pid}")
-        else:
-            logger.error(f"{'--':<20}Create dataset failed")
-            logger.error(response.content)
-            self.irods_client.set_error_status(
-                Status.ATTRIBUTE.value, Status.CREATE_DATASET_FAILED.value, self.depositor, self.alias, response.content
-            )
+            if response.status_code == HTTPStatus.CREATED.value:
+                self._set_dataset(response.json()["data"]["persistentId"])
+                if self.journal is not None:
+                    self.journal.set_dataset_pid(self.dataset_pid)
+                logger.info(f"{'--':<20}Dataset created with pid: {self.dataset_pid}")
+            else:
+                logger.error(f"{'--':<20}Create dataset failed")
+                logger.error(response.content)
+                self.irods_client.set_error_status(
+                    Status.ATTRIBUTE.value,
+                    Status.CREATE_DATASET_FAILED.value,
+                    self.depositor,
+                    self.alias,
+                    response.content,
+                )
 
-            return
+                return
 
-        if not data_export and response.status_code == HTTPStatus.CREATED.value:
+        if not data_export:
             self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, Status.FINALIZE.value)
             self._final_report()
             self._email_confirmation()
             self._submit_dataset_for_review()
 
+    def close(self):
+        """Close the export journal, it's kept to resume an export that isn't done"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def _set_dataset(self, dataset_pid):
+        self.dataset_pid = dataset_pid
+        self.dataset_url = f"{self.host}/dataset.xhtml?persistentId={self.dataset_pid}&version=DRAFT"
+        self.dataset_deposit_url = f"{self.host}/api/datasets/:persistentId/add?persistentId={self.dataset_pid}"
+
+    def _resume_dataset(self) -> bool:
+        """
+        Resume the draft dataset created by a previous attempt of the export, if any.
+        The files of the draft dataset are requested once, to be reconciled with the journal before the uploads.
+
+        Returns
+        -------
+        bool
+            True, if the export continues in the dataset of the previous attempt.
+        """
+        if self.journal is None:
+            return False
+
+        dataset_pid = self.journal.get_dataset_pid()
+        if dataset_pid is None:
+            return False
+
+        url = f"{self.host}/api/datasets/:persistentId/versions/:draft/files?persistentId={dataset_pid}"
+        try:
+            response = self.http_session.get(url, headers={"X-Dataverse-key": self.token})
+        except RequestException as error:
+            logger.error(f"{'--':<20}{self.host} cannot be reached. Resume dataset {dataset_pid} failed: {error}")
+            return False
+
+        if response.status_code != HTTPStatus.OK.value:
+            logger.warning(
+                f"{'--':<20}Draft dataset {dataset_pid} not found ({response.status_code}), create a new one"
+            )
+            return False
+
+        self._set_dataset(dataset_pid)
+        for file_json in response.json()["data"]:
+            self.dataverse_files[self._get_dataverse_file_path(file_json)] = file_json
+        logger.info(f"{'--':<20}Resume dataset {dataset_pid}: {len(self.dataverse_files)} files already uploaded")
+
+        return True
+
     def export_files(self, restrict=False, restrict_list=""):
         """
         Start to export the iRODS collection files to Dataverse. And then finalize the process, if all files uploads
@@ -123,8 +252,8 @@ class DataverseClient:
         ----------
         restrict: bool
             If True, put a restriction/embargo on the exported files in Dataverse.
-        restrict_list: str
-            CSV string that contains the filtered user files selection for the export.
+        restrict_list: RestrictList
+            The indexed user files selection for the export.
         """
         self.restrict = restrict
         if len(restrict_list) > 0:
@@ -141,10 +270,21 @@ class DataverseClient:
 
         self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, Status.PREPARE_COLLECTION.value)
         success = self._upload_files()
+        self.profiler.write(
+            self.profiling_dir,
+            f"{self.irods_client.project_id}_{self.irods_client.collection_id}",
+            project_id=self.irods_client.project_id,
+            collection_id=self.irods_client.collection_id,
+            dataset_pid=self.dataset_pid,
+            upload_workers=self.upload_workers,
+            success=success,
+        )
         if success:
             self._final_report()
             self._email_confirmation()
             self._submit_dataset_for_review()
+            self.journal.delete()
+            self.journal = None
         else:
             error_message = "Export failed"
             logger.error(f"{'--':<20}{error_message}")
@@ -154,109 +294,445 @@ class DataverseClient:
 
     def _upload_files(self) -> bool:
         """
-        Loop over the collection data objects/files recursively:
-            * Check the file was selected for the upload.
-            * Request the iRODS data object checksum value
-            * Start the file upload
-            * Check the iRODS data object checksum value to the file buffer checksum value
-            * Check the file buffer checksum value against the Dataverse uploaded file checksum value
+        Run the collection manifest data objects/files through the export pipeline: the export thread produces the
+        bundles, and two stages, connected by bounded queues, handle them:
+            * manifest (export thread, not a stage): check the file was selected for the upload, pack the small files
+              into bundles (a large file is a bundle on its own), and wait for the in-flight bytes budget
+            * upload (EXPORT_UPLOAD_WORKERS): read, hash, compress & send each bundle in a single streamed request
+            * validate (EXPORT_VALIDATE_WORKERS): check the iRODS, buffer & Dataverse checksums, and record the
+              validated files in the journal
+
+        A full stage queue blocks the previous stage, so the slowest stage sets the throughput. A failed upload is
+        reported, but doesn't stop the other uploads.
+
+        Read, hash & compress aren't stages: they run in the upload stage, pulled by the request body in order.
+        They only overlap through the read-ahead threads, the hashing threads & parallel deflate, without queue
+        depth metrics. The in-flight bytes budget bounds the size of the bundles being uploaded, not their memory:
+        only the read buffers have a hard memory cap, see etl.irodsManager.dataObjectReader.ReadBufferBudget.
 
         Returns
         -------
         bool
             If true, all uploads were successful.
         """
-        logger.info(f"{'--':<10}Upload Files")
-        total_uploads = 0
-        validated_uploads = 0
+        manifest = self.irods_client.get_collection_manifest()
+        file_objs = [file_obj for file_obj in manifest if self._is_selected(file_obj)]
+        total_uploads = len(file_objs)
+        file_objs = self._reconcile_journal(file_objs)
+        total_bytes = sum(file_obj.size for file_obj in file_objs)
+        logger.info(
+            f"{'--':<10}Upload Files - {len(file_objs)}/{len(manifest)} files, {total_bytes} bytes"
+            f" - {self.upload_workers} upload worker(s), {self.validate_workers} validate worker(s)"
+        )
+        # The files uploaded by a previous attempt of the export were already validated
+        validated_uploads = total_uploads - len(file_objs)
+        self.status_reporter.start(total_uploads, total_bytes, validated_uploads)
+        uploaded_bytes = 0
+        bundles = 0
+        progress_lock = threading.Lock()
+
+        in_flight_budget = InFlightBudget(self.upload_max_in_flight_bytes)
+
+        def get_bundles():
+            nonlocal bundles
+            for bundle in self._get_bundles(file_objs):
+                in_flight_budget.acquire(sum(file_obj.size for file_obj in bundle))
+                bundles += 1
+                yield bundle
+
+        def upload(bundle):
+            try:
+                return bundle, *self._send_bundle(bundle)
+            except Exception as error:
+                self._report_upload_failure(bundle, error)
+                return bundle, None, None
+
+        def validate(uploaded):
+            nonlocal validated_uploads, uploaded_bytes
+            bundle, checksum_futures, response = uploaded
+            bundle_size = sum(file_obj.size for file_obj in bundle)
+            validated = 0
+            try:
+                if checksum_futures is not None:
+                    validated = self._validate_bundle(bundle, checksum_futures, response)
+            except Exception as error:
+                self._report_upload_failure(bundle, error)
+            finally:
+                in_flight_budget.release(bundle_size)
+
+            with progress_lock:
+                validated_uploads += validated
+                uploaded_bytes += bundle_size
+                self.status_reporter.progress(validated, bundle_size)
+                logger.info(
+                    f"{'--':<10}Upload Files - progress {uploaded_bytes}/{total_bytes} bytes,"
+                    f" {validated_uploads}/{total_uploads} files validated"
+                )
+
+        self.checksum_executor = ThreadPoolExecutor(max_workers=self.checksum_workers, thread_name_prefix="checksum")
+        with self.checksum_executor:
+            ExportPipeline(
+                [
+                    PipelineStage("upload", upload, self.upload_workers),
+                    PipelineStage("validate", validate, self.validate_workers),
+                ]
+            ).run(get_bundles())
+
+        logger.info(f"{'--':<10}Upload Files - {validated_uploads}/{total_uploads} validated in {bundles} uploads")
+        if total_uploads == validated_uploads:
+            return True
+
+        return False
+
+    def _get_bundles(self, file_objs):
+        """
+        Pack the small files into bundles, up to a maximum number of files & total size. A large file is a bundle on
+        its own.
 
-        collection = self.irods_client.collection_object
-        for coll, sub, files in collection.walk():
-            for file_obj in files:
-                min_path = file_obj.path.replace("/nlmumc/projects/", "")
-                if len(self.restrict_list) > 0 and (min_path not in self.restrict_list):
-                    continue
-                total_uploads += 1
+        Parameters
+        ----------
+        file_objs: list[irods.data_object.iRODSDataObject]
+            The files to upload
 
-                logger.info(f"{'--':<15}Start upload file: {file_obj.path}")
+        Yields
+        ------
+        list[irods.data_object.iRODSDataObject]
+            The files of the next bundle
+        """
+        bundle = []
+        bundle_size = 0
+        for file_obj in file_objs:
+            if file_obj.size > self.bundle_file_max_bytes:
+                yield [file_obj]
+                continue
+
+            if bundle and (len(bundle) >= self.bundle_max_files or bundle_size + file_obj.size > self.bundle_max_bytes):
+                yield bundle
+                bundle = []
+                bundle_size = 0
+            bundle.append(file_obj)
+            bundle_size += file_obj.size
+        if bundle:
+            yield bundle
+
+    def _report_upload_failure(self, file_objs, error):
+        error_message = f"Upload {', '.join(file_obj.path for file_obj in file_objs)} failed: {error}"
+        logger.error(f"{'--':<20}{error_message}")
+        self.irods_client.set_error_status(
+            Status.ATTRIBUTE.value, Status.UPLOAD_FAILED.value, self.depositor, self.alias, error_message
+        )
 
-                logger.info(f"{'--':<20}Calculate iRODS file checksum")
-                decoded_checksum = get_irods_data_object_checksum_value(file_obj)
-                logger.debug(f"{'--':<20}File checksum {file_obj.name} - {decoded_checksum}")
+    def _reconcile_journal(self, file_objs) -> list:
+        """
+        Compare the files of the resumed dataset with the journal of the previous attempt of the export.
+        A file is uploaded again if it is missing in the dataset or in the journal, or if its size or checksums
+        changed. A mismatched file is deleted from the dataset first.
+
+        Parameters
+        ----------
+        file_objs: list[irods.data_object.iRODSDataObject]
+            The selected files
 
-                response = self._upload_file(file_obj)
+        Returns
+        -------
+        list[irods.data_object.iRODSDataObject]
+            The files to upload
+        """
+        if not self.dataverse_files:
+            return file_objs
+
+        records = self.journal.get_files()
+        remaining = []
+        for file_obj in file_objs:
+            zip_path = get_zip_file_path(file_obj)
+            record = records.get(file_obj.path)
+            dataverse_file = self.dataverse_files.get(zip_path)
+            if (
+                record is not None
+                and dataverse_file is not None
+                and self._is_resumable(file_obj, record, dataverse_file)
+            ):
+                continue
+
+            if dataverse_file is not None:
+                self._delete_dataverse_file(zip_path, dataverse_file)
+            if record is not None:
+                self.journal.remove_file(file_obj.path)
+            remaining.append(file_obj)
+
+        logger.info(
+            f"{'--':<10}Resume export - {len(file_objs) - len(remaining)}/{len(file_objs)} files already uploaded"
+        )
 
-                validated_checksum = self._validate_buffer_checksum(file_obj.path, decoded_checksum)
-                validated_upload = self._validate_upload_checksum(response)
-                if validated_checksum and validated_upload:
-                    validated_uploads += 1
+        return remaining
 
-        if total_uploads == validated_uploads:
+    @staticmethod
+    def _is_resumable(file_obj, record, dataverse_file) -> bool:
+        """
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+        record: etl.dataverseManager.exportJournal.JournalRecord
+            The journal record of the previous upload
+        dataverse_file: dict
+            The dataverse file json
+
+        Returns
+        -------
+        bool
+            True, if the uploaded file still matches the iRODS data object
+        """
+        if record.size != file_obj.size or record.md5 != dataverse_file["dataFile"].get("md5"):
+            return False
+
+        catalog_checksum = getattr(file_obj, "checksum", None)
+        if catalog_checksum and catalog_checksum.startswith("sha2:"):
+            return decode_irods_checksum(catalog_checksum) == record.sha256
+
+        return True
+
+    def _delete_dataverse_file(self, zip_path, dataverse_file):
+        logger.info(f"{'--':<20}Delete mismatched file from the dataset: {zip_path}")
+        url = f"{self.host}/api/files/{dataverse_file['dataFile']['id']}"
+        try:
+            response = self.http_session.delete(url, headers={"X-Dataverse-key": self.token})
+        except RequestException as error:
+            logger.error(f"{'--':<20}{self.host} cannot be reached. Delete file {zip_path} failed: {error}")
+            return
+
+        if not response.ok:
+            logger.error(f"{'--':<20}Delete file {zip_path} failed: {response.status_code} {response.content}")
+
+    def _is_selected(self, file_obj) -> bool:
+        """
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        bool
+            True, if the file was selected for the upload: no restrict list or the file is in the restrict list
+        """
+        if len(self.restrict_list) == 0:
             return True
 
-        return False
+        min_path = file_obj.path.replace("/nlmumc/projects/", "")
+        return min_path in self.restrict_list
+
+    def _send_bundle(self, file_objs) -> (dict, Response):
+        """
+        Upload a bundle of files in a single request, run by an upload worker:
+            * Get the iRODS data object checksum values: from the catalog, or requested to the iRODS server by the
+              checksum workers, while the bundle is uploaded
+            * Start the bundle upload
+
+        Parameters
+        ----------
+        file_objs: list[irods.data_object.iRODSDataObject]
+
+        Returns
+        -------
+        tuple(dict, Response)
+            The iRODS checksum futures per data object path & the POST http response
+        """
+        checksum_futures = {}
+        for file_obj in file_objs:
+            logger.info(f"{'--':<15}Start upload file: {file_obj.path}")
+            checksum_futures[file_obj.path] = self._get_irods_checksum(file_obj)
+
+        return checksum_futures, self._upload_bundle(file_objs)
+
+    def _validate_bundle(self, file_objs, checksum_futures, response) -> int:
+        """
+        Validate an uploaded bundle, run by a validation worker:
+            * Check the iRODS data object checksum values to the file buffer checksum values
+            * Check the file buffer checksum values against the Dataverse uploaded file checksum values
+
+        The failed files are reported once for the whole bundle. A failed upload isn't validated: it is reported as
+        an upload failure, not as corrupted files.
+
+        Parameters
+        ----------
+        file_objs: list[irods.data_object.iRODSDataObject]
+        checksum_futures: dict
+            The iRODS checksum futures per data object path, see _send_bundle
+        response: Response
+            The POST http response
+
+        Returns
+        -------
+        int
+            The number of validated files.
+        """
+        if response is None:
+            # The failed upload was already reported by _upload_bundle
+            return 0
+        if response.status_code != HTTPStatus.OK.value:
+            logger.error(f"{'--':<30}{response.content.decode('utf-8')}")
+            self._report_upload_failure(file_objs, f"Dataverse response {response.status_code}")
+            return 0
+
+        validated_paths = self._validate_upload_checksum(response)
+        validated_files = 0
+        failed_paths = []
+        for file_obj in file_objs:
+            irods_checksum = checksum_futures[file_obj.path].result()
+            logger.debug(f"{'--':<20}File checksum {file_obj.name} - {irods_checksum}")
+            validated_checksum = self._validate_buffer_checksum(file_obj.path, irods_checksum)
+            validated_upload = get_zip_file_path(file_obj) in validated_paths
+            if not validated_upload:
+                logger.error(f"{'--':<20}File missing or corrupted in the Dataverse upload response: {file_obj.path}")
+            if validated_checksum and validated_upload:
+                validated_files += 1
+                self.journal.record_file(
+                    file_obj.path,
+                    get_zip_file_path(file_obj),
+                    file_obj.size,
+                    irods_checksum,
+                    self.upload_checksums_dict.get(get_zip_file_path(file_obj)),
+                )
+            else:
+                failed_paths.append(file_obj.path)
+
+        # A single report per bundle, whatever the number of corrupted files
+        if failed_paths:
+            error_message = f"Checksum validation failed for {len(failed_paths)} file(s): {', '.join(failed_paths)}"
+            logger.error(f"{'--':<20}{error_message}")
+            self.irods_client.set_error_status(
+                Status.ATTRIBUTE.value, Status.UPLOAD_CORRUPTED.value, self.depositor, self.alias, error_message
+            )
+
+        return validated_files
+
+    def _get_irods_checksum(self, file_obj) -> Future:
+        """
+        Get the iRODS checksum of the data object, according to the checksum verification policy.
+        The sha256 checksum registered in the catalog (fetched with the collection manifest) is used as is, otherwise
+        the checksum is requested to the iRODS server by a checksum worker.
+
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        Future
+            The decoded SHA256 checksum value
+        """
+        recompute = self.checksum_policy.recompute(file_obj)
+        catalog_checksum = getattr(file_obj, "checksum", None)
+        if not recompute and catalog_checksum and catalog_checksum.startswith("sha2:"):
+            future = Future()
+            future.set_result(decode_irods_checksum(catalog_checksum))
+            return future
+
+        logger.info(f"{'--':<20}Calculate iRODS file checksum {file_obj.path} (recompute: {recompute})")
+        return self.checksum_executor.submit(get_irods_data_object_checksum_value, file_obj, recompute)
 
     def _upload_file(self, file_obj) -> Response:
         """
         This method wraps the file object buffer into zip object buffer to "correctly" stream upload the single file.
+        See _upload_bundle.
+
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        Response
+            The POST http response
+        """
+        return self._upload_bundle([file_obj])
+
+    def _upload_bundle(self, file_objs) -> Response:
+        """
+        This method wraps the file objects buffers into a zip object buffer to "correctly" stream upload the files.
+        Dataverse unpacks the uploaded zip, so a single request uploads all the files of the bundle.
 
         Currently, passing the iRODS data object buffer to the repost POST method doesn't correctly stream upload
         the single file to Dataverse. Without using the zip object buffer, the whole file content is loaded into
         the memory.
 
+        The compression policy selects the zip compression method of each file:
+            * stored: the zip buffer size is calculated from the file size without reading the data object,
+              and the body is sent with a Content-Length.
+            * compressed: the zip buffer size is unknown, so the body is sent with chunked transfer encoding.
+        In both cases, the data object is only read once, during the POST request, and the checksums values are
+        added to upload_checksums_dict at the end of that single pass.
+
         Parameters
         ----------
-        file_obj: irods.data_object.iRODSDataObject
+        file_objs: list[irods.data_object.iRODSDataObject]
 
         Returns
         -------
         Response
             The POST http response
         """
-        logger.info(f"{'--':<20}Upload file zipped")
-        logger.debug(f"{'--':<20}Upload file zipped {file_obj.name} - {file_obj.size}")
-
-        file_upload_status = Status.UPLOADING_FILE.value.format(file_obj.name)
-        self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, file_upload_status)
+        logger.info(f"{'--':<20}Upload {len(file_objs)} file(s) zipped")
+        for file_obj in file_objs:
+            logger.debug(f"{'--':<20}Upload file zipped {file_obj.name} - {file_obj.size}")
 
-        zip_buffer_size = calculate_zip_buffer_size(file_obj, self.upload_checksums_dict)
-        logger.debug(f"{'--':<20}Upload size_bundle - {zip_buffer_size}")
-        logger.debug(f"{'--':<20}Upload upload_checksums_dict - {self.upload_checksums_dict[file_obj.path]}")
+        self.status_reporter.uploading(file_objs[0].name)
 
-        zip_iterator = get_zip_iterator(file_obj, self.upload_checksums_dict, zip_buffer_size)
+        compressions = []
+        for file_obj in file_objs:
+            compression = self.compression_policy.decide(file_obj)
+            logger.info(f"{'--':<20}Compression {file_obj.path}: {compression}")
+            compressions.append((compression.compress_type, compression.compress_level))
 
         file_metadata = {
             "restrict": self.restrict,
         }
 
-        multipart_encoder = MultipartEncoder(
-            fields={
-                "jsonData": json.dumps(file_metadata),
-                "file": (self.zip_name, zip_iterator),
-            }
+        # The checksums are calculated into a dictionary per bundle, and then merged under lock after the upload
+        bundle_checksums_dict = {}
+        multipart_stream = get_zip_bundle_multipart_stream(
+            file_objs,
+            bundle_checksums_dict,
+            json.dumps(file_metadata),
+            self.zip_name,
+            compressions,
+            self.profiler,
+            self.read_policy,
+            self.hashing_executor,
+            self.parallel_deflate,
         )
+        logger.debug(f"{'--':<20}Upload size_bundle - {multipart_stream.len}")
+
         response = None
+        upload_start = time.monotonic()
         try:
-            response = requests.post(
+            # The streamed body can't be sent again, so the upload is not idempotent
+            response = self.http_session.post(
                 url=self.dataset_deposit_url,
-                data=multipart_encoder,
+                data=multipart_stream,
                 headers={
-                    "Content-Type": multipart_encoder.content_type,
+                    "Content-Type": multipart_stream.content_type,
                     "X-Dataverse-key": self.token,
                 },
+                timeout=(self.http_session.timeout[0], self.upload_read_timeout),
             )
-        except ProxyError:
-            error_message = self.host + " cannot be reached. Upload data failed"
+        except RequestException as error:
+            error_message = f"{self.host} cannot be reached. Upload data failed: {error}"
             logger.error(f"{'--':<20}{error_message}")
             self.irods_client.set_error_status(
                 Status.ATTRIBUTE.value, Status.UPLOAD_FAILED.value, self.depositor, self.alias, error_message
             )
+        else:
+            UPLOAD_DURATION.labels(get_upload_files_label(len(file_objs))).observe(time.monotonic() - upload_start)
+
+        with self.upload_checksums_lock:
+            self.upload_checksums_dict.update(bundle_checksums_dict)
+        logger.debug(f"{'--':<20}Upload upload_checksums_dict - {bundle_checksums_dict}")
 
         return response
 
     def _validate_buffer_checksum(self, file_path, checksum) -> bool:
         """
-        Check that the http response information (status code & checksum) are valid.
+        Check the file buffer checksum against the iRODS checksum. A failure is only logged, see _validate_bundle.
 
         Parameters
         ----------
@@ -272,21 +748,20 @@ class DataverseClient:
         """
         validated = False
 
-        if self.upload_checksums_dict[file_path] == checksum:
+        # The buffer checksum is missing, if the upload stream was interrupted before the end of the file
+        if self.upload_checksums_dict.get(file_path) == checksum:
             validated = True
             logger.info(f"{'--':<20}iRODS & buffer SHA-256 checksum: validated")
         else:
-            error_message = "iRODS & buffer SHA-256 checksum: failed"
-            logger.error(f"{'--':<20}{error_message}")
-            self.irods_client.set_error_status(
-                Status.ATTRIBUTE.value, Status.UPLOAD_CORRUPTED.value, self.depositor, self.alias, error_message
-            )
+            logger.error(f"{'--':<20}iRODS & buffer SHA-256 checksum: failed for {file_path}")
 
         return validated
 
-    def _validate_upload_checksum(self, response) -> bool:
+    def _validate_upload_checksum(self, response) -> set:
         """
-        Check that the http response information (status code & checksum) are valid.
+        Check that the http response information (status code & checksums) are valid.
+        Every file returned by Dataverse is matched against its MD5 checksum value, in a single pass.
+        A failure is only logged, see _validate_bundle.
 
         Parameters
         ----------
@@ -295,67 +770,81 @@ class DataverseClient:
 
         Returns
         -------
-        bool
-            True, if successful.
+        set
+            The Dataverse relative file paths with a validated checksum.
         """
-        validated = False
+        validated_paths = set()
+
+        if response is None:
+            return validated_paths
 
         if response.status_code != HTTPStatus.OK.value:
             logger.error(f"{'--':<30}{response.content.decode('utf-8')}")
 
-            return validated
+            return validated_paths
 
         for file_json in response.json()["data"]["files"]:
-            # Check if the file is at the root of the collection
-            if "directoryLabel" in file_json:
-                file_path = f"/{file_json['directoryLabel']}/" f"{file_json['dataFile']['filename']}"
-            else:
-                file_path = file_json["dataFile"]["filename"]
-                logger.info(f"{'--':<20}iRODS & Dataverse MD5 checksum: filename")
-
-            # Dataverse rename '.metadata_versions' sub-folder path by removing the '.'
-            # So we need to revert it back to be able to compare the md5 checksums values
-            metadata_version_dataverse = "/metadata_versions/"
-            metadata_version_irods = "/.metadata_versions/"
-            file_path = file_path.replace(metadata_version_dataverse, metadata_version_irods)
+            file_path = self._get_dataverse_file_path(file_json)
             logger.debug(f"{'--':<20}iRODS & Dataverse MD5 checksum: {file_path}")
 
             # index 1 -> md5_hexdigest
-            if file_json["dataFile"]["md5"] == self.upload_checksums_dict[file_path]:
-                validated = True
+            if file_json["dataFile"]["md5"] == self.upload_checksums_dict.get(file_path):
+                validated_paths.add(file_path)
                 logger.info(f"{'--':<20}iRODS & Dataverse MD5 checksum: validated")
             else:
-                error_message = "iRODS & Dataverse MD5 checksum: failed"
-                logger.error(f"{'--':<20}{error_message}")
-                self.irods_client.set_error_status(
-                    Status.ATTRIBUTE.value, Status.UPLOAD_CORRUPTED.value, self.depositor, self.alias, error_message
-                )
+                logger.error(f"{'--':<20}iRODS & Dataverse MD5 checksum: failed for {file_path}")
 
-        return validated
+        return validated_paths
+
+    @staticmethod
+    def _get_dataverse_file_path(file_json) -> str:
+        """
+        Parameters
+        ----------
+        file_json: dict
+            A dataverse file json
+
+        Returns
+        -------
+        str
+            The dataverse relative file path, matching the uploaded zip entry path
+        """
+        # Check if the file is at the root of the collection
+        if "directoryLabel" in file_json:
+            file_path = f"/{file_json['directoryLabel']}/" f"{file_json['dataFile']['filename']}"
+        else:
+            file_path = file_json["dataFile"]["filename"]
+
+        # Dataverse rename '.metadata_versions' sub-folder path by removing the '.'
+        # So we need to revert it back to be able to compare the md5 checksums values
+        metadata_version_dataverse = "/metadata_versions/"
+        metadata_version_irods = "/.metadata_versions/"
+
+        return file_path.replace(metadata_version_dataverse, metadata_version_irods)
 
     def _final_report(self):
         """
         Add the dataset pid to the source iRODS collection as an AVU.
-        Also do the final update to the export status AVU.
+        Also do the final update to the export status AVU. If the exported state was queued as an event with the
+        dataset pid, the status AVU is removed right away. Otherwise, it is left for the frontends polling the AVU
+        to see, for a few seconds.
         """
         logger.info(f"{'--':<10}Report final progress")
-        self.irods_client.add_metadata("externalPID", self.dataset_pid, "Dataverse")
-        self.irods_client.update_metadata_status(Status.ATTRIBUTE.value, Status.EXPORTED.value)
-        time.sleep(5)
+        published = self.irods_client.update_metadata_status_atomic(
+            Status.ATTRIBUTE.value, Status.EXPORTED.value, [("externalPID", self.dataset_pid, "Dataverse")]
+        )
+        if not published:
+            time.sleep(EXPORTED_STATUS_DELAY)
         self.irods_client.remove_metadata(Status.ATTRIBUTE.value, f"Dataverse:{Status.EXPORTED.value}")
         logger.info(f"{'--':<10}Export Done")
 
     def _email_confirmation(self):
         """
-        Send a confirmation email to the depositor at the end of the export.
+        Queue a confirmation email to the depositor in the outbox, at the end of the export.
+        See deliver_email_confirmation.
         """
-        host = os.environ["DH_MAILER_HOST"]
-        user = os.environ["DH_MAILER_USERNAME"]
-        pwd = os.environ["DH_MAILER_PASSWORD"]
         from_address = "datahub@maastrichtuniversity.nl"
 
-        endpoint = "http://" + host + "/email/send"
-
         template_options = {
             "TITLE": self.irods_client.instance.title.title,
             "DESCRIPTION": self.irods_client.instance.description.description,
@@ -380,43 +869,97 @@ class DataverseClient:
                 "to": self.depositor,
             },
         }
-
-        # Post the e-mail confirmation to the user
-        try:
-            resp_user = requests.post(endpoint, json=data_user, auth=(user, pwd))
-        except ProxyError:
-            logger.error(endpoint + " cannot be reached. Send e-mail confirmation failed")
-
-            return
-
-        if resp_user.status_code == HTTPStatus.OK.value:
-            logger.info(f"Reporting e-mail confirmation sent to {self.depositor}")
-        else:
-            logger.error(resp_user.status_code)
-            logger.error(resp_user.content)
+        get_outbox().put(EMAIL_CONFIRMATION, data_user)
 
     def _submit_dataset_for_review(self):
         """
-        Send a request to update the dataset status from 'draft' to 'ask for review'.
+        Queue the request to update the dataset status from 'draft' to 'ask for review' in the outbox.
+        See deliver_review_submission.
         """
         logger.info(f"{'--':<10}Dataset - request review")
+        get_outbox().put(
+            SUBMIT_FOR_REVIEW,
+            {
+                "host": self.host,
+                "dataset_pid": self.dataset_pid,
+                "dataset_url": self.dataset_url,
+                "depositor": self.depositor,
+                "alias": self.alias,
+                "project_id": self.irods_client.project_id,
+                "collection_id": self.irods_client.collection_id,
+            },
+        )
 
-        url = f"{self.host}/api/datasets/:persistentId/submitForReview?persistentId={self.dataset_pid}"
 
-        try:
-            resp = requests.post(
-                url,
-                headers={"Content-type": "application/json", "X-Dataverse-key": self.token},
-            )
-            if resp.status_code == HTTPStatus.OK.value:
-                logger.info(f"Dataset have been submitted for review: {self.dataset_url}")
-            else:
-                logger.error(f"{'--':<20}Create dataset failed")
-                logger.error(resp.status_code)
-                logger.error(resp.content)
-        except ProxyError:
-            error_message = self.host + " cannot be reached. Submit for review failed"
-            logger.error(f"{'--':<20}{error_message}")
-            self.irods_client.set_error_status(
-                Status.ATTRIBUTE.value, Status.REQUEST_REVIEW_FAILED.value, self.depositor, self.alias, error_message
-            )
+@outbox_handler(EMAIL_CONFIRMATION)
+def deliver_email_confirmation(data_user, timeout):
+    """
+    Post the confirmation email to the mailer, run by the outbox dispatcher.
+
+    Parameters
+    ----------
+    data_user: dict
+        The email request, see DataverseClient._email_confirmation
+    timeout: float
+        The request timeout in seconds
+    """
+    host = os.environ["DH_MAILER_HOST"]
+    user = os.environ["DH_MAILER_USERNAME"]
+    pwd = os.environ["DH_MAILER_PASSWORD"]
+
+    endpoint = "http://" + host + "/email/send"
+
+    # Post the e-mail confirmation to the user
+    resp_user = get_http_session().post(endpoint, json=data_user, auth=(user, pwd), timeout=timeout)
+    if resp_user.status_code == HTTPStatus.OK.value:
+        logger.info(f"Reporting e-mail confirmation sent to {data_user['emailOptions']['to']}")
+    elif resp_user.status_code in RETRY_STATUS_CODES:
+        raise DeliveryError(f"{endpoint} failed: {resp_user.status_code}")
+    else:
+        logger.error(resp_user.status_code)
+        logger.error(resp_user.content)
+
+
+def report_review_submission_failure(review, error):
+    """
+    Report the failed review submission to the service desk, once the outbox gave up.
+    The export is already finished, so the exporterState AVU isn't updated anymore.
+    """
+    description = (
+        f"DataVerseNL export towards {review['alias']} failed for collection {review['collection_id']}"
+        f" in project {review['project_id']}"
+    )
+    error_message = f"{Status.REQUEST_REVIEW_FAILED.value}: {review['host']} Submit for review failed: {error}"
+    submit_service_desk_ticket(review["depositor"], description, error_message)
+
+
+@outbox_handler(SUBMIT_FOR_REVIEW, on_failure=report_review_submission_failure)
+def deliver_review_submission(review, timeout):
+    """
+    Send the request to update the dataset status from 'draft' to 'ask for review', run by the outbox dispatcher.
+    The API token isn't stored in the outbox: the request is sent with the DATAVERSE_TOKEN of the worker.
+
+    Parameters
+    ----------
+    review: dict
+        The dataset to submit, see DataverseClient._submit_dataset_for_review
+    timeout: float
+        The request timeout in seconds
+    """
+    url = f"{review['host']}/api/datasets/:persistentId/submitForReview?persistentId={review['dataset_pid']}"
+
+    # Submitting a dataset already in review has no side effect, so it is safe to send the request again
+    resp = get_http_session().post(
+        url,
+        idempotent=True,
+        headers={"Content-type": "application/json", "X-Dataverse-key": os.environ["DATAVERSE_TOKEN"]},
+        timeout=timeout,
+    )
+    if resp.status_code == HTTPStatus.OK.value:
+        logger.info(f"Dataset have been submitted for review: {review['dataset_url']}")
+    elif resp.status_code in RETRY_STATUS_CODES:
+        raise DeliveryError(f"{review['host']} Submit for review failed: {resp.status_code}")
+    else:
+        logger.error(f"{'--':<20}Submit for review failed")
+        logger.error(resp.status_code)
+        logger.error(resp.content)
@@ -1,18 +1,94 @@
 import json
 import logging
-import urllib.request
+import os
+import threading
+
+from etl.dataverseManager.controlledVocabulary import get_controlled_vocabulary
 
 logger = logging.getLogger("iRODS to Dataverse")
 
+TEMPLATE_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "resources", "template.json")
+
+_template = None
+_template_lock = threading.Lock()
+
+
+def preload_metadata_template(path=TEMPLATE_PATH):
+    """
+    Load & validate the dataset template once, at the worker startup.
+    The parsed template is kept private and never modified: each export works on its own copy.
+
+    Parameters
+    ----------
+    path: str
+        The dataset template path
+
+    Raises
+    ------
+    ValueError
+        If the template doesn't have a datasetVersion.metadataBlocks.citation.fields list
+    """
+    global _template
+    with open(path) as f:
+        template = json.load(f)
+
+    try:
+        fields = template["datasetVersion"]["metadataBlocks"]["citation"]["fields"]
+    except (KeyError, TypeError):
+        raise ValueError(f"Invalid dataset template {path}: missing datasetVersion.metadataBlocks.citation.fields")
+    if not isinstance(fields, list):
+        raise ValueError(
+            f"Invalid dataset template {path}: datasetVersion.metadataBlocks.citation.fields is not a list"
+        )
+
+    with _template_lock:
+        _template = template
+    logger.info(f"--\t Dataset template loaded {path}")
+
+
+def new_dataset_json() -> dict:
+    """
+    Get a copy of the preloaded dataset template, the template is loaded on the first call if not preloaded.
+
+    Returns
+    -------
+    dict
+        A structural copy of the dataset template, safe to modify
+    """
+    if _template is None:
+        preload_metadata_template()
+
+    return _copy_json(_template)
+
+
+def _copy_json(value):
+    # The template only holds JSON values: a recursive copy of the containers is much cheaper than copy.deepcopy
+    if isinstance(value, dict):
+        return {key: _copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(item) for item in value]
+    return value
+
 
 class MetadataMapper:
     """Map iRODS metadata to the Open Access Repository metadata format"""
 
-    def __init__(self, depositor, instance):
+    def __init__(self, depositor, instance, vocabulary=None):
+        """
+        Parameters
+        ----------
+        depositor: str
+            The depositor email
+        instance: Instance
+            The collection metadata instance
+        vocabulary: ControlledVocabulary
+            The controlled vocabulary, the process-wide controlled vocabulary if not set
+        """
         self.dataset_json = None
         self.md = None
         self.depositor = depositor
         self.instance = instance
+        self.vocabulary = vocabulary
 
         self.contributor_type_vocabulary = {}
         self.publication_id_type_vocabulary = {}
@@ -21,64 +97,68 @@ class MetadataMapper:
         self.get_controlled_vocabulary()
         logger.info("--\t Map metadata")
 
-        with open("etl/resources/template.json") as f:
-            self.dataset_json = json.load(f)
-
+        self.dataset_json = new_dataset_json()
         self.md = self.dataset_json["datasetVersion"]
 
-        self.add_author(self.instance.creator.full_name)
+        # Apply the whole mapping plan in one pass, the fields are appended in the plan order
+        fields = self.md["metadataBlocks"]["citation"]["fields"]
+        for build_field in self.MAPPING_PLAN:
+            field = build_field(self, up=False)
+            if field is not None:
+                fields.append(field)
 
-        if self.instance.identifier.pid is None:
-            logger.error(f"{'--':<20}PID invalid")
-        else:
-            self.add_alternative_url(self.instance.identifier.pid)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(self.dataset_json, indent=4))
 
-        if self.instance.description.description is None:
-            self.add_description("")
-        else:
-            self.add_description(self.instance.description.description)
+        return self.dataset_json
 
-        self.add_date(self.instance.date.date)
+    def map_author(self, up=True):
+        return self.add_author(self.instance.creator.full_name, up=up)
 
-        self.add_title(self.instance.title.title)
+    def map_alternative_url(self, up=True):
+        if self.instance.identifier.pid is None:
+            logger.error(f"{'--':<20}PID invalid")
+            return None
+        return self.add_alternative_url(self.instance.identifier.pid, up=up)
 
-        self.add_subject()
+    def map_description(self, up=True):
+        if self.instance.description.description is None:
+            return self.add_description("", up=up)
+        return self.add_description(self.instance.description.description, up=up)
 
-        self.add_depositor(self.depositor.split("@")[0])
+    def map_date(self, up=True):
+        return self.add_date(self.instance.date.date, up=up)
 
-        self.map_contacts()
-        self.map_contributors()
-        self.map_keywords()
-        self.map_publications()
-        self.map_resource_type()
+    def map_title(self, up=True):
+        return self.add_title(self.instance.title.title, up=up)
 
-        self.dataset_json["datasetVersion"] = self.md
-        logger.debug(json.dumps(self.dataset_json, indent=4))
+    def map_subject(self, up=True):
+        return self.add_subject(up=up)
 
-        return self.dataset_json
+    def map_depositor(self, up=True):
+        return self.add_depositor(self.depositor.split("@")[0], up=up)
 
     def update_fields(self, new):
         fields = self.md["metadataBlocks"]["citation"]["fields"]
         fields.append(new)
 
-    def map_contacts(self):
+    def map_contacts(self, up=True):
         contacts = []
         for contact in self.instance.contacts.contacts:
             contacts.append(self.add_contact(contact.full_name, contact.email, contact.affiliation.label))
-        self.add_contacts(contacts)
+        return self.add_contacts(contacts, up)
 
-    def map_contributors(self):
+    def map_contributors(self, up=True):
         contributors = []
+        contributor_type_vocabulary = self.contributor_type_vocabulary
         for contributor in self.instance.contributors.contributors:
             # Map contributor_type to Dataverse controlled vocabulary for contributor type
-            contributor_type = ""
-            if contributor.type.label in self.contributor_type_vocabulary:
-                contributor_type = self.contributor_type_vocabulary[contributor.type.label]
+            contributor_type = contributor_type_vocabulary.get(contributor.type.label, "")
 
             contributors.append(self.add_contributor(contributor.full_name, contributor_type))
-        self.add_contributors(contributors)
+        return self.add_contributors(contributors, up)
 
-    def map_keywords(self):
+    def map_keywords(self, up=True):
         keywords = []
         for subject in self.instance.subjects.subjects:
             # Case where a subject has no free-text or ontology value
@@ -89,10 +169,11 @@ class MetadataMapper:
             else:
                 keyword = self.add_keyword(subject.keyword, "", "")
             keywords.append(keyword)
-        self.add_keywords(keywords)
+        return self.add_keywords(keywords, up)
 
-    def map_publications(self):
+    def map_publications(self, up=True):
         publications = []
+        publication_id_type_vocabulary = self.publication_id_type_vocabulary
         for resource in self.instance.related_resources.related_resources:
             # Case where a related_resource has no identifier
             if resource.identifier is None:
@@ -106,16 +187,31 @@ class MetadataMapper:
                 value = value.rsplit("/", 1)[1]
 
             # Map publication_id_type to Dataverse controlled vocabulary for publication id type
-            publication_id_type = ""
-            if resource.identifier_type.label.lower() in self.publication_id_type_vocabulary:
-                publication_id_type = self.publication_id_type_vocabulary[resource.identifier_type.label.lower()]
+            publication_id_type = publication_id_type_vocabulary.get(resource.identifier_type.label.lower(), "")
 
             publications.append(self.add_publication(value, publication_id_type, url))
-        self.add_publications(publications)
+        return self.add_publications(publications, up)
 
-    def map_resource_type(self):
+    def map_resource_type(self, up=True):
         if self.instance.resource_type.type_detail is not None:
-            self.add_kind_of_data([self.instance.resource_type.type_detail])
+            return self.add_kind_of_data([self.instance.resource_type.type_detail], up)
+        return None
+
+    # Compiled mapping plan: the field builders applied by read_metadata, in the order of the dataset fields
+    MAPPING_PLAN = (
+        map_author,
+        map_alternative_url,
+        map_description,
+        map_date,
+        map_title,
+        map_subject,
+        map_depositor,
+        map_contacts,
+        map_contributors,
+        map_keywords,
+        map_publications,
+        map_resource_type,
+    )
 
     def add_author(self, author, affiliation="", up=True):
         new = {
@@ -325,17 +421,7 @@ class MetadataMapper:
         return new
 
     def get_controlled_vocabulary(self):
-        schema_url = (
-            "https://raw.githubusercontent.com/IQSS/dataverse/develop/scripts/api/data/metadatablocks/citation.tsv"
-        )
-        with urllib.request.urlopen(schema_url) as url:
-            controlled_vocabulary = url.readlines()
-
-        for line in controlled_vocabulary:
-            decoded_line = line.decode()
-            if "publicationIDType" in decoded_line:
-                value = decoded_line.split("\t")[2]
-                self.publication_id_type_vocabulary[value.lower()] = value
-            elif "contributorType" in decoded_line:
-                value = decoded_line.split("\t")[2]
-                self.contributor_type_vocabulary[value.lower()] = value
+        # The parsed vocabulary is shared across the exports, and never waits for the remote citation.tsv
+        vocabulary = self.vocabulary or get_controlled_vocabulary()
+        self.publication_id_type_vocabulary = vocabulary.publication_id_type
+        self.contributor_type_vocabulary = vocabulary.contributor_type
@@ -0,0 +1,122 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class JournalRecord:
+    """A file uploaded & validated by a previous attempt of the export"""
+
+    __slots__ = ("irods_path", "zip_path", "size", "sha256", "md5")
+
+    def __init__(self, irods_path, zip_path, size, sha256, md5):
+        self.irods_path = irods_path
+        self.zip_path = zip_path
+        self.size = size
+        self.sha256 = sha256
+        self.md5 = md5
+
+
+class ExportJournal:
+    """
+    Durable journal of an export, stored in a local SQLite file per collection & Dataverse alias.
+
+    It records the created dataset PID and each uploaded file with its verified checksums, so an export that
+    died half-way resumes in the same dataset and only uploads the missing files. The journal is removed once the
+    export is done.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            The SQLite journal file path
+        """
+        self.path = path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The upload workers record the files: a single connection, serialized by a lock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS export (name TEXT PRIMARY KEY, value TEXT)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "irods_path TEXT PRIMARY KEY, zip_path TEXT, size INTEGER, sha256 TEXT, md5 TEXT)"
+            )
+
+    @classmethod
+    def open(cls, project_id, collection_id, alias):
+        """
+        Open the journal of the collection export, configured with the environment variable:
+            * EXPORT_JOURNAL_DIR: the directory of the journal files (default /var/lib/exporter/export-journal),
+              on a volume that outlives the container, so a requeued export resumes after a restart
+
+        Parameters
+        ----------
+        project_id: str
+        collection_id: str
+        alias: str
+            The Dataverse alias of the export
+
+        Returns
+        -------
+        ExportJournal
+            The export journal, empty for a new export
+        """
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", f"{project_id}_{collection_id}_{alias}")
+        return cls(
+            os.path.join(os.environ.get("EXPORT_JOURNAL_DIR", "/var/lib/exporter/export-journal"), f"{name}.sqlite")
+        )
+
+    def get_dataset_pid(self):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM export WHERE name = 'dataset_pid'").fetchone()
+
+        return row[0] if row else None
+
+    def set_dataset_pid(self, dataset_pid):
+        with self._lock:
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("REPLACE INTO export (name, value) VALUES ('dataset_pid', ?)", (dataset_pid,))
+
+    def get_files(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            irods path => JournalRecord
+        """
+        with self._lock:
+            rows = self._connection.execute("SELECT irods_path, zip_path, size, sha256, md5 FROM files").fetchall()
+
+        return {row[0]: JournalRecord(*row) for row in rows}
+
+    def record_file(self, irods_path, zip_path, size, sha256, md5):
+        with self._lock:
+            self._connection.execute(
+                "REPLACE INTO files (irods_path, zip_path, size, sha256, md5) VALUES (?, ?, ?, ?, ?)",
+                (irods_path, zip_path, size, sha256, md5),
+            )
+
+    def remove_file(self, irods_path):
+        with self._lock:
+            self._connection.execute("DELETE FROM files WHERE irods_path = ?", (irods_path,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def delete(self):
+        """Close & remove the journal, once the export is done"""
+        self.close()
+        for path in (self.path, f"{self.path}-wal", f"{self.path}-shm"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        logger.info(f"--\t Export journal removed {self.path}")
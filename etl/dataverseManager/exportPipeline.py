@@ -0,0 +1,124 @@
+import logging
+import queue
+import threading
+
+from etl.metricsManager.exporterMetrics import PIPELINE_BUSY_WORKERS, PIPELINE_QUEUE_DEPTH
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# Queue item that stops a stage worker
+_STOP = object()
+
+
+class PipelineStage:
+    """
+    A stage of the export pipeline: worker threads handling the items of a bounded input queue, and passing their
+    results on to the next stage.
+
+    A full input queue blocks the previous stage, so the slowest stage sets the pipeline throughput, and the number
+    of items waiting between two stages is bounded.
+    """
+
+    def __init__(self, name, handler, workers=1, queue_size=None):
+        """
+        Parameters
+        ----------
+        name: str
+            The stage name, the metrics label
+        handler: Callable
+            Handle an item, and return the item passed on to the next stage. It must handle its own errors.
+        workers: int
+            The number of worker threads
+        queue_size: int
+            The maximum number of items waiting for a worker, 2 * workers by default
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size or 2 * workers)
+        self.next_stage = None
+        self._threads = []
+
+    def start(self):
+        self._threads = [
+            threading.Thread(target=self._work, name=f"{self.name}-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, item):
+        """
+        Queue an item, blocking while the queue is full.
+
+        Parameters
+        ----------
+        item:
+            The item to handle
+        """
+        self.queue.put(item)
+        PIPELINE_QUEUE_DEPTH.labels(self.name).inc()
+
+    def stop(self):
+        """Wait for the queued items to be handled, and stop the workers"""
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            PIPELINE_QUEUE_DEPTH.labels(self.name).dec()
+
+            PIPELINE_BUSY_WORKERS.labels(self.name).inc()
+            try:
+                result = self.handler(item)
+            except Exception as error:
+                # The handlers report their own errors, the item is dropped so the pipeline keeps running
+                logger.error(f"{'--':<20}Export pipeline {self.name} stage failed: {error}")
+                continue
+            finally:
+                PIPELINE_BUSY_WORKERS.labels(self.name).dec()
+
+            if self.next_stage is not None:
+                self.next_stage.put(result)
+
+
+class ExportPipeline:
+    """
+    Chain of stages connected by bounded queues. The items are produced by the calling thread, and flow through the
+    stages in order. The export uploads run the upload & validate stages, see DataverseClient._upload_files.
+    """
+
+    def __init__(self, stages):
+        """
+        Parameters
+        ----------
+        stages: list[PipelineStage]
+            The stages, in order
+        """
+        self.stages = stages
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.next_stage = next_stage
+
+    def run(self, items):
+        """
+        Feed the items to the first stage, and wait until every item went through the last stage.
+
+        Parameters
+        ----------
+        items: Iterable
+            The items produced by the calling thread, blocked while the first stage queue is full
+        """
+        for stage in self.stages:
+            stage.start()
+        try:
+            for item in items:
+                self.stages[0].put(item)
+        finally:
+            # A stage is stopped once the previous stage has passed on all its items
+            for stage in self.stages:
+                stage.stop()
@@ -4,6 +4,7 @@ import sys
 
 from etl.dataverseManager.dataverseClient import DataverseClient
 from etl.dataverseManager.dataverseMetadataMapper import MetadataMapper
+from etl.httpManager.httpSession import get_http_session
 
 logger = logging.getLogger("iRODS to Dataverse")
 
@@ -25,6 +26,7 @@ class DataverseExporter:
 
     def init_export(self, irods_client, data):
         self.irods_client = irods_client
+        discard_session = False
         try:
             self.do_export(
                 data["dataverse_alias"],
@@ -38,8 +40,12 @@ class DataverseExporter:
             print("Unexpected error:", sys.exc_info()[0])
             # Remove all temporary progress export AVU
             self.irods_client.status_cleanup(self.repository)
+            # The iRODS session may be broken: don't reuse it
+            discard_session = True
             # Still raise the error
             raise
+        finally:
+            self.irods_client.release(discard_session)
 
     def do_export(self, alias, depositor, restrict=False, data_export=False, restrict_list=""):
         # Metadata
@@ -52,12 +58,16 @@ class DataverseExporter:
         self.exporter_client = DataverseClient(
             os.environ["DATAVERSE_HOST"], os.environ["DATAVERSE_TOKEN"], alias, self.irods_client, depositor
         )
-        self.exporter_client.create_dataset(md, data_export)
-        if data_export:
-            self.exporter_client.export_files(restrict, restrict_list)
+        try:
+            self.exporter_client.create_dataset(md, data_export)
+            if data_export:
+                self.exporter_client.export_files(restrict, restrict_list)
+        finally:
+            self.exporter_client.close()
 
         # Cleanup
         self.irods_client.rule_manager.close_project_collection(
             self.irods_client.project_id, self.irods_client.collection_id
         )
-        self.irods_client.session.cleanup()
+
+        logger.info(f"HTTP pool statistics: {get_http_session().get_pool_statistics()}")
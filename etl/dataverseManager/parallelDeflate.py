@@ -0,0 +1,271 @@
+import functools
+import logging
+import os
+import threading
+import zipfile
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from etl.metricsManager.exportProfiler import COMPRESS, DisabledExportProfiler
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# Size of the deflate window: the history a block is primed with
+DEFLATE_WINDOW_SIZE = 32 * 1024
+CRC32_POLYNOMIAL = 0xEDB88320
+
+
+def _gf2_matrix_times(matrix, vector) -> int:
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+
+    return total
+
+
+def _gf2_matrix_square(matrix) -> list:
+    return [_gf2_matrix_times(matrix, matrix[index]) for index in range(32)]
+
+
+@functools.lru_cache(maxsize=64)
+def _gf2_zeros_operator(length) -> tuple:
+    """GF(2) matrix appending length zero bytes to a CRC-32, cached: the blocks of an export share the same length"""
+    # Operator for one zero bit, squared 3 times for one zero byte
+    operator = [CRC32_POLYNOMIAL] + [1 << index for index in range(31)]
+    for _ in range(3):
+        operator = _gf2_matrix_square(operator)
+
+    result = None
+    while length:
+        if length & 1:
+            result = operator if result is None else [_gf2_matrix_times(operator, column) for column in result]
+        length >>= 1
+        if length:
+            operator = _gf2_matrix_square(operator)
+
+    return tuple(result)
+
+
+def crc32_combine(crc1, crc2, length2) -> int:
+    """
+    Combine the CRC-32 of two consecutive blocks, like zlib crc32_combine (not exposed by the python zlib module).
+
+    Parameters
+    ----------
+    crc1: int
+        The CRC-32 of the first block
+    crc2: int
+        The CRC-32 of the second block
+    length2: int
+        The length in bytes of the second block
+
+    Returns
+    -------
+    int
+        The CRC-32 of the two blocks concatenated
+    """
+    if length2 <= 0:
+        return crc1
+
+    return _gf2_matrix_times(_gf2_zeros_operator(length2), crc1) ^ crc2
+
+
+def compress_block(block, history, compress_level) -> (bytes, int):
+    """
+    Compress a block as a byte-aligned, non-final, part of a raw deflate stream.
+
+    Parameters
+    ----------
+    block: bytes
+        The uncompressed block
+    history: bytes
+        The end of the previous block, to prime the compressor with, b'' for the first block
+    compress_level: int
+        The deflate compression level
+
+    Returns
+    -------
+    tuple(bytes, int)
+        The compressed block & the CRC-32 of the uncompressed block
+    """
+    if history:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=history)
+    else:
+        compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -zlib.MAX_WBITS)
+
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH), zlib.crc32(block)
+
+
+class ParallelDeflateWriter:
+    """
+    Compress a deflated zip entry as independent blocks on a thread pool, like pigz, and write them in order.
+
+    Each block is compressed by its own raw deflate stream, primed with the last 32 KB of the previous block, and ends
+    with a sync flush: the compressed blocks are byte-aligned, so their concatenation is a valid deflate stream. When
+    the zip entry is closed, its own compressor, which never got any data, ends the stream with an empty final block.
+    The CRC-32 of each block is calculated along its compression, and combined in order with crc32_combine.
+
+    At most window blocks are compressed at the same time, so the memory is bounded to window input & output blocks.
+    """
+
+    def __init__(self, dest, executor, compress_level=None, window=4, profiler=None, file_path=None):
+        """
+        Parameters
+        ----------
+        dest: zipfile._ZipWriteFile
+            The opened deflated zip entry, written to directly
+        executor: ThreadPoolExecutor
+            The compression threads
+        compress_level: int
+            The deflate compression level, None for the default level
+        window: int
+            The maximum number of blocks being compressed
+        profiler: ExportProfiler
+            Records the time spent compressing, None to disable the profiling
+        file_path: str
+            The compressed file path, for the profiler
+        """
+        self.dest = dest
+        self.executor = executor
+        self.compress_level = zlib.Z_DEFAULT_COMPRESSION if compress_level is None else compress_level
+        self.window = window
+        self.profiler = profiler or DisabledExportProfiler()
+        self.file_path = file_path
+        self._history = b""
+        self._pending = deque()
+
+    def write(self, block):
+        """
+        Submit the compression of the next block, and write the oldest compressed block if the window is full.
+
+        Parameters
+        ----------
+        block: bytes
+            The next uncompressed block
+        """
+        if not block:
+            return
+        self._pending.append(
+            (self.executor.submit(self._compress, block, self._history, self.compress_level), len(block))
+        )
+        self._history = block[-DEFLATE_WINDOW_SIZE:]
+        if len(self._pending) >= self.window:
+            self._write_oldest()
+
+    def flush(self):
+        """
+        Write the blocks still being compressed, in order.
+
+        Yields
+        ------
+        When a compressed block is written
+        """
+        while self._pending:
+            self._write_oldest()
+            yield
+
+    def _compress(self, block, history, compress_level) -> (bytes, int):
+        self.profiler.set_current_file(self.file_path)
+        with self.profiler.span(COMPRESS):
+            return compress_block(block, history, compress_level)
+
+    def _write_oldest(self):
+        future, size = self._pending.popleft()
+        compressed, crc = future.result()
+        # Same accounting as zipfile._ZipWriteFile.write, with the data compressed beforehand
+        self.dest._fileobj.write(compressed)
+        self.dest._compress_size += len(compressed)
+        self.dest._file_size += size
+        self.dest._crc = crc32_combine(self.dest._crc, crc, size)
+
+
+class ParallelDeflate:
+    """Select the zip entries compressed by blocks on the shared compression threads"""
+
+    def __init__(self, executor, min_size, window):
+        """
+        Parameters
+        ----------
+        executor: ThreadPoolExecutor
+            The shared compression threads
+        min_size: int
+            The minimum file size in bytes to compress by blocks
+        window: int
+            The maximum number of blocks of a file being compressed at the same time
+        """
+        self.executor = executor
+        self.min_size = min_size
+        self.window = window
+
+    def applies(self, file_obj, compress_type, compress_level=None) -> bool:
+        """
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+        compress_type: int
+            The zipfile compression method constant of the zip entry
+        compress_level: int
+            The compression level of the zip entry: level 0 only copies the data, it isn't worth the threads
+
+        Returns
+        -------
+        bool
+            True, if the zip entry is compressed by blocks
+        """
+        return compress_type == zipfile.ZIP_DEFLATED and compress_level != 0 and file_obj.size >= self.min_size
+
+    def writer(self, dest, compress_level=None, profiler=None, file_path=None) -> ParallelDeflateWriter:
+        """
+        Parameters
+        ----------
+        dest: zipfile._ZipWriteFile
+            The opened deflated zip entry
+        compress_level: int
+            The deflate compression level, None for the default level
+        profiler: ExportProfiler
+            Records the time spent compressing, None to disable the profiling
+        file_path: str
+            The compressed file path, for the profiler
+
+        Returns
+        -------
+        ParallelDeflateWriter
+            The block writer of the zip entry
+        """
+        return ParallelDeflateWriter(dest, self.executor, compress_level, self.window, profiler, file_path)
+
+
+_parallel_deflate = None
+_parallel_deflate_lock = threading.Lock()
+
+
+def get_parallel_deflate():
+    """
+    Get the process-wide parallel deflate, configured with the environment variables:
+        * EXPORT_PARALLEL_DEFLATE_WORKERS: the number of compression threads, 0 (default) to disable
+        * EXPORT_PARALLEL_DEFLATE_MIN_SIZE: the minimum file size in bytes to compress by blocks (default 256 MB)
+
+    Returns
+    -------
+    ParallelDeflate
+        The shared parallel deflate, None if disabled
+    """
+    global _parallel_deflate
+    with _parallel_deflate_lock:
+        if _parallel_deflate is None:
+            workers = int(os.environ.get("EXPORT_PARALLEL_DEFLATE_WORKERS", 0))
+            if workers <= 0:
+                return None
+            _parallel_deflate = ParallelDeflate(
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deflate"),
+                int(os.environ.get("EXPORT_PARALLEL_DEFLATE_MIN_SIZE", 256 * 1024**2)),
+                2 * workers,
+            )
+            logger.info(f"Parallel deflate: {workers} threads")
+
+    return _parallel_deflate
@@ -1,154 +1,392 @@
 import hashlib
 import io
+import os
 import re
+import struct
+import threading
+import uuid
 import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import RawIOBase
 from typing import Generator
 
-from requests.utils import super_len
-from requests_toolbelt.multipart.encoder import CustomBytesIO, encode_with
+from urllib3.fields import RequestField
+
+from etl.irodsManager.dataObjectReader import ReadPolicy
+from etl.metricsManager.exportProfiler import COMPRESS, IRODS_READ, MD5, NETWORK, SHA256, DisabledExportProfiler
+from etl.metricsManager.exporterMetrics import COMPRESSION_RATIO, DATAVERSE_SENT_BYTES, IRODS_READ_BYTES
 
 BLOCK_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
+# Smaller chunks are hashed in the calling thread: the hand-over to the hashing threads would cost more
+PARALLEL_HASHING_MIN_SIZE = 1024 * 1024
+# General purpose bit flag 3: CRC & sizes are written in a data descriptor after the file data
+ZIP_DATA_DESCRIPTOR_FLAG = 0x08
 
 
-class IteratorAsBinaryFile(object):
-    """Custom bundle iterator for streaming.
-    <requests_toolbelt.streaming_iterator>
+class ChunkBuffer(RawIOBase):
     """
+    Zero-copy raw buffer for streaming.
 
-    def __init__(self, size, iterator, encoding="utf-8"):
-        # The expected size of the upload
-        self.size = int(size)
-        if self.size < 0:
-            raise ValueError("The size of the upload must be a positive integer")
-
-        # Attribute that requests will check to determine the length of the
-        # body. See bug #80 for more details
-        self.len = self.size
-        # The iterator used to generate the upload data
-        self.iterator = iterator
-
-        # Encoding the iterator is using
-        self.encoding = encoding
-
-        # The buffer we use to provide the correct number of bytes requested
-        # during a read
-        self._buffer = CustomBytesIO()
+    The written chunks are stored in a deque, without concatenating them.
+    Immutable chunks (bytes) are only referenced. Mutable chunks (bytearray, writable memoryview) are copied once,
+    because the writer may re-use its buffer after the write. A partially read chunk is kept as a memoryview slice.
 
-    def _get_bytes(self):
-        try:
-            return encode_with(next(self.iterator), self.encoding)
-        except StopIteration:
-            return b""
+    The get_chunks() method pops the available chunks, to hand them to the HTTP layer without intermediate copies
+    and to free up the memory. The readinto() method supports the file-like consumers.
+    """
 
-    def _load_bytes(self, size):
-        self._buffer.smart_truncate()
-        amount_to_load = size - super_len(self._buffer)
-        bytes_to_append = True
+    def __init__(self):
+        self._chunks = deque()
+        self._size = 0
+        # Number of bytes copied by the buffer itself, for benchmarking
+        self.bytes_copied = 0
 
-        while amount_to_load > 0 and bytes_to_append:
-            bytes_to_append = self._get_bytes()
-            amount_to_load -= self._buffer.append(bytes_to_append)
+    def __len__(self):
+        return self._size
 
-    def read(self, size=-1):
-        size = int(size)
-        if size == -1:
-            return b"".join(self.iterator)
+    def writable(self):
+        return True
 
-        self._load_bytes(size)
-        s = self._buffer.read(size)
-        if not s:
-            self.len = 0
+    def readable(self):
+        return True
 
-        if size < 0:
-            self.len = 0
+    def write(self, b):
+        if self.closed:
+            raise ValueError("Stream was closed!")
+        if not isinstance(b, bytes):
+            b = bytes(b)
+            self.bytes_copied += len(b)
+        size = len(b)
+        if size > 0:
+            self._chunks.append(b)
+            self._size += size
+        return size
+
+    def readinto(self, b):
+        target = memoryview(b).cast("B")
+        written = 0
+        while self._chunks and written < len(target):
+            chunk = memoryview(self._chunks[0])
+            amount = min(len(chunk), len(target) - written)
+            target[written : written + amount] = chunk[:amount]
+            if amount == len(chunk):
+                self._chunks.popleft()
+            else:
+                self._chunks[0] = chunk[amount:]
+            written += amount
+        self._size -= written
+        self.bytes_copied += written
+        return written
+
+    def get_chunks(self) -> Generator[bytes, None, None]:
+        """
+        Pop all the available chunks.
+
+        Yields
+        ------
+        bytes
+            The chunk, in the written order
+        """
+        while self._chunks:
+            chunk = self._chunks.popleft()
+            self._size -= len(chunk)
+            if isinstance(chunk, memoryview):
+                # The HTTP layer only accepts bytes for chunked transfer encoding
+                chunk = chunk.tobytes()
+                self.bytes_copied += len(chunk)
+            yield chunk
+
+
+class MultipartZipStream:
+    """
+    Iterable multipart/form-data body with a 'jsonData' field and a 'file' field, for streaming.
 
-        return s
+    requests sends an iterable body chunk by chunk, without copying it into an intermediate buffer:
+        * with a Content-Length, if the zip size is known
+        * with chunked transfer encoding, if the zip size is unknown (len is None)
+    """
 
+    def __init__(self, json_data, zip_name, zip_chunks_generator, zip_size=None, profiler=None):
+        """
+        Parameters
+        ----------
+        json_data: str
+            The 'jsonData' field value
+        zip_name: str
+            The 'file' field file name
+        zip_chunks_generator: Generator
+            upload_zip_generator
+        zip_size: int
+            The total size of the zip buffer, None if unknown
+        profiler: ExportProfiler
+            Records the time spent sending the chunks, None to disable the profiling
+        """
+        self.profiler = profiler or DisabledExportProfiler()
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self.zip_chunks_generator = zip_chunks_generator
+
+        encoded_boundary = f"--{self.boundary}\r\n".encode()
+        json_field = RequestField(name="jsonData", data=json_data)
+        json_field.make_multipart()
+        file_field = RequestField(name="file", data=b"", filename=zip_name)
+        file_field.make_multipart(content_type="application/zip")
+
+        self.header = (
+            encoded_boundary
+            + json_field.render_headers().encode()
+            + json_data.encode()
+            + b"\r\n"
+            + encoded_boundary
+            + file_field.render_headers().encode()
+        )
+        self.trailer = f"\r\n--{self.boundary}--\r\n".encode()
+
+        # Attribute that requests will check to determine the length of the body
+        self.len = None
+        if zip_size is not None:
+            self.len = len(self.header) + zip_size + len(self.trailer)
+
+    def __iter__(self):
+        yield self.header
+        try:
+            for chunk in self.zip_chunks_generator:
+                DATAVERSE_SENT_BYTES.inc(len(chunk))
+                # The generator is resumed once requests has sent the chunk
+                with self.profiler.span(NETWORK):
+                    yield chunk
+        finally:
+            # Close the data objects right away if the upload is interrupted
+            self.zip_chunks_generator.close()
+        yield self.trailer
+
+
+class InFlightBudget:
+    """
+    Bound the total size of the files being uploaded at the same time. It's not a memory cap: the files are
+    streamed, their size isn't held in memory.
 
-class UnseekableStream(RawIOBase):
+    A file bigger than the whole budget is still accepted, once no other file is in flight.
     """
-    Custom raw buffer for streaming.
-    The get() method return the available chunk and clean-up/re-initialize the buffer to free up the memory.
+
+    def __init__(self, max_bytes):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            The maximum total size in bytes of the files in flight
+        """
+        self.max_bytes = max_bytes
+        self.in_flight_bytes = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        """
+        Block until the file size fits in the remaining budget.
+
+        Parameters
+        ----------
+        size: int
+            The file size in bytes
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight_bytes == 0 or self.in_flight_bytes + size <= self.max_bytes)
+            self.in_flight_bytes += size
+
+    def release(self, size):
+        """
+        Give back the file size to the budget, once the file upload is done.
+
+        Parameters
+        ----------
+        size: int
+            The file size in bytes
+        """
+        with self._condition:
+            self.in_flight_bytes -= size
+            self._condition.notify_all()
+
+
+class ChunkHasher:
     """
+    Calculate the SHA256 & MD5 checksums of a file, chunk by chunk.
 
-    def __init__(self):
-        self._buffer = b""
+    With an executor, each hash is updated on a hashing thread, while the zip generator compresses the chunk and
+    requests sends it: hashlib & zlib release the GIL, so the hashes and the compression run in parallel. A hash is
+    only updated by one thread at a time, in the chunks order: the next update waits for the previous one.
+    The small chunks are hashed in the calling thread.
+    """
 
-    def writable(self):
-        return True
+    def __init__(self, executor=None, profiler=None, file_path=None):
+        """
+        Parameters
+        ----------
+        executor: ThreadPoolExecutor
+            The hashing threads, None to hash in the calling thread
+        profiler: ExportProfiler
+            Records the time spent hashing, None to disable the profiling
+        file_path: str
+            The hashed file path, for the profiler
+        """
+        self.executor = executor
+        self.profiler = profiler or DisabledExportProfiler()
+        self.file_path = file_path
+        self.sha = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self._futures = ()
+
+    def update(self, chunk):
+        """
+        Parameters
+        ----------
+        chunk: bytes
+            The next chunk of the file, it must not be modified afterwards
+        """
+        if self.executor is None or len(chunk) < PARALLEL_HASHING_MIN_SIZE:
+            self._wait()
+            self._update(self.sha, SHA256, chunk)
+            self._update(self.md5, MD5, chunk)
+            return
+
+        self._wait()
+        self._futures = (
+            self.executor.submit(self._update, self.sha, SHA256, chunk),
+            self.executor.submit(self._update, self.md5, MD5, chunk),
+        )
+
+    def hexdigests(self) -> (str, str):
+        """
+        Returns
+        -------
+        tuple(str, str)
+            The SHA256 & MD5 checksums values, once all the chunks are hashed
+        """
+        self._wait()
+        return self.sha.hexdigest(), self.md5.hexdigest()
+
+    def _update(self, hash_object, stage, chunk):
+        self.profiler.set_current_file(self.file_path)
+        with self.profiler.span(stage):
+            hash_object.update(chunk)
+
+    def _wait(self):
+        for future in self._futures:
+            future.result()
+        self._futures = ()
+
+
+_hashing_executor = None
+_hashing_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    """
+    Get the process-wide hashing threads, configured with the environment variable:
+        * EXPORT_HASHING_WORKERS: the number of hashing threads, by default 2 per upload worker
+          (EXPORT_CONCURRENCY * EXPORT_UPLOAD_WORKERS). 0 to hash the chunks in the zip generator thread.
 
-    def write(self, b):
-        if self.closed:
-            raise ValueError("Stream was closed!")
-        self._buffer += b
-        return len(b)
+    Returns
+    -------
+    ThreadPoolExecutor
+        The shared hashing threads, None if disabled
+    """
+    global _hashing_executor
+    with _hashing_executor_lock:
+        if _hashing_executor is None:
+            upload_workers = int(os.environ.get("EXPORT_CONCURRENCY", 1)) * int(
+                os.environ.get("EXPORT_UPLOAD_WORKERS", 1)
+            )
+            workers = int(os.environ.get("EXPORT_HASHING_WORKERS", 2 * upload_workers))
+            if workers <= 0:
+                return None
+            _hashing_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="hashing")
 
-    def get(self):
-        chunk = self._buffer
-        self._buffer = b""
-        return chunk
+    return _hashing_executor
 
 
-def get_zip_buffer_size(zip_generator, stream_buffer) -> int:
+def upload_zip_generator(zip_generator, stream_buffer) -> Generator[bytes, None, None]:
     """
-    Exhaust the zip generator to calculate the zip buffer size.
-    The buffer size is required to correctly stream upload the zip file.
+    Yield the zip generator chunks from a ChunkBuffer to correctly stream upload the zip file.
 
     Parameters
     ----------
     zip_generator: Generator
         create_zip_buffer_generator
-    stream_buffer: UnseekableStream
+    stream_buffer: ChunkBuffer
         The upload buffer
 
+    Yields
+    ------
+    bytes
+        The zip buffer chunk
+    """
+    for _ in zip_generator:
+        yield from stream_buffer.get_chunks()
+
+
+def get_zip_file_path(file_obj) -> str:
+    """
+    Build the relative path of the file inside the zip archive, based on the iRODS data object path.
+
+    Parameters
+    ----------
+    file_obj: irods.data_object.iRODSDataObject
+
     Returns
     -------
-    int
-        The zip buffer size
+    str
+        The zip entry path, which is also the Dataverse relative file path
     """
-    try:
-        zip_buffer_size = 0
-        for i in zip_generator:
-            stream_chunk = stream_buffer.get()
-            if len(stream_chunk) > 0:
-                zip_buffer_size += len(stream_chunk)
-        return zip_buffer_size
-    except StopIteration:
-        return 0
-
-
-def upload_zip_generator(zip_generator, stream_buffer) -> bytes:
+    # Remove iRODS project collection path
+    zip_file_path = re.sub(r"/nlmumc/projects/P[0-9]{9}/C[0-9]{9}", "", file_obj.collection.path)
+    #  Replace specials characters ( ) [ ] { } $ % & - + @ ~ ' € ! ^
+    zip_file_path = re.sub(r"[\\\(\)\[\]\{\}\$\%\&\+@~'€!\^]", "_", zip_file_path)
+    # Replace specials characters /: * ? " < > | ; #
+    zip_file_path = re.sub(r"[\\:\*\?\"<>\|;#]", "_", zip_file_path)
+    zip_file_name = re.sub(r"[\\:\*\?\"<>\|;#]", "_", file_obj.name)
+    if zip_file_path == "":
+        zip_file_path = zip_file_name
+    else:
+        zip_file_path = zip_file_path + "/" + zip_file_name
+
+    return zip_file_path
+
+
+def create_zip_info(file_obj, compress_type=zipfile.ZIP_DEFLATED, compress_level=None) -> zipfile.ZipInfo:
     """
-    Yield the zip generator chunk from an UnseekableStream buffer to correctly stream upload the zip file.
+    Create a ZipInfo object for the single file to upload and update its metadata.
 
     Parameters
     ----------
-    zip_generator: Generator
-        create_zip_buffer_generator
-    stream_buffer: UnseekableStream
-        The upload buffer
+    file_obj: irods.data_object.iRODSDataObject
+    compress_type: int
+        The zipfile compression method constant (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, ...)
+    compress_level: int
+        The compression level, None for the compression method default level
 
     Returns
     -------
-    bytes
-        The zip buffer chunk
+    zipfile.ZipInfo
+        The zip entry metadata
     """
-    try:
-        for i in zip_generator:
-            stream_chunk = stream_buffer.get()
-            if len(stream_chunk) > 0:
-                yield stream_chunk
-    except StopIteration:
-        return b""
+    zip_info = zipfile.ZipInfo(get_zip_file_path(file_obj))
+    zip_info.file_size = file_obj.size
+    zip_info.compress_type = compress_type
+    # ZipFile.open(zip_info) reads the compression level from the ZipInfo object, not from the ZipFile object
+    zip_info._compresslevel = compress_level
 
+    return zip_info
 
-def create_zip_buffer_generator(file_obj, stream_buffer, upload_checksums_dict):
+
+def create_zip_buffer_generator(
+    file_obj, stream_buffer, upload_checksums_dict, compress_type=zipfile.ZIP_DEFLATED, compress_level=None
+):
     """
     Create a zip file for the single file to upload.
 
     The zip file creation is done during run-time, but not cached into disk or memory.
-    The ZipFile object is initialized with an UnseekableStream stream_buffer.
+    The ZipFile object is initialized with a ChunkBuffer stream_buffer.
 
     Meaning each chunk of the input file is passed to the stream_buffer to create a zip file. But each time a chunk is
     read from the stream_buffer during the upload, the buffer is emptied.
@@ -164,98 +402,286 @@ def create_zip_buffer_generator(file_obj, stream_buffer, upload_checksums_dict):
         a file-like object
     upload_checksums_dict: dict
         The dictionary that save the checksums values of each files for validations.
+    compress_type: int
+        The zipfile compression method constant used for the zip entry
+    compress_level: int
+        The compression level used for the zip entry, None for the compression method default level
 
     Yields
     ------
     When the stream_buffer is updated
     """
-    zip_buffer = zipfile.ZipFile(stream_buffer, "w", zipfile.ZIP_DEFLATED)
-    yield
+    yield from create_zip_bundle_generator(
+        [file_obj], stream_buffer, upload_checksums_dict, [(compress_type, compress_level)]
+    )
+
+
+def create_zip_bundle_generator(
+    file_objs,
+    stream_buffer,
+    upload_checksums_dict,
+    compressions,
+    profiler=None,
+    read_policy=None,
+    hashing_executor=None,
+    parallel_deflate=None,
+):
+    """
+    Create a zip file for the bundle of files to upload, with one zip entry per file.
+    See create_zip_buffer_generator.
 
-    # Initialize the checksum hashes
-    irods_sha = hashlib.sha256()
-    irods_md5 = hashlib.md5()
+    The read policy selects how each data object is read: the next blocks can be read from iRODS by background
+    threads, while the current block is compressed, hashed & uploaded. See ReadPolicy.
+    With a hashing executor, each block is hashed on the hashing threads while it is compressed. See ChunkHasher.
+    With parallel deflate, the large deflated files are compressed by blocks on several threads. See
+    ParallelDeflateWriter.
 
-    file_buffer = file_obj.open("r")
+    Parameters
+    ----------
+    file_objs: list[irods.data_object.iRODSDataObject]
+    stream_buffer:
+        a file-like object
+    upload_checksums_dict: dict
+        The dictionary that save the checksums values of each files for validations.
+    compressions: list[tuple(int, int)]
+        The zipfile compression method constant & compression level of each zip entry
+    profiler: ExportProfiler
+        Records the time spent per pipeline stage, None to disable the profiling
+    read_policy: ReadPolicy
+        Selects how the data objects are read, None to read them synchronously
+    hashing_executor: ThreadPoolExecutor
+        The hashing threads, None to hash the data objects in the zip generator thread
+    parallel_deflate: ParallelDeflate
+        Selects the large deflated zip entries compressed by blocks on a thread pool, None to disable
 
-    # Remove iRODS project collection path
-    zip_file_path = re.sub(r"/nlmumc/projects/P[0-9]{9}/C[0-9]{9}", "", file_obj.collection.path)
-    #  Replace specials characters ( ) [ ] { } $ % & - + @ ~ ' € ! ^
-    zip_file_path = re.sub(r"[\\\(\)\[\]\{\}\$\%\&\+@~'€!\^]", "_", zip_file_path)
-    # Replace specials characters /: * ? " < > | ; #
-    zip_file_path = re.sub(r"[\\:\*\?\"<>\|;#]", "_", zip_file_path)
-    zip_file_name = re.sub(r"[\\:\*\?\"<>\|;#]", "_", file_obj.name)
-    if zip_file_path == "":
-        zip_file_path = zip_file_name
-    else:
-        zip_file_path = zip_file_path + "/" + zip_file_name
+    Yields
+    ------
+    When the stream_buffer is updated
+    """
+    profiler = profiler or DisabledExportProfiler()
+    read_policy = read_policy or ReadPolicy()
+    zip_buffer = zipfile.ZipFile(stream_buffer, "w")
+    yield
 
-    # Create a ZipInfo object and update its metadata
-    zip_info = zipfile.ZipInfo(zip_file_path)
-    zip_info.file_size = file_obj.size
-    zip_info.compress_type = zipfile.ZIP_DEFLATED
+    for file_obj, (compress_type, compress_level) in zip(file_objs, compressions):
+        # Initialize the checksum hashes
+        hasher = ChunkHasher(hashing_executor, profiler, file_obj.path)
 
-    with zip_buffer.open(zip_info, mode="w") as dest:
-        for chunk in iter(lambda: file_buffer.read(BLOCK_SIZE), b""):
-            dest.write(chunk)
-            irods_sha.update(chunk)
-            irods_md5.update(chunk)
-            yield
-    file_buffer.close()
+        profiler.set_current_file(file_obj.path)
+        with profiler.span(IRODS_READ):
+            file_buffer = read_policy.open(file_obj)
 
-    sha_hex_digest = irods_sha.hexdigest()
-    md5_hex_digest = irods_md5.hexdigest()
+        # Create a ZipInfo object and update its metadata
+        zip_info = create_zip_info(file_obj, compress_type, compress_level)
+        zip_file_path = zip_info.filename
 
-    # str: irods data object path => sha_hex_digest
-    upload_checksums_dict.update({file_obj.path: sha_hex_digest})
-    # str: dataverse relative file path => md5_hex_digest
-    upload_checksums_dict.update({zip_file_path: md5_hex_digest})
+        # The data object is closed, and the read-ahead thread stopped, even if the upload is interrupted
+        try:
+            with zip_buffer.open(zip_info, mode="w") as dest:
+                block_writer = None
+                if parallel_deflate is not None and parallel_deflate.applies(file_obj, compress_type, compress_level):
+                    block_writer = parallel_deflate.writer(dest, compress_level, profiler, file_obj.path)
+                while True:
+                    with profiler.span(IRODS_READ):
+                        chunk = file_buffer.read(read_policy.block_size)
+                    if not chunk:
+                        break
+                    IRODS_READ_BYTES.inc(len(chunk))
+                    # The chunk is hashed while it is compressed
+                    hasher.update(chunk)
+                    if block_writer is not None:
+                        block_writer.write(chunk)
+                    else:
+                        with profiler.span(COMPRESS):
+                            dest.write(chunk)
+                    yield
+                if block_writer is not None:
+                    yield from block_writer.flush()
+        finally:
+            file_buffer.close()
+        if zip_info.file_size > 0:
+            method = zipfile.compressor_names.get(compress_type, str(compress_type))
+            COMPRESSION_RATIO.labels(method).observe(zip_info.compress_size / zip_info.file_size)
+
+        sha_hex_digest, md5_hex_digest = hasher.hexdigests()
+
+        # str: irods data object path => sha_hex_digest
+        upload_checksums_dict.update({file_obj.path: sha_hex_digest})
+        # str: dataverse relative file path => md5_hex_digest
+        upload_checksums_dict.update({zip_file_path: md5_hex_digest})
+        yield
 
     zip_buffer.close()
     yield
 
 
-def get_zip_iterator(file_obj, upload_checksums_dict, zip_buffer_size) -> IteratorAsBinaryFile:
+def get_zip_multipart_stream(
+    file_obj, upload_checksums_dict, json_data, zip_name, compress_type=zipfile.ZIP_DEFLATED, compress_level=None
+) -> MultipartZipStream:
     """
-    Create the zip buffer iterator for the file that need to be uploaded.
+    Create the multipart body that stream upload the file zipped.
+
+    If the file is stored in the zip, the zip buffer size is calculated beforehand and the body is sent with a
+    Content-Length. Otherwise, the zip buffer size can't be known without reading the whole file a first time,
+    so the body is sent with chunked transfer encoding.
 
     Parameters
     ----------
     file_obj: irods.data_object.iRODSDataObject
     upload_checksums_dict: dict
         The dictionary that save the checksums values of each files for validations.
-    zip_buffer_size: int
-        The total size of the buffer calculated beforehand
+    json_data: str
+        The 'jsonData' field value
+    zip_name: str
+        The 'file' field file name
+    compress_type: int
+        The zipfile compression method constant used for the zip entry
+    compress_level: int
+        The compression level used for the zip entry, None for the compression method default level
 
     Returns
     -------
-    IteratorAsBinaryFile
-        file-like object iterator compatible with stream upload.
+    MultipartZipStream
+        iterable multipart body compatible with stream upload.
     """
-    stream_buffer = UnseekableStream()
-    zip_generator = create_zip_buffer_generator(file_obj, stream_buffer, upload_checksums_dict)
-    iterator = IteratorAsBinaryFile(zip_buffer_size, upload_zip_generator(zip_generator, stream_buffer))
-
-    return iterator
+    return get_zip_bundle_multipart_stream(
+        [file_obj], upload_checksums_dict, json_data, zip_name, [(compress_type, compress_level)]
+    )
+
+
+def get_zip_bundle_multipart_stream(
+    file_objs,
+    upload_checksums_dict,
+    json_data,
+    zip_name,
+    compressions,
+    profiler=None,
+    read_policy=None,
+    hashing_executor=None,
+    parallel_deflate=None,
+) -> MultipartZipStream:
+    """
+    Create the multipart body that stream upload the bundle of files zipped.
+    See get_zip_multipart_stream: the body has a Content-Length only if all the files are stored in the zip.
 
+    Parameters
+    ----------
+    file_objs: list[irods.data_object.iRODSDataObject]
+    upload_checksums_dict: dict
+        The dictionary that save the checksums values of each files for validations.
+    json_data: str
+        The 'jsonData' field value
+    zip_name: str
+        The 'file' field file name
+    compressions: list[tuple(int, int)]
+        The zipfile compression method constant & compression level of each zip entry
+    profiler: ExportProfiler
+        Records the time spent per pipeline stage, None to disable the profiling
+    read_policy: ReadPolicy
+        Selects how the data objects are read, None to read them synchronously
+    hashing_executor: ThreadPoolExecutor
+        The hashing threads, None to hash the data objects in the zip generator thread
+    parallel_deflate: ParallelDeflate
+        Selects the large deflated zip entries compressed by blocks on a thread pool, None to disable
 
-def calculate_zip_buffer_size(file_obj, upload_checksums_dict) -> int:
+    Returns
+    -------
+    MultipartZipStream
+        iterable multipart body compatible with stream upload.
+    """
+    zip_size = None
+    if all(compress_type == zipfile.ZIP_STORED for compress_type, _ in compressions):
+        zip_size = calculate_stored_zip_bundle_size(file_objs)
+
+    stream_buffer = ChunkBuffer()
+    zip_generator = create_zip_bundle_generator(
+        file_objs,
+        stream_buffer,
+        upload_checksums_dict,
+        compressions,
+        profiler,
+        read_policy,
+        hashing_executor,
+        parallel_deflate=parallel_deflate,
+    )
+
+    return MultipartZipStream(
+        json_data, zip_name, upload_zip_generator(zip_generator, stream_buffer), zip_size, profiler
+    )
+
+
+def calculate_stored_zip_size(file_obj) -> int:
     """
-    Calculate the zip buffer total size before the upload.
+    Calculate analytically the zip buffer total size of a single ZIP_STORED entry, without reading the data object.
+
+    A stored entry has the same size as the file, so the zip length only depends on the file size and on the
+    zip records written around it by zipfile for an unseekable stream:
+        * local file header (+ ZIP64 extra field)
+        * file data
+        * data descriptor (32 or 64 bits sizes)
+        * central directory header (+ ZIP64 extra field)
+        * end of central directory record (+ ZIP64 end record & locator)
 
     Parameters
     ----------
     file_obj: irods.data_object.iRODSDataObject
-    upload_checksums_dict: dict
-        The dictionary that save the checksums values of each files for validations.
 
     Returns
     -------
     int
         The total size of the buffer
     """
-    stream_buffer = UnseekableStream()
-    zip_generator = create_zip_buffer_generator(file_obj, stream_buffer, upload_checksums_dict)
-    zip_buffer_size = get_zip_buffer_size(zip_generator, stream_buffer)
+    return calculate_stored_zip_bundle_size([file_obj])
+
+
+def calculate_stored_zip_bundle_size(file_objs) -> int:
+    """
+    Calculate analytically the zip buffer total size of a bundle of ZIP_STORED entries, without reading the data
+    objects. See calculate_stored_zip_size.
+
+    Parameters
+    ----------
+    file_objs: list[irods.data_object.iRODSDataObject]
 
-    return zip_buffer_size
+    Returns
+    -------
+    int
+        The total size of the buffer
+    """
+    central_directory_offset = 0
+    central_directory_size = 0
+    for file_obj in file_objs:
+        zip_info = create_zip_info(file_obj, zipfile.ZIP_STORED)
+        # Same flags than zipfile.ZipFile._open_to_write for an unseekable stream
+        zip_info.flag_bits |= ZIP_DATA_DESCRIPTOR_FLAG
+        zip64 = zip_info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+
+        header_offset = central_directory_offset
+        local_header_size = len(zip_info.FileHeader(zip64))
+        data_descriptor_size = struct.calcsize("<LLQQ" if zip64 else "<LLLL")
+        central_directory_offset += local_header_size + zip_info.file_size + data_descriptor_size
+
+        # ZIP64 extra field values: file_size & compress_size, header_offset
+        zip64_extra_count = 0
+        if zip_info.file_size > zipfile.ZIP64_LIMIT:
+            zip64_extra_count += 2
+        if header_offset > zipfile.ZIP64_LIMIT:
+            zip64_extra_count += 1
+        central_directory_extra_size = len(zip_info.extra)
+        if zip64_extra_count > 0:
+            central_directory_extra_size += struct.calcsize("<HH" + "Q" * zip64_extra_count)
+
+        filename, _ = zip_info._encodeFilenameFlags()
+        central_directory_size += (
+            zipfile.sizeCentralDir + len(filename) + central_directory_extra_size + len(zip_info.comment)
+        )
+
+    end_record_size = zipfile.sizeEndCentDir
+    if (
+        len(file_objs) > zipfile.ZIP_FILECOUNT_LIMIT
+        or central_directory_offset > zipfile.ZIP64_LIMIT
+        or central_directory_size > zipfile.ZIP64_LIMIT
+    ):
+        end_record_size += zipfile.sizeEndCentDir64 + zipfile.sizeEndCentDir64Locator
+
+    return central_directory_offset + central_directory_size + end_record_size
@@ -1,43 +1,196 @@
 #!/usr/bin/env python3
+import functools
 import os
 import sys
 import signal
+import threading
 import time
 import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 
 import pika
 import json
 
+from etl.dataverseManager.controlledVocabulary import get_controlled_vocabulary
+from etl.dataverseManager.dataverseMetadataMapper import preload_metadata_template
 from etl.dataverseManager.irods2Dataverse import DataverseExporter
+from etl.httpManager.outbox import get_outbox
 from etl.irodsManager.irodsClient import irodsClient
+from etl.irodsManager.restrictList import RestrictList
+from etl.metricsManager.exporterMetrics import EXPORTS_IN_FLIGHT, MESSAGE_AGE, QUEUE_WAIT, start_metrics_server
+from etl.rabbitmqManager.eventPublisher import get_event_publisher
 
 log_level = os.environ["LOG_LEVEL"]
 logging.basicConfig(level=logging.getLevelName(log_level), format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger("root")
 
+# Number of exports running at the same time, and number of unacknowledged messages delivered by RabbitMQ
+EXPORT_CONCURRENCY = int(os.environ.get("EXPORT_CONCURRENCY", 1))
+export_executor = ThreadPoolExecutor(max_workers=EXPORT_CONCURRENCY, thread_name_prefix="export")
+# A failed export that didn't report an error status (e.g. iRODS or Dataverse unreachable) is requeued after a delay,
+# up to a maximum number of attempts
+EXPORT_REQUEUE_DELAY = float(os.environ.get("EXPORT_REQUEUE_DELAY", 60))
+EXPORT_REQUEUE_MAX_ATTEMPTS = int(os.environ.get("EXPORT_REQUEUE_MAX_ATTEMPTS", 5))
 
-def extend_folder_path(session, selected_list):
+# The exports running or waiting for a worker thread
+export_futures = set()
+# Shared by the connection thread & the export threads
+export_state_lock = threading.Lock()
+# (project, collection) => number of failed attempts of the requeued export
+export_failures = Counter()
+# (project, collection) => True (ack) or False (reject), of the exports that ended while the connection was closed
+lost_acknowledgements = {}
+
+
+class ExportFailed(Exception):
+    """Failed export, reported or not in the exporterState AVU"""
+
+    def __init__(self, reported):
+        super().__init__("reported" if reported else "not reported")
+        self.reported = reported
+
+
+def get_export_key(body):
     """
-    If a folder is part of the original selected list, this function will recursively walk into it to retrieve all
-    its files children and add them to the original selected list
+    Returns
+    -------
+    tuple(str, str)
+        The (project, collection) of the export message, None if the body can't be parsed
     """
-    extended_list = []
-    for path in selected_list.split(",\t"):
-        absolute_path = "/nlmumc/projects/" + path
-        # Check if the path is collection
-        if session.collections.exists(absolute_path):
-            collection = session.collections.get(absolute_path)
-            for coll, sub, files in collection.walk():
-                for file in files:
-                    extended_list.append(file.path.replace("/nlmumc/projects/", ""))
-        # Or a file
-        else:
-            extended_list.append(path)
-
-    return extended_list
+    try:
+        data = json.loads(body.decode("utf-8"))
+        return data["project"], data["collection"]
+    except (ValueError, KeyError, TypeError):
+        return None
 
 
 def collection_etl(ch, method, properties, body):
+    """
+    Dispatch the export to a worker thread.
+    The pika callback returns immediately, so the connection keeps processing heartbeats during long exports.
+
+    A message redelivered after a connection loss, whose export ended while the connection was closed, is
+    acknowledged (or rejected) as it would have been, without exporting the collection again.
+    """
+    key = get_export_key(body)
+    if method.redelivered and key is not None:
+        with export_state_lock:
+            acknowledgement = lost_acknowledgements.pop(key, None)
+        if acknowledgement is not None:
+            logger.info(f" [x] Export {key} already ended, acknowledge the redelivered message: {acknowledgement}")
+            if acknowledgement:
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+            else:
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+    future = export_executor.submit(
+        threaded_collection_etl, ch, method.delivery_tag, body, properties.timestamp, time.time()
+    )
+    export_futures.add(future)
+    future.add_done_callback(export_futures.discard)
+
+
+def wait_for_exports():
+    """
+    Wait for the exports of a closed connection to end. Their unacknowledged messages are redelivered on the new
+    connection: consuming before they end would export the same collection twice at once.
+    """
+    futures = list(export_futures)
+    if futures:
+        logger.info(f" [x] Waiting for {len(futures)} export(s) of the closed connection to end")
+        wait(futures)
+
+
+def threaded_collection_etl(ch, delivery_tag, body, published_at=None, delivered_at=None):
+    """
+    Run the export in a worker thread, then acknowledge the message from the connection thread.
+    A failed export that reported an error status (exporterState AVU & service desk ticket) is rejected without being
+    requeued. Otherwise, the failure may be transient: the message is requeued after a delay, up to a maximum number
+    of attempts.
+    """
+    now = time.time()
+    if published_at:
+        MESSAGE_AGE.observe(max(0.0, now - published_at))
+    if delivered_at:
+        QUEUE_WAIT.observe(now - delivered_at)
+
+    key = get_export_key(body)
+    requeue = False
+    try:
+        with EXPORTS_IN_FLIGHT.track_inprogress():
+            exported = export_collection(body)
+    except ExportFailed as error:
+        logger.exception(f" [x] Export failed, {error}")
+        exported = False
+        requeue = not error.reported and count_failure(key)
+    except Exception:
+        logger.exception(" [x] Export failed")
+        exported = False
+
+    if exported:
+        with export_state_lock:
+            export_failures.pop(key, None)
+
+    if exported:
+        callback = functools.partial(ch.basic_ack, delivery_tag=delivery_tag)
+    else:
+        if requeue:
+            logger.info(f" [x] Export {key} requeued in {EXPORT_REQUEUE_DELAY:.0f}s")
+            time.sleep(EXPORT_REQUEUE_DELAY)
+        callback = functools.partial(ch.basic_nack, delivery_tag=delivery_tag, requeue=requeue)
+
+    try:
+        ch.connection.add_callback_threadsafe(callback)
+    except Exception as error:
+        # The connection was closed during the export, the broker will re-deliver the message
+        logger.error(f" [x] Acknowledge message failed: {error}")
+        if key is not None and not requeue:
+            with export_state_lock:
+                lost_acknowledgements[key] = exported
+        return
+
+    if exported:
+        logger.info(" [x] Sent projectCollection.exporter.executed")
+
+
+def count_failure(key) -> bool:
+    """
+    Count a failed attempt of the export.
+
+    Returns
+    -------
+    bool
+        True, if the export can be attempted again
+    """
+    if key is None:
+        return False
+
+    with export_state_lock:
+        export_failures[key] += 1
+        if export_failures[key] < EXPORT_REQUEUE_MAX_ATTEMPTS:
+            return True
+        del export_failures[key]
+
+    logger.error(f" [x] Export {key} failed {EXPORT_REQUEUE_MAX_ATTEMPTS} times, message rejected")
+    return False
+
+
+def export_collection(body) -> bool:
+    """
+    Parse the message body and export the collection.
+
+    Returns
+    -------
+    bool
+        True, if the export was done and the message can be acknowledged.
+
+    Raises
+    ------
+    ExportFailed
+        If the export failed, with whether the failure was reported in the exporterState AVU
+    """
     try:
         data = json.loads(body.decode("utf-8"))
         logger.info(f" [x] Received %r" % data)
@@ -47,18 +200,26 @@ def collection_etl(ch, method, properties, body):
         irods_client = irodsClient(
             host=os.environ["IRODS_HOST"], user=os.environ["IRODS_USER"], password=os.environ["IRODS_PASS"]
         )
-        irods_client.prepare(data["project"], data["collection"], data["repository"])
-        logger.info(f" [x] Create {data['repository']} exporter worker")
-        exporter = None
-        if data["repository"] == "Dataverse":
-            exporter = DataverseExporter()
-        if exporter is not None:
-            data["restrict_list"] = extend_folder_path(irods_client.session, data["restrict_list"])
-            exporter.init_export(irods_client, data)
-            ch.basic_ack(delivery_tag=method.delivery_tag)
-            logger.info(" [x] Sent projectCollection.exporter.executed")
+        try:
+            irods_client.prepare(data["project"], data["collection"], data["repository"])
+            logger.info(f" [x] Create {data['repository']} exporter worker")
+            exporter = None
+            if data["repository"] == "Dataverse":
+                exporter = DataverseExporter()
+            if exporter is not None:
+                data["restrict_list"] = RestrictList.parse(
+                    data["restrict_list"], irods_client.get_collection_manifest()
+                )
+                exporter.init_export(irods_client, data)
+
+                return True
+        except Exception as error:
+            irods_client.release(discard=True)
+            raise ExportFailed(irods_client.error_reported) from error
 
-        return True
+        irods_client.release()
+
+    return False
 
 
 def main(channel, retry_counter=None):
@@ -70,6 +231,7 @@ def main(channel, retry_counter=None):
         routing_key="projectCollection.exporter.requested",
     )
 
+    channel.basic_qos(prefetch_count=EXPORT_CONCURRENCY)
     channel.basic_consume(queue="repository.collection-etl", on_message_callback=collection_etl)
 
     # When connection closed, try again 10 time otherwise quit.
@@ -80,7 +242,7 @@ def main(channel, retry_counter=None):
         exit(1)
 
     try:
-        logger.info(" [x] Waiting for queue repository.collection-etl")
+        logger.info(f" [x] Waiting for queue repository.collection-etl - {EXPORT_CONCURRENCY} export(s) at once")
         channel.start_consuming()
     except pika.exceptions.ConnectionClosed:
         logger.error(
@@ -88,6 +250,7 @@ def main(channel, retry_counter=None):
             + " This was try "
             + str(retry_counter)
         )
+        wait_for_exports()
         time.sleep(60)
         new_connection = pika.BlockingConnection(parameters)
         new_ch = new_connection.channel()
@@ -100,6 +263,13 @@ def sigterm_handler():
 
 if __name__ == "__main__":
     signal.signal(signal.SIGTERM, sigterm_handler)
+    # Load the metadata resources once, an invalid template stops the worker before it consumes any message
+    preload_metadata_template()
+    get_controlled_vocabulary()
+    start_metrics_server()
+    # Deliver the e-mails, review submissions & tickets left in the outbox by the previous run, in the background
+    get_outbox()
+
     credentials = pika.PlainCredentials(os.environ["RABBITMQ_USER"], os.environ["RABBITMQ_PASS"])
     parameters = pika.ConnectionParameters(
         host=os.environ["RABBITMQ_HOST"],
@@ -116,4 +286,6 @@ if __name__ == "__main__":
         sys.exit(main(channel, retry_counter=0))
     finally:
         connection.close()
+        # Publish the last exporterState events
+        get_event_publisher().close()
         logger.info("Exiting")
@@ -0,0 +1,363 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+from collections.abc import Mapping
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, MaxRetryError
+
+from etl.metricsManager.exporterMetrics import HTTP_RESPONSES
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# HTTP methods that can be sent again without side effect
+IDEMPOTENT_METHODS = frozenset(["DELETE", "GET", "HEAD", "OPTIONS", "PUT", "TRACE"])
+# HTTP status codes of the transient server errors
+RETRY_STATUS_CODES = frozenset([500, 502, 503, 504])
+# Bytes of the first chunks of a streamed body kept to send it again, see ReplayableStream
+STREAM_REPLAY_BYTES = 1024**2
+
+
+def get_backoff_time(backoff_factor, backoff_max, attempt) -> float:
+    """
+    Exponential backoff with jitter: a random value between half and the whole exponential backoff value.
+
+    Parameters
+    ----------
+    backoff_factor: float
+        The backoff value of the first retry, in seconds
+    backoff_max: float
+        The maximum backoff value, in seconds
+    attempt: int
+        The number of failed attempts so far
+
+    Returns
+    -------
+    float
+        The number of seconds to sleep before the next attempt
+    """
+    backoff = min(backoff_max, backoff_factor * (2**attempt))
+    return backoff / 2 + random.uniform(0, backoff / 2)
+
+
+def is_connect_error(error) -> bool:
+    """
+    Parameters
+    ----------
+    error: requests.exceptions.ConnectionError
+
+    Returns
+    -------
+    bool
+        True, if the connection to the server failed: the request wasn't sent at all
+    """
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+
+    cause = error.args[0] if error.args else None
+    if isinstance(cause, MaxRetryError):
+        cause = cause.reason
+
+    # NewConnectionError is a ConnectTimeoutError
+    return isinstance(cause, ConnectTimeoutError)
+
+
+def is_stream(data) -> bool:
+    """True, if the request body is sent by requests as an iterable of chunks, which can only be read once"""
+    return hasattr(data, "__iter__") and not isinstance(data, (str, bytes, list, tuple, Mapping))
+
+
+class ReplayableStream:
+    """
+    Streamed request body, which can be sent again if the connection failed while sending its first chunks.
+
+    The first chunks are kept, up to max_bytes. A keep-alive connection closed by the server while it was idle in the
+    pool fails on the first chunks sent: they are sent again on a new connection, followed by the rest of the stream.
+    Once more than max_bytes were sent, or the whole body was sent, the stream can't be sent again.
+    """
+
+    def __init__(self, stream, max_bytes=STREAM_REPLAY_BYTES):
+        """
+        Parameters
+        ----------
+        stream: Iterable[bytes]
+            The streamed body
+        max_bytes: int
+            The maximum number of bytes kept to send the stream again
+        """
+        self.stream = stream
+        self.max_bytes = max_bytes
+        # The length of the stream, requests sends a Content-Length if it's known
+        self.len = getattr(stream, "len", None)
+        self._iterator = None
+        self._kept = []
+        self._kept_bytes = 0
+        self._replayable = True
+        self._exhausted = False
+
+    def __iter__(self):
+        if self._iterator is None:
+            self._iterator = iter(self.stream)
+        # The chunks already sent on the failed connection
+        yield from list(self._kept)
+        for chunk in self._iterator:
+            if self._replayable:
+                self._kept_bytes += len(chunk)
+                if self._kept_bytes <= self.max_bytes:
+                    self._kept.append(chunk)
+                else:
+                    self._replayable = False
+                    self._kept = []
+            yield chunk
+        # The whole body was sent, it's never sent again
+        self._exhausted = True
+        self._kept = []
+
+    def rewind(self) -> bool:
+        """
+        Returns
+        -------
+        bool
+            True, if the stream can be sent again from the start
+        """
+        return self._replayable and not self._exhausted
+
+    def close(self):
+        """
+        Close the underlying stream iterator, e.g. to stop the zip generator of an aborted upload, and release the
+        kept chunks: the response still references the stream, as its request body.
+        """
+        self._replayable = False
+        self._kept = []
+        if self._iterator is not None and hasattr(self._iterator, "close"):
+            self._iterator.close()
+
+
+class HttpSession:
+    """
+    Shared HTTP session, with keep-alive connections pooled per host.
+
+    Retries, all done by the request loop with exponential backoff and jitter (urllib3 doesn't retry):
+        * A failed connection is always retried, because the request was not sent yet.
+        * A connection reset or a transient server error (5xx) is retried for idempotent requests.
+          POST requests are not idempotent by default.
+        * A connection reset of a request with a streamed body, while its first chunks were sent, is retried on a new
+          connection, whatever the method: the server never got the whole request. It's the case of a stale
+          keep-alive connection. See ReplayableStream.
+    """
+
+    def __init__(
+        self,
+        pool_connections=10,
+        pool_maxsize=10,
+        retries=3,
+        backoff_factor=1.0,
+        backoff_max=60.0,
+        timeout=(10, 300),
+    ):
+        """
+        Parameters
+        ----------
+        pool_connections: int
+            The number of hosts to keep a connection pool for
+        pool_maxsize: int
+            The maximum number of connections kept alive per host
+        retries: int
+            The maximum number of retries of a request
+        backoff_factor: float
+            The backoff value of the first retry, in seconds
+        backoff_max: float
+            The maximum backoff value, in seconds
+        timeout: tuple(float, float)
+            The default (connect, read) timeouts, in seconds
+        """
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            # The retries are done by the request loop only, with a single backoff schedule
+            max_retries=0,
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+        # str: host => Counter of requests, retries, errors & status codes
+        self.statistics = defaultdict(Counter)
+        self._statistics_lock = threading.Lock()
+
+    def request(self, method, url, idempotent=None, **kwargs) -> requests.Response:
+        """
+        Send the request, and retry it if it failed and if it is safe to send it again.
+
+        Parameters
+        ----------
+        method: str
+            The HTTP method
+        url: str
+            The request URL
+        idempotent: bool
+            If True, the request can be sent again. By default, True for the idempotent HTTP methods.
+        kwargs:
+            The requests.Session.request arguments
+
+        Returns
+        -------
+        requests.Response
+            The http response
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        kwargs.setdefault("timeout", self.timeout)
+        host = urlparse(url).netloc
+        body = kwargs.get("data")
+        if is_stream(body):
+            body = kwargs["data"] = ReplayableStream(body)
+        else:
+            body = None
+
+        attempt = 0
+        try:
+            while True:
+                self._count(host, "requests")
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as error:
+                    self._count(host, "errors")
+                    if attempt >= self.retries or not self._is_retryable(error, idempotent, body):
+                        raise
+                    logger.warning(f"{'--':<20}{method} {host} failed: {error}")
+                else:
+                    self._count(host, f"status_{response.status_code}")
+                    HTTP_RESPONSES.labels(host, method.upper(), response.status_code).inc()
+                    if (
+                        not idempotent
+                        or attempt >= self.retries
+                        or response.status_code not in RETRY_STATUS_CODES
+                        or (body is not None and not body.rewind())
+                    ):
+                        return response
+                    logger.warning(f"{'--':<20}{method} {host} failed: HTTP {response.status_code}")
+
+                self._count(host, "retries")
+                time.sleep(get_backoff_time(self.backoff_factor, self.backoff_max, attempt))
+                attempt += 1
+        finally:
+            if body is not None:
+                body.close()
+
+    @staticmethod
+    def _is_retryable(error, idempotent, body) -> bool:
+        """
+        Parameters
+        ----------
+        error: requests.exceptions.ConnectionError | requests.exceptions.ChunkedEncodingError
+            The request error
+        idempotent: bool
+            If True, the request can be sent again
+        body: ReplayableStream
+            The streamed body, None if the body isn't streamed
+
+        Returns
+        -------
+        bool
+            True, if the request can be sent again
+        """
+        if isinstance(error, requests.exceptions.ChunkedEncodingError):
+            # The request was sent, and its response was cut
+            return idempotent and (body is None or body.rewind())
+        if is_connect_error(error):
+            return True
+        if body is not None:
+            # The server never got the whole streamed body
+            return body.rewind()
+
+        return idempotent
+
+    def post(self, url, idempotent=False, **kwargs) -> requests.Response:
+        return self.request("POST", url, idempotent=idempotent, **kwargs)
+
+    def get(self, url, idempotent=True, **kwargs) -> requests.Response:
+        return self.request("GET", url, idempotent=idempotent, **kwargs)
+
+    def delete(self, url, idempotent=True, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, idempotent=idempotent, **kwargs)
+
+    def _count(self, host, key):
+        with self._statistics_lock:
+            self.statistics[host][key] += 1
+
+    def get_pool_statistics(self) -> dict:
+        """
+        Get the statistics per host, for monitoring.
+
+        Returns
+        -------
+        dict
+            host => requests, retries, errors & status codes counts, and the connection pool usage
+        """
+        with self._statistics_lock:
+            statistics = {host: dict(counter) for host, counter in self.statistics.items()}
+
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = pool.host if pool.port in (None, 80, 443) else f"{pool.host}:{pool.port}"
+            host_statistics = statistics.setdefault(host, {})
+            host_statistics["connections_opened"] = pool.num_connections
+            # The pool queue is filled with None placeholders, for the connections not opened yet
+            host_statistics["connections_idle"] = sum(1 for conn in list(pool.pool.queue) if conn is not None)
+            host_statistics["pool_requests"] = pool.num_requests
+
+        return statistics
+
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session() -> HttpSession:
+    """
+    Get the process-wide HTTP session, configured with the environment variables:
+        * HTTP_POOL_MAXSIZE: connections kept alive per host, by default
+          EXPORT_CONCURRENCY * EXPORT_UPLOAD_WORKERS + 2
+        * HTTP_RETRIES: maximum number of retries of a request (default 3)
+        * HTTP_BACKOFF_FACTOR: backoff of the first retry in seconds (default 1)
+        * HTTP_BACKOFF_MAX: maximum backoff in seconds (default 60)
+        * HTTP_CONNECT_TIMEOUT: connect timeout in seconds (default 10)
+        * HTTP_READ_TIMEOUT: read timeout in seconds (default 300)
+
+    Returns
+    -------
+    HttpSession
+        The shared HTTP session
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            upload_connections = int(os.environ.get("EXPORT_CONCURRENCY", 1)) * int(
+                os.environ.get("EXPORT_UPLOAD_WORKERS", 1)
+            )
+            _http_session = HttpSession(
+                pool_maxsize=int(os.environ.get("HTTP_POOL_MAXSIZE", upload_connections + 2)),
+                retries=int(os.environ.get("HTTP_RETRIES", 3)),
+                backoff_factor=float(os.environ.get("HTTP_BACKOFF_FACTOR", 1)),
+                backoff_max=float(os.environ.get("HTTP_BACKOFF_MAX", 60)),
+                timeout=(
+                    float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10)),
+                    float(os.environ.get("HTTP_READ_TIMEOUT", 300)),
+                ),
+            )
+
+    return _http_session
@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from etl.httpManager.httpSession import get_backoff_time
+from etl.metricsManager.exporterMetrics import OUTBOX_DELIVERIES, OUTBOX_PENDING
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# Maximum number of seconds the dispatcher sleeps between two checks of the outbox
+DISPATCH_MAX_WAIT = 60.0
+
+# str: message kind => (handler, on_failure)
+_handlers = {}
+
+
+class DeliveryError(Exception):
+    """Transient delivery failure, the message is delivered again later"""
+
+
+def outbox_handler(kind, on_failure=None):
+    """
+    Register the delivery handler of a message kind.
+
+    The handler is called by the dispatcher with the message payload & the request timeout in seconds. It raises an
+    exception (a DeliveryError, a requests.exceptions.RequestException...) if the message should be delivered again
+    later, and returns if it was delivered, or if it can't ever be delivered (after logging why).
+
+    Parameters
+    ----------
+    kind: str
+        The message kind
+    on_failure: Callable
+        Called with the payload & the last error, once the message delivery failed for the last time
+
+    Returns
+    -------
+    Callable
+        The decorator registering the handler
+    """
+
+    def register(handler):
+        _handlers[kind] = (handler, on_failure)
+        return handler
+
+    return register
+
+
+class Outbox:
+    """
+    Durable outbox of the export side effects (e-mail, review submission, service desk tickets), stored in a local
+    SQLite file, and delivered by a background dispatcher thread.
+
+    The export only writes the message, so it's done as soon as the data and the status are committed. The dispatcher
+    delivers the messages in order of due time, each with a request timeout, and retries the failed deliveries with
+    exponential backoff, up to a maximum number of attempts. The messages left by a stopped worker are delivered once
+    it's restarted. A message is deleted after its delivery, so it's delivered at least once.
+    """
+
+    def __init__(self, path, timeout=30.0, max_attempts=10, backoff_factor=10.0, backoff_max=3600.0):
+        """
+        Parameters
+        ----------
+        path: str
+            The SQLite outbox file path
+        timeout: float
+            The request timeout of a delivery, in seconds
+        max_attempts: int
+            The maximum number of delivery attempts of a message
+        backoff_factor: float
+            The backoff of the first retry, in seconds
+        backoff_max: float
+            The maximum backoff, in seconds
+        """
+        self.path = path
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # The export threads write the messages, the dispatcher thread delivers them: a single connection, serialized
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, payload TEXT, attempts INTEGER DEFAULT 0,"
+                " next_attempt_at REAL, failed INTEGER DEFAULT 0, last_error TEXT)"
+            )
+
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._update_pending()
+
+    def put(self, kind, payload):
+        """
+        Write a message to the outbox, to be delivered by the dispatcher.
+
+        Parameters
+        ----------
+        kind: str
+            The message kind, see outbox_handler
+        payload: dict
+            The JSON serializable message content
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO messages (kind, payload, next_attempt_at) VALUES (?, ?, ?)",
+                (kind, json.dumps(payload), time.time()),
+            )
+        logger.info(f"{'--':<20}Outbox message queued: {kind}")
+        self._update_pending()
+        self._wake.set()
+
+    def start(self):
+        """Start the dispatcher thread, if it isn't running"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._dispatch, name="outbox-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop the dispatcher thread after the current delivery. The pending messages are kept in the outbox.
+
+        Parameters
+        ----------
+        timeout: float
+            The maximum number of seconds to wait for the current delivery
+        """
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _dispatch(self):
+        while not self._stopped.is_set():
+            # Cleared before the check, so a message put meanwhile wakes up the wait below
+            self._wake.clear()
+            message = self._next_due()
+            if message is None:
+                self._wake.wait(self._next_wait())
+                continue
+            self._deliver(*message)
+
+    def _next_due(self):
+        with self._lock:
+            return self._connection.execute(
+                "SELECT id, kind, payload, attempts FROM messages WHERE failed = 0 AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at, id LIMIT 1",
+                (time.time(),),
+            ).fetchone()
+
+    def _next_wait(self) -> float:
+        with self._lock:
+            row = self._connection.execute("SELECT MIN(next_attempt_at) FROM messages WHERE failed = 0").fetchone()
+
+        if row[0] is None:
+            return DISPATCH_MAX_WAIT
+
+        return min(DISPATCH_MAX_WAIT, max(0.0, row[0] - time.time()))
+
+    def _deliver(self, message_id, kind, payload, attempts):
+        handler, on_failure = _handlers.get(kind, (None, None))
+        payload = json.loads(payload)
+        try:
+            if handler is None:
+                raise DeliveryError(f"no handler registered for {kind}")
+            handler(payload, self.timeout)
+        except Exception as error:
+            attempts += 1
+            if attempts < self.max_attempts:
+                delay = get_backoff_time(self.backoff_factor, self.backoff_max, attempts - 1)
+                logger.warning(f"{'--':<20}Outbox {kind} delivery failed, retry in {delay:.0f}s: {error}")
+                self._update(
+                    "UPDATE messages SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (attempts, time.time() + delay, str(error), message_id),
+                )
+                OUTBOX_DELIVERIES.labels(kind, "retried").inc()
+                return
+
+            logger.error(f"{'--':<20}Outbox {kind} delivery failed after {attempts} attempts: {error}")
+            # The failed message is kept in the outbox, to be inspected
+            self._update(
+                "UPDATE messages SET attempts = ?, failed = 1, last_error = ? WHERE id = ?",
+                (attempts, str(error), message_id),
+            )
+            OUTBOX_DELIVERIES.labels(kind, "failed").inc()
+            if on_failure is not None:
+                try:
+                    on_failure(payload, error)
+                except Exception as failure_error:
+                    logger.error(f"{'--':<20}Outbox {kind} failure handler failed: {failure_error}")
+            return
+
+        self._update("DELETE FROM messages WHERE id = ?", (message_id,))
+        OUTBOX_DELIVERIES.labels(kind, "delivered").inc()
+
+    def _update(self, statement, parameters):
+        with self._lock:
+            self._connection.execute(statement, parameters)
+        self._update_pending()
+
+    def _update_pending(self):
+        with self._lock:
+            row = self._connection.execute("SELECT COUNT(*) FROM messages WHERE failed = 0").fetchone()
+        OUTBOX_PENDING.set(row[0])
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Outbox:
+    """
+    Get the process-wide outbox, with its dispatcher thread started, configured with the environment variables:
+        * EXPORT_OUTBOX_PATH: the SQLite outbox file path (default /var/lib/exporter/export-outbox/outbox.sqlite),
+          on a volume that outlives the container, so the pending messages are delivered after a restart
+        * EXPORT_OUTBOX_TIMEOUT: the request timeout of a delivery in seconds (default 30)
+        * EXPORT_OUTBOX_MAX_ATTEMPTS: the maximum number of delivery attempts of a message (default 10)
+        * EXPORT_OUTBOX_BACKOFF_FACTOR: the backoff of the first retry in seconds (default 10)
+        * EXPORT_OUTBOX_BACKOFF_MAX: the maximum backoff in seconds (default 3600)
+
+    Returns
+    -------
+    Outbox
+        The shared outbox
+    """
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = Outbox(
+                os.environ.get("EXPORT_OUTBOX_PATH", "/var/lib/exporter/export-outbox/outbox.sqlite"),
+                float(os.environ.get("EXPORT_OUTBOX_TIMEOUT", 30)),
+                int(os.environ.get("EXPORT_OUTBOX_MAX_ATTEMPTS", 10)),
+                float(os.environ.get("EXPORT_OUTBOX_BACKOFF_FACTOR", 10)),
+                float(os.environ.get("EXPORT_OUTBOX_BACKOFF_MAX", 3600)),
+            )
+            _outbox.start()
+
+    return _outbox
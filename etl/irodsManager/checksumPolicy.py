@@ -0,0 +1,81 @@
+import abc
+import logging
+import os
+import random
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class ChecksumPolicy(abc.ABC):
+    """
+    Base checksum verification policy: select whether the iRODS checksum of a data object, compared to the uploaded
+    buffer checksum, is the one registered in the catalog or is recomputed by the iRODS server.
+
+    A data object without a registered checksum is always requested to the iRODS server.
+    """
+
+    @abc.abstractmethod
+    def recompute(self, file_obj) -> bool:
+        """
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        bool
+            True, if the iRODS server has to read the replica again to recompute the checksum
+        """
+
+
+class TrustCatalogChecksumPolicy(ChecksumPolicy):
+    """Use the checksum registered in the catalog, the replica is only read by the upload"""
+
+    def recompute(self, file_obj) -> bool:
+        return False
+
+
+class RecomputeChecksumPolicy(ChecksumPolicy):
+    """Always recompute the checksum: detects a replica that doesn't match its registered checksum anymore"""
+
+    def recompute(self, file_obj) -> bool:
+        return True
+
+
+class SampleChecksumPolicy(ChecksumPolicy):
+    """Recompute the checksum of a random sample of the data objects, and use the catalog checksum of the others"""
+
+    def __init__(self, sample_rate=0.1):
+        """
+        Parameters
+        ----------
+        sample_rate: float
+            The ratio of data objects with a recomputed checksum, between 0 and 1
+        """
+        self.sample_rate = sample_rate
+
+    def recompute(self, file_obj) -> bool:
+        return random.random() < self.sample_rate
+
+
+def get_checksum_policy() -> ChecksumPolicy:
+    """
+    Create the checksum verification policy configured with the environment variables:
+        * EXPORT_CHECKSUM_POLICY: trust-catalog (default), recompute or sample
+        * EXPORT_CHECKSUM_SAMPLE_RATE: sample ratio of data objects with a recomputed checksum (default 0.1)
+
+    Returns
+    -------
+    ChecksumPolicy
+        The configured checksum verification policy
+    """
+    policy = os.environ.get("EXPORT_CHECKSUM_POLICY", "trust-catalog").lower()
+
+    if policy == "recompute":
+        return RecomputeChecksumPolicy()
+    if policy == "sample":
+        return SampleChecksumPolicy(float(os.environ.get("EXPORT_CHECKSUM_SAMPLE_RATE", 0.1)))
+    if policy != "trust-catalog":
+        logger.error(f"Unknown EXPORT_CHECKSUM_POLICY '{policy}', fallback to trust-catalog")
+
+    return TrustCatalogChecksumPolicy()
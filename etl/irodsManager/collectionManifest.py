@@ -0,0 +1,179 @@
+import logging
+
+from irods.column import Like
+from irods.models import Collection, DataObject
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class ManifestCollection:
+    """Stand-in for irods.collection.iRODSCollection, only holds the collection path"""
+
+    __slots__ = ("path",)
+
+    def __init__(self, path):
+        self.path = path
+
+
+class ManifestEntry:
+    """
+    A data object of the collection manifest.
+    It has the iRODSDataObject attributes used by the export, without requesting the data object from the catalog.
+    """
+
+    __slots__ = ("session", "collection", "name", "path", "size", "modify_time", "checksum")
+
+    def __init__(self, session, collection, name, size, modify_time=None, checksum=None):
+        """
+        Parameters
+        ----------
+        session: irods.session.iRODSSession
+            The iRODS session used to open the data object
+        collection: ManifestCollection
+            The parent collection
+        name: str
+            The data object name
+        size: int
+            The data object size in bytes
+        modify_time: datetime.datetime
+            The data object modify time
+        checksum: str
+            The checksum stored in the catalog (e.g. 'sha2:...'), None if not calculated yet
+        """
+        self.session = session
+        self.collection = collection
+        self.name = name
+        self.path = f"{collection.path}/{name}"
+        self.size = size
+        self.modify_time = modify_time
+        self.checksum = checksum
+
+    def open(self, mode="r", **options):
+        return self.session.data_objects.open(self.path, mode, **options)
+
+    def chksum(self, **options) -> str:
+        return self.session.data_objects.chksum(self.path, **options)
+
+
+class CollectionManifest:
+    """
+    List of all the data objects under an iRODS collection, built once per export.
+
+    collection.walk() requests the catalog for each sub-collection. The manifest instead requests the whole tree
+    with 2 paged GenQuery calls: the data objects of the collection, and the data objects of its sub-collections.
+    """
+
+    def __init__(self, collection_path, entries):
+        """
+        Parameters
+        ----------
+        collection_path: str
+            The iRODS collection absolute path
+        entries: list[ManifestEntry]
+            The data objects, sorted by path
+        """
+        self.collection_path = collection_path
+        self.entries = entries
+        self.total_size = sum(entry.size for entry in entries)
+        self._entries_by_path = {entry.path: entry for entry in entries}
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, path):
+        return path in self._entries_by_path
+
+    def get(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            The data object absolute path
+
+        Returns
+        -------
+        ManifestEntry
+            The data object, None if not in the manifest
+        """
+        return self._entries_by_path.get(path)
+
+    def under(self, collection_path) -> list:
+        """
+        Parameters
+        ----------
+        collection_path: str
+            A collection absolute path, inside the manifest collection
+
+        Returns
+        -------
+        list[ManifestEntry]
+            The data objects under the collection, recursively
+        """
+        prefix = collection_path.rstrip("/") + "/"
+        return [entry for entry in self.entries if entry.path.startswith(prefix)]
+
+    @classmethod
+    def build(cls, session, collection_path, page_size=None):
+        """
+        Request all the data objects under the collection from the catalog.
+
+        Parameters
+        ----------
+        session: irods.session.iRODSSession
+        collection_path: str
+            The iRODS collection absolute path
+        page_size: int
+            The number of rows per GenQuery page, the python-irodsclient default if None
+
+        Returns
+        -------
+        CollectionManifest
+            The collection manifest
+        """
+        logger.info(f"--\t Build collection manifest {collection_path}")
+        columns = (Collection.name, DataObject.name, DataObject.size, DataObject.modify_time, DataObject.checksum)
+        queries = (
+            session.query(*columns).filter(Collection.name == collection_path),
+            # Like treats '_' as a wildcard, so the paths are checked again below
+            session.query(*columns).filter(Like(Collection.name, f"{collection_path}/%")),
+        )
+
+        collections = {}
+        entries = {}
+        pages = 0
+        for query in queries:
+            if page_size:
+                query = query.limit(page_size)
+            for page in query.get_batches():
+                pages += 1
+                for row in page:
+                    parent_path = row[Collection.name]
+                    if parent_path != collection_path and not parent_path.startswith(collection_path + "/"):
+                        continue
+                    path = f"{parent_path}/{row[DataObject.name]}"
+                    entry = entries.get(path)
+                    # One row per replica: keep the first replica with a checksum
+                    if entry is not None:
+                        if entry.checksum is None and row[DataObject.checksum]:
+                            entry.checksum = row[DataObject.checksum]
+                        continue
+                    if parent_path not in collections:
+                        collections[parent_path] = ManifestCollection(parent_path)
+                    entries[path] = ManifestEntry(
+                        session,
+                        collections[parent_path],
+                        row[DataObject.name],
+                        int(row[DataObject.size]),
+                        row[DataObject.modify_time],
+                        row[DataObject.checksum] or None,
+                    )
+
+        manifest = cls(collection_path, sorted(entries.values(), key=lambda entry: entry.path))
+        logger.info(
+            f"--\t Collection manifest: {len(manifest)} data objects, {manifest.total_size} bytes in {pages} page(s)"
+        )
+
+        return manifest
@@ -0,0 +1,435 @@
+import io
+import logging
+import os
+import queue
+import threading
+
+from etl.metricsManager.exporterMetrics import READ_BUFFER_BYTES
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+BLOCK_SIZE = 1024 * io.DEFAULT_BUFFER_SIZE
+
+
+class ReadAheadReader:
+    """
+    Read a data object block by block on a background thread, up to a fixed number of blocks ahead.
+
+    The iRODS read of the next blocks overlaps the compression, hashing & upload of the current block.
+    The memory is bounded to (depth + 2) blocks: the queued blocks, the block being read by the reader thread and
+    the block being processed by the consumer.
+    """
+
+    def __init__(self, file_buffer, block_size=BLOCK_SIZE, depth=2):
+        """
+        Parameters
+        ----------
+        file_buffer:
+            The opened data object, a file-like object
+        block_size: int
+            The size of the blocks read from the data object
+        depth: int
+            The maximum number of blocks read ahead
+        """
+        self.file_buffer = file_buffer
+        self.block_size = block_size
+        self._queue = queue.Queue(maxsize=depth)
+        self._closed = threading.Event()
+        self._eof = False
+        self._thread = threading.Thread(target=self._read_blocks, name="read-ahead", daemon=True)
+        self._thread.start()
+
+    def read(self, size=None) -> bytes:
+        """
+        Get the next block, waiting for the reader thread if it isn't read yet.
+
+        Parameters
+        ----------
+        size: int
+            Ignored, the blocks have the reader block size
+
+        Returns
+        -------
+        bytes
+            The next block, b'' at the end of the data object
+        """
+        if self._eof:
+            return b""
+        block = self._queue.get()
+        if isinstance(block, Exception):
+            self._eof = True
+            raise block
+        if not block:
+            self._eof = True
+
+        return block
+
+    def close(self):
+        """Stop the reader thread, and close the data object"""
+        self._closed.set()
+        # Unblock the reader thread waiting for a free slot
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+        self.file_buffer.close()
+
+    def _read_blocks(self):
+        try:
+            while not self._closed.is_set():
+                block = self.file_buffer.read(self.block_size)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item):
+        while not self._closed.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+
+class RangedReader:
+    """
+    Read a large data object with several concurrent ranged reads, each one on its own opened data object (and so its
+    own iRODS connection), and hand the blocks over in order.
+
+    The data object is split into blocks, and the streams read the blocks in turn: stream i reads the blocks i,
+    i + streams, i + 2 * streams... A stream only starts a block inside the window of the next blocks to consume, so
+    the memory is bounded to (window + 1) blocks, whatever the data object size.
+    """
+
+    def __init__(self, file_obj, block_size=BLOCK_SIZE, streams=4, window=None):
+        """
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+        block_size: int
+            The size of the blocks read from the data object
+        streams: int
+            The number of concurrent ranged reads
+        window: int
+            The maximum number of blocks read ahead of the consumer, 2 * streams by default
+        """
+        self.file_obj = file_obj
+        self.block_size = block_size
+        self.streams = streams
+        self.window = max(window or 2 * streams, streams)
+        self.block_count = (file_obj.size + block_size - 1) // block_size
+
+        # int: block index => bytes
+        self._blocks = {}
+        self._next_block = 0
+        self._error = None
+        self._closed = False
+        self._condition = threading.Condition()
+        self._threads = [
+            threading.Thread(target=self._read_range, args=(stream,), name=f"ranged-read-{stream}", daemon=True)
+            for stream in range(min(streams, self.block_count))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def read(self, size=None) -> bytes:
+        """
+        Get the next block, waiting for its stream if it isn't read yet.
+
+        Parameters
+        ----------
+        size: int
+            Ignored, the blocks have the reader block size
+
+        Returns
+        -------
+        bytes
+            The next block, b'' at the end of the data object
+        """
+        with self._condition:
+            if self._next_block >= self.block_count:
+                return b""
+            self._condition.wait_for(lambda: self._next_block in self._blocks or self._error is not None)
+            if self._next_block not in self._blocks:
+                raise self._error
+            block = self._blocks.pop(self._next_block)
+            self._next_block += 1
+            self._condition.notify_all()
+
+        return block
+
+    def close(self):
+        """Stop the streams, and close their data objects"""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _read_range(self, stream):
+        file_buffer = None
+        position = 0
+        try:
+            file_buffer = self.file_obj.open("r")
+            for index in range(stream, self.block_count, self.streams):
+                with self._condition:
+                    self._condition.wait_for(lambda: self._closed or index < self._next_block + self.window)
+                    if self._closed:
+                        return
+
+                offset = index * self.block_size
+                if position != offset:
+                    file_buffer.seek(offset)
+                block = self._read_block(file_buffer, min(self.block_size, self.file_obj.size - offset))
+                position = offset + len(block)
+
+                with self._condition:
+                    self._blocks[index] = block
+                    self._condition.notify_all()
+        except Exception as error:
+            with self._condition:
+                self._error = error
+                self._condition.notify_all()
+        finally:
+            if file_buffer is not None:
+                file_buffer.close()
+
+    @staticmethod
+    def _read_block(file_buffer, size) -> bytes:
+        block = file_buffer.read(size)
+        if len(block) == size or not block:
+            return block
+
+        # Short read: read the rest of the block
+        parts = [block]
+        remaining = size - len(block)
+        while remaining > 0:
+            part = file_buffer.read(remaining)
+            if not part:
+                break
+            parts.append(part)
+            remaining -= len(part)
+
+        return b"".join(parts)
+
+
+class ReadBufferBudget:
+    """
+    Hard cap on the memory of the read-ahead & ranged read buffers, shared by all the exports of the process.
+    The other upload buffers (the zip chunks of the request body, the replay chunks of the HTTP session) aren't
+    counted.
+
+    A reader which doesn't fit in the remaining budget isn't waited for: the data object is read synchronously instead,
+    so the uploads never block on each other.
+    """
+
+    def __init__(self, max_bytes):
+        """
+        Parameters
+        ----------
+        max_bytes: int
+            The maximum total size in bytes of the reader buffers
+        """
+        self.max_bytes = max_bytes
+        self.reserved_bytes = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, size) -> bool:
+        """
+        Parameters
+        ----------
+        size: int
+            The reader buffer size in bytes
+
+        Returns
+        -------
+        bool
+            True, if the size was reserved
+        """
+        with self._lock:
+            if self.reserved_bytes + size > self.max_bytes:
+                return False
+            self.reserved_bytes += size
+            READ_BUFFER_BYTES.inc(size)
+
+        return True
+
+    def release(self, size):
+        """
+        Give back the reader buffer size to the budget, once the reader is closed.
+
+        Parameters
+        ----------
+        size: int
+            The reader buffer size in bytes
+        """
+        with self._lock:
+            self.reserved_bytes -= size
+            READ_BUFFER_BYTES.dec(size)
+
+
+class BudgetedReader:
+    """Release the buffer size reserved by a reader when it is closed"""
+
+    def __init__(self, reader, budget, size):
+        """
+        Parameters
+        ----------
+        reader: RangedReader | ReadAheadReader
+            The opened reader
+        budget: ReadBufferBudget
+            The budget the reader buffer size was reserved from
+        size: int
+            The reserved size in bytes
+        """
+        self.reader = reader
+        self.budget = budget
+        self.size = size
+        self._closed = False
+
+    def read(self, size=None) -> bytes:
+        return self.reader.read(size)
+
+    def close(self):
+        try:
+            self.reader.close()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self.budget.release(self.size)
+
+
+class ReadPolicy:
+    """
+    Select how the data objects are read by the zip generator:
+        * small data objects, in a single block: read synchronously
+        * large data objects, above ranged_read_min_size: several concurrent ranged reads, see RangedReader
+        * the others: a single stream read ahead on a background thread, see ReadAheadReader
+    """
+
+    def __init__(
+        self,
+        block_size=BLOCK_SIZE,
+        read_ahead_blocks=0,
+        ranged_read_streams=1,
+        ranged_read_min_size=None,
+        buffer_budget=None,
+    ):
+        """
+        Parameters
+        ----------
+        block_size: int
+            The size of the blocks read from the data objects
+        read_ahead_blocks: int
+            The maximum number of blocks read ahead, 0 to read the data objects synchronously
+        ranged_read_streams: int
+            The number of concurrent ranged reads of a large data object, 1 to disable the ranged reads
+        ranged_read_min_size: int
+            The minimum data object size in bytes to use ranged reads, None to disable the ranged reads
+        buffer_budget: ReadBufferBudget
+            The cap on the reader buffers, None for no cap
+        """
+        self.block_size = block_size
+        self.read_ahead_blocks = read_ahead_blocks
+        self.ranged_read_streams = ranged_read_streams
+        self.ranged_read_min_size = ranged_read_min_size
+        self.buffer_budget = buffer_budget
+
+    def open(self, file_obj):
+        """
+        Open the data object for reading. Without room left in the buffer budget, the data object is read
+        synchronously.
+
+        Parameters
+        ----------
+        file_obj: irods.data_object.iRODSDataObject
+
+        Returns
+        -------
+        BudgetedReader | RangedReader | ReadAheadReader | file-like object
+            The opened data object, read by block_size blocks
+        """
+        if (
+            self.ranged_read_streams > 1
+            and self.ranged_read_min_size is not None
+            and file_obj.size >= self.ranged_read_min_size
+        ):
+            window = self.ranged_read_streams + self.read_ahead_blocks
+            size = (window + 1) * self.block_size
+            if self._reserve(file_obj, size):
+                logger.debug(f"{'--':<20}Ranged read {file_obj.path}: {self.ranged_read_streams} streams")
+                return self._budgeted(RangedReader(file_obj, self.block_size, self.ranged_read_streams, window), size)
+
+            return file_obj.open("r")
+
+        file_buffer = file_obj.open("r")
+        if self.read_ahead_blocks > 0 and file_obj.size > self.block_size:
+            size = (self.read_ahead_blocks + 2) * self.block_size
+            if self._reserve(file_obj, size):
+                return self._budgeted(ReadAheadReader(file_buffer, self.block_size, self.read_ahead_blocks), size)
+
+        return file_buffer
+
+    def _reserve(self, file_obj, size) -> bool:
+        if self.buffer_budget is None or self.buffer_budget.try_acquire(size):
+            return True
+
+        logger.debug(f"{'--':<20}Read buffer budget exhausted, synchronous read {file_obj.path}")
+        return False
+
+    def _budgeted(self, reader, size):
+        if self.buffer_budget is None:
+            return reader
+
+        return BudgetedReader(reader, self.buffer_budget, size)
+
+
+_read_buffer_budget = None
+_read_buffer_budget_lock = threading.Lock()
+
+
+def get_read_buffer_budget() -> ReadBufferBudget:
+    """
+    Get the process-wide read buffer budget, configured with the environment variable:
+        * EXPORT_READ_BUFFER_MAX_BYTES: the maximum total size of the read-ahead & ranged read buffers (default 512 MB)
+
+    Returns
+    -------
+    ReadBufferBudget
+        The shared read buffer budget
+    """
+    global _read_buffer_budget
+    with _read_buffer_budget_lock:
+        if _read_buffer_budget is None:
+            _read_buffer_budget = ReadBufferBudget(int(os.environ.get("EXPORT_READ_BUFFER_MAX_BYTES", 512 * 1024**2)))
+
+    return _read_buffer_budget
+
+
+def get_read_policy() -> ReadPolicy:
+    """
+    Create the data object read policy configured with the environment variables:
+        * EXPORT_READ_BLOCK_SIZE: the size of the blocks read from the data objects (default 8 MB)
+        * EXPORT_READ_AHEAD_BLOCKS: the number of blocks read ahead per data object (default 2), 0 to disable
+        * EXPORT_RANGED_READ_STREAMS: the number of concurrent ranged reads of a large data object (default 4),
+          1 to disable. Each stream opens its own iRODS connection.
+        * EXPORT_RANGED_READ_MIN_SIZE: the minimum data object size in bytes to use ranged reads (default 1 GB)
+
+    The reader buffers are capped by the process-wide read buffer budget, see get_read_buffer_budget.
+
+    Returns
+    -------
+    ReadPolicy
+        The configured read policy
+    """
+    return ReadPolicy(
+        int(os.environ.get("EXPORT_READ_BLOCK_SIZE", BLOCK_SIZE)),
+        int(os.environ.get("EXPORT_READ_AHEAD_BLOCKS", 2)),
+        int(os.environ.get("EXPORT_RANGED_READ_STREAMS", 4)),
+        int(os.environ.get("EXPORT_RANGED_READ_MIN_SIZE", 1024**3)),
+        get_read_buffer_budget(),
+    )
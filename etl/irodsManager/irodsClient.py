@@ -1,9 +1,14 @@
 from irods.exception import iRODSException
+from irods.meta import AVUOperation, iRODSMeta
 import logging
+import threading
+import time
 
-from irodsrulewrapper.rule import RuleManager
-
+from etl.irodsManager.collectionManifest import CollectionManifest
+from etl.irodsManager.irodsSessionPool import get_irods_session_pool
 from etl.irodsManager.irodsUtils import CollectionAVU, ExporterState, submit_service_desk_ticket
+from etl.metricsManager.exporterMetrics import STAGE_DURATION, get_stage_label
+from etl.rabbitmqManager.eventPublisher import get_exporter_state_routing_key, get_event_publisher
 
 logger = logging.getLogger("iRODS to Dataverse")
 
@@ -13,6 +18,7 @@ class irodsClient:
 
     def __init__(self, host=None, user=None, password=None):
         self.collection_object = None
+        self.manifest = None
         self.project_id = None
         self.collection_id = None
 
@@ -22,6 +28,15 @@ class irodsClient:
 
         self.rule_manager = None
         self.session = None
+        # Serialize the status AVU updates, sent by the upload workers
+        self.status_lock = threading.Lock()
+        # The current exporterState stage & its time.monotonic() start, for the stage duration metric
+        self.stage = None
+        self.stage_start = None
+        # The exporterState transitions are also published as events, for the frontends to subscribe to
+        self.event_publisher = get_event_publisher()
+        # True, once an error status was reported: the failed export isn't requeued
+        self.error_reported = False
         self.config = {
             "IRODS_HOST": host,
             "IRODS_USER": user,
@@ -32,16 +47,31 @@ class irodsClient:
     def __del__(self):
         # iRODSSession's reference count is always > 0 due to circular
         # references.  Therefore, losing all local references to it doesn't
-        # imply that its  __del__() method and subsequent .cleanup() will be
-        # called.
-        if self.session:
-            self.session.cleanup()
+        # imply that the session is returned to the pool.
+        self.release()
 
     def connect(self):
-        logger.info("--\t Connect to iRODS")
-        self.rule_manager = RuleManager(admin_mode=True, config=self.config)
+        """Borrow a RuleManager and its iRODS session from the process-wide session pool"""
+        self.rule_manager = get_irods_session_pool(self.config).borrow()
         self.session = self.rule_manager.session
 
+    def release(self, discard=False):
+        """
+        Return the RuleManager and its iRODS session to the process-wide session pool.
+
+        Parameters
+        ----------
+        discard: bool
+            If True, close the iRODS session instead of keeping it in the pool (e.g. after a failure)
+        """
+        if self.rule_manager is None:
+            return
+
+        self._observe_stage(None)
+        get_irods_session_pool(self.config).release(self.rule_manager, discard)
+        self.rule_manager = None
+        self.session = None
+
     def prepare(self, project_id, collection_id, repository):
         self.project_id = project_id
         self.collection_id = collection_id
@@ -56,6 +86,21 @@ class irodsClient:
 
         self.update_metadata_status(ExporterState.ATTRIBUTE.value, ExporterState.IN_QUEUE_FOR_EXPORT.value)
 
+    def get_collection_manifest(self) -> CollectionManifest:
+        """
+        Get the manifest of all the data objects under the collection, built on the first call.
+        It is shared by the restrict list expansion, the uploads and the progress report of the export.
+
+        Returns
+        -------
+        CollectionManifest
+            The collection manifest
+        """
+        if self.manifest is None:
+            self.manifest = CollectionManifest.build(self.session, self.collection_object.path)
+
+        return self.manifest
+
     def read_collection_metadata(self, project_id, collection_id):
         logger.info("--\t Read collection AVU")
         for x in self.collection_object.metadata.items():
@@ -65,14 +110,110 @@ class irodsClient:
         instance = self.rule_manager.read_instance_from_collection(project_id, collection_id)
         self.instance = self.rule_manager.parse_general_instance(instance)
 
-    def update_metadata_status(self, attribute, value):
+    def update_metadata_status(self, attribute, value, progress=None):
+        """
+        Parameters
+        ----------
+        attribute: str
+            The process attribute
+        value: str
+            The new value to set
+        progress: dict
+            The upload progress, only published in the event, see etl.irodsManager.statusReporter.StatusReporter
+        """
+        new_status = f"{self.repository}:{value}"
+        with self.status_lock:
+            self.rule_manager.set_collection_avu(self.collection_object.path, attribute, new_status)
+            self._observe_stage(value)
+            self._publish_state(value, progress=progress)
+
+    def _observe_stage(self, value):
+        """
+        Observe the duration of the current stage, if the new status value starts another stage.
+
+        Parameters
+        ----------
+        value: str
+            The new status value, None at the end of the export
+        """
+        stage = None if value is None else get_stage_label(value)
+        if stage == self.stage:
+            return
+
+        now = time.monotonic()
+        if self.stage is not None:
+            STAGE_DURATION.labels(self.stage).observe(now - self.stage_start)
+        self.stage = stage
+        self.stage_start = now
+
+    def update_metadata_status_atomic(self, attribute, value, avus=()):
+        """
+        Replace the status AVU value, and add the other AVUs, in a single atomic operation.
+
+        Parameters
+        ----------
+        attribute: str
+            The process attribute
+        value: str
+            The new value to set
+        avus: iterable[tuple]
+            The (attribute, value, unit) of the AVUs to add with the new status, skipped if already present
+
+        Returns
+        -------
+        bool
+            True, if the new status was also queued as an event
+        """
         new_status = f"{self.repository}:{value}"
-        self.rule_manager.set_collection_avu(self.collection_object.path, attribute, new_status)
+        with self.status_lock:
+            # Call the metadata to read the current AVUs: the status AVU is also set by the rules
+            metadata = self.collection_object.metadata()
+            operations = [AVUOperation(operation="remove", avu=avu) for avu in metadata.get_all(attribute)]
+            operations.append(AVUOperation(operation="add", avu=iRODSMeta(attribute, new_status)))
+            for key, avu_value, unit in avus:
+                if not any(avu.value == avu_value and avu.units == unit for avu in metadata.get_all(key)):
+                    operations.append(AVUOperation(operation="add", avu=iRODSMeta(key, avu_value, unit)))
+            metadata.apply_atomic_operations(*operations)
+            self._observe_stage(value)
+            return self._publish_state(value, avus)
+
+    def _publish_state(self, value, avus=(), progress=None) -> bool:
+        """
+        Publish the exporterState transition, once the AVU is written, with the routing key of its stage.
+
+        Parameters
+        ----------
+        value: str
+            The new status value, without the repository prefix. None when the status AVUs are cleared.
+        avus: iterable[tuple]
+            The (attribute, value, unit) of the AVUs added with the new status
+        progress: dict
+            The upload progress, None outside the upload stage
+
+        Returns
+        -------
+        bool
+            True, if the event was queued. False, if it was dropped or the events are disabled.
+        """
+        state = "cleared" if value is None else get_stage_label(value)
+        return self.event_publisher.publish(
+            get_exporter_state_routing_key(state),
+            {
+                "project": self.project_id,
+                "collection": self.collection_id,
+                "repository": self.repository,
+                "state": state,
+                "status": value,
+                "metadata": {attribute: avu_value for attribute, avu_value, _ in avus},
+                "progress": progress,
+                "timestamp": time.time(),
+            },
+        )
 
     def set_error_status(self, attribute, value, depositor, destination, error_message):
         """
         Update the state AVU to an error status.
-        Then, create a ticket to jira the service desk to report the error.
+        Then, queue a ticket to the jira service desk in the outbox, to report the error.
 
         Parameters
         ----------
@@ -87,6 +228,7 @@ class irodsClient:
         error_message: str
             Some context on what trigger the error
         """
+        self.error_reported = True
         try:
             self.update_metadata_status(attribute, value)
         except iRODSException as error:
@@ -119,10 +261,20 @@ class irodsClient:
         logger.error("An error occurred during the upload")
         logger.error("Clean up exporterState AVU")
 
-        # exporter client crashed, clean all exporterState AVUs
-        for state in ExporterState:
-            new_status = f"{repository}:{state.value}"
-            self.remove_metadata(ExporterState.ATTRIBUTE.value, new_status)
+        # exporter client crashed, clean all exporterState AVUs in a single atomic operation
+        try:
+            with self.status_lock:
+                metadata = self.collection_object.metadata()
+                operations = [
+                    AVUOperation(operation="remove", avu=avu)
+                    for avu in metadata.get_all(ExporterState.ATTRIBUTE.value)
+                    if avu.value.startswith(f"{repository}:")
+                ]
+                if operations:
+                    metadata.apply_atomic_operations(*operations)
+                self._publish_state(None)
+        except iRODSException as error:
+            logger.error(f"{ExporterState.ATTRIBUTE.value} cleanup failed: {error}")
 
         logger.error("Call rule closeProjectCollection")
         self.rule_manager.close_project_collection(self.project_id, self.collection_id)
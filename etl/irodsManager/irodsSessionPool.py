@@ -0,0 +1,169 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from irodsrulewrapper.rule import RuleManager
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class IrodsSessionPool:
+    """
+    Process-wide pool of iRODS sessions, reused across the exports.
+
+    Opening an iRODS session (SSL negotiation & authentication) is expensive compared to a short export.
+    So the RuleManager (and its iRODS session) is returned to the pool at the end of an export, instead of being
+    cleaned up, and borrowed again by the next export:
+        * an idle session is closed after max_idle_time seconds
+        * a session is checked before being borrowed, and replaced by a new session if the check fails
+        * a session returned after a failure is closed, the next export reconnects
+    """
+
+    def __init__(self, config, max_size=2, max_idle_time=600):
+        """
+        Parameters
+        ----------
+        config: dict
+            The RuleManager iRODS configuration
+        max_size: int
+            The maximum number of idle sessions kept in the pool
+        max_idle_time: float
+            The maximum number of seconds a session stays idle in the pool
+        """
+        self.config = config
+        self.max_size = max_size
+        self.max_idle_time = max_idle_time
+
+        # (RuleManager, time.monotonic() when it was returned), the most recently returned last
+        self._idle = deque()
+        self._lock = threading.Lock()
+
+    def borrow(self) -> RuleManager:
+        """
+        Borrow a healthy RuleManager from the pool, or create a new one.
+
+        Returns
+        -------
+        RuleManager
+            A RuleManager in admin mode with an active iRODS session
+        """
+        expired = []
+        rule_manager = None
+        with self._lock:
+            now = time.monotonic()
+            while self._idle:
+                candidate, returned_at = self._idle.pop()
+                if now - returned_at > self.max_idle_time:
+                    expired.append(candidate)
+                else:
+                    rule_manager = candidate
+                    break
+            # The sessions are returned in order, so the remaining older sessions are expired too
+            while self._idle and now - self._idle[0][1] > self.max_idle_time:
+                expired.append(self._idle.popleft()[0])
+
+        for candidate in expired:
+            logger.info("--\t Close idle iRODS session")
+            self._cleanup(candidate)
+
+        if rule_manager is not None:
+            if self._is_healthy(rule_manager):
+                logger.info("--\t Reuse iRODS session")
+                return rule_manager
+            logger.warning("--\t iRODS session health check failed, reconnect")
+            self._cleanup(rule_manager)
+
+        logger.info("--\t Connect to iRODS")
+        return RuleManager(admin_mode=True, config=self.config)
+
+    def release(self, rule_manager, discard=False):
+        """
+        Return the RuleManager to the pool.
+
+        Parameters
+        ----------
+        rule_manager: RuleManager
+            The borrowed RuleManager
+        discard: bool
+            If True, close the iRODS session instead of keeping it in the pool (e.g. after a failure)
+        """
+        if not discard:
+            with self._lock:
+                if len(self._idle) < self.max_size:
+                    self._idle.append((rule_manager, time.monotonic()))
+                    return
+
+        self._cleanup(rule_manager)
+
+    def close(self):
+        """Close all the idle iRODS sessions"""
+        with self._lock:
+            idle = [rule_manager for rule_manager, _ in self._idle]
+            self._idle.clear()
+
+        for rule_manager in idle:
+            self._cleanup(rule_manager)
+
+    @staticmethod
+    def _is_healthy(rule_manager) -> bool:
+        """
+        Check the iRODS session with a cheap catalog query.
+
+        Parameters
+        ----------
+        rule_manager: RuleManager
+
+        Returns
+        -------
+        bool
+            True, if the iRODS server answered
+        """
+        session = rule_manager.session
+        try:
+            session.collections.exists(f"/{session.zone}")
+        except Exception as error:
+            logger.warning(f"--\t iRODS session health check: {error}")
+            return False
+
+        return True
+
+    @staticmethod
+    def _cleanup(rule_manager):
+        try:
+            rule_manager.session.cleanup()
+        except Exception as error:
+            logger.warning(f"--\t iRODS session cleanup failed: {error}")
+
+
+_session_pools = {}
+_session_pools_lock = threading.Lock()
+
+
+def get_irods_session_pool(config) -> IrodsSessionPool:
+    """
+    Get the process-wide iRODS session pool for the iRODS host & user, configured with the environment variables:
+        * IRODS_SESSION_POOL_SIZE: maximum number of idle sessions kept in the pool (default EXPORT_CONCURRENCY)
+        * IRODS_SESSION_MAX_IDLE: maximum number of seconds a session stays idle in the pool (default 600)
+
+    Parameters
+    ----------
+    config: dict
+        The RuleManager iRODS configuration
+
+    Returns
+    -------
+    IrodsSessionPool
+        The shared iRODS session pool
+    """
+    key = (config["IRODS_HOST"], config["IRODS_USER"])
+    with _session_pools_lock:
+        if key not in _session_pools:
+            _session_pools[key] = IrodsSessionPool(
+                config,
+                max_size=int(os.environ.get("IRODS_SESSION_POOL_SIZE", os.environ.get("EXPORT_CONCURRENCY", 1))),
+                max_idle_time=float(os.environ.get("IRODS_SESSION_MAX_IDLE", 600)),
+            )
+
+        return _session_pools[key]
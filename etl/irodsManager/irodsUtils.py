@@ -1,15 +1,20 @@
 import base64
 import binascii
-import requests
 import os
 import logging
 from datetime import datetime
 from enum import Enum
+from http import HTTPStatus
+
+import irods.keywords as kw
+
+from etl.httpManager.httpSession import RETRY_STATUS_CODES, get_http_session
+from etl.httpManager.outbox import DeliveryError, get_outbox, outbox_handler
 
 logger = logging.getLogger("iRODS to Dataverse")
 
 
-def get_irods_data_object_checksum_value(file_obj) -> str:
+def get_irods_data_object_checksum_value(file_obj, force=False) -> str:
     """
     Request the IRODS data object checksum value.
     iRODS checksums are the base64 encoded sha256 checksum, therefore need to be decoded before returning it.
@@ -18,23 +23,49 @@ def get_irods_data_object_checksum_value(file_obj) -> str:
     Parameters
     ----------
     file_obj: irods.data_object.iRODSDataObject
+    force: bool
+        If True, the iRODS server reads the replica again to recompute the checksum, even if one is registered
+
+    Returns
+    -------
+    str
+        SHA256 checksum value
+    """
+    if force:
+        checksum = file_obj.chksum(**{kw.FORCE_CHKSUM_KW: ""})
+    else:
+        checksum = file_obj.chksum()
+
+    return decode_irods_checksum(checksum)
+
+
+def decode_irods_checksum(checksum) -> str:
+    """
+    Decode an iRODS checksum value.
+
+    Parameters
+    ----------
+    checksum: str
+        The iRODS checksum value, 'sha2:' followed by the base64 encoded sha256 digest
 
     Returns
     -------
     str
         SHA256 checksum value
     """
-    checksum = file_obj.chksum()
     trim_checksum = checksum.replace("sha2:", "")
     base_hash = base64.b64decode(trim_checksum)
 
     return binascii.hexlify(base_hash).decode("utf-8")
 
 
+SERVICE_DESK_TICKET = "service-desk-ticket"
+
+
 def submit_service_desk_ticket(email, description, error_message):
     """
-    Submit an automated support request to the Jira Service Desk Cloud instance through
-    our help center backend.
+    Queue an automated support request to the Jira Service Desk Cloud instance in the outbox.
+    The request is sent to our help center backend by the outbox dispatcher, see deliver_service_desk_ticket.
 
     Parameters
     ----------
@@ -45,12 +76,6 @@ def submit_service_desk_ticket(email, description, error_message):
     error_message: str
         Error message to display in Jira Service Desk
     """
-    # Get the Help Center Backend url
-    help_center_backend_base = os.environ.get("HC_BACKEND_URL")
-    help_center_request_endpoint = "{}/help_backend/submit_request/automated_process_support".format(
-        help_center_backend_base
-    )
-
     error_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     request_json = {
@@ -59,20 +84,39 @@ def submit_service_desk_ticket(email, description, error_message):
         "error_timestamp": error_timestamp,
         "error_message": error_message,
     }
+    get_outbox().put(SERVICE_DESK_TICKET, request_json)
 
-    try:
-        response = requests.post(
-            help_center_request_endpoint,
-            json=request_json,
-        )
-        if response.ok:
-            issue_key = response.json()["issueKey"]
-            logger.error(f"{'--':<20}Support ticket '{issue_key}' created after process error")
 
-        else:
-            logger.error(f"{'--':<20}Response Help center backend not HTTP OK: '{response.status_code}'")
-    except requests.exceptions.RequestException as e:
-        logger.error(f"{'--':<20}Exception while requesting Support ticket after process error '{e}'")
+@outbox_handler(SERVICE_DESK_TICKET)
+def deliver_service_desk_ticket(request_json, timeout):
+    """
+    Submit an automated support request through our help center backend, run by the outbox dispatcher.
+
+    Parameters
+    ----------
+    request_json: dict
+        The support request, see submit_service_desk_ticket
+    timeout: float
+        The request timeout in seconds
+    """
+    # Get the Help Center Backend url
+    help_center_backend_base = os.environ.get("HC_BACKEND_URL")
+    help_center_request_endpoint = "{}/help_backend/submit_request/automated_process_support".format(
+        help_center_backend_base
+    )
+
+    response = get_http_session().post(help_center_request_endpoint, json=request_json, timeout=timeout)
+    if HTTPStatus.OK.value <= response.status_code < HTTPStatus.MULTIPLE_CHOICES.value:
+        # The ticket is created: an unexpected response body must not send it again
+        try:
+            issue_key = response.json()["issueKey"]
+        except (KeyError, TypeError, ValueError):
+            issue_key = "unknown"
+        logger.error(f"{'--':<20}Support ticket '{issue_key}' created after process error")
+    elif response.status_code in RETRY_STATUS_CODES:
+        raise DeliveryError(f"Response Help center backend not HTTP OK: '{response.status_code}'")
+    else:
+        logger.error(f"{'--':<20}Response Help center backend not HTTP OK: '{response.status_code}'")
 
 
 class ExporterState(Enum):
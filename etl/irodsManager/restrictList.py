@@ -0,0 +1,99 @@
+import logging
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+PROJECTS_PATH = "/nlmumc/projects/"
+
+
+class RestrictList:
+    """
+    Index of the user files selection for a selective export.
+
+    The selected files are stored in a hashed set, and the selected folders in a prefix trie of path components.
+    So a file is matched in O(path depth), whatever the selection size, and the folders are never enumerated.
+    """
+
+    # Marks a trie node as a selected folder
+    _SELECTED = object()
+
+    def __init__(self, files=(), folders=()):
+        """
+        Parameters
+        ----------
+        files: iterable[str]
+            The selected files paths, relative to /nlmumc/projects/
+        folders: iterable[str]
+            The selected folders paths, relative to /nlmumc/projects/
+        """
+        self.files = set(files)
+        self.folders = {}
+        self.folders_count = 0
+        for folder in folders:
+            self.add_folder(folder)
+
+    def __len__(self):
+        return len(self.files) + self.folders_count
+
+    def __contains__(self, path):
+        """
+        Parameters
+        ----------
+        path: str
+            A file path, relative to /nlmumc/projects/
+
+        Returns
+        -------
+        bool
+            True, if the file is selected or is under a selected folder
+        """
+        if path in self.files:
+            return True
+
+        node = self.folders
+        for component in path.split("/"):
+            node = node.get(component)
+            if node is None:
+                return False
+            if self._SELECTED in node:
+                return True
+
+        return False
+
+    def add_folder(self, folder):
+        node = self.folders
+        for component in folder.strip("/").split("/"):
+            node = node.setdefault(component, {})
+        if self._SELECTED not in node:
+            node[self._SELECTED] = True
+            self.folders_count += 1
+
+    @classmethod
+    def parse(cls, selected_list, manifest):
+        """
+        Parse the selection sent by the export request.
+
+        Parameters
+        ----------
+        selected_list: str
+            The ",\t" separated selected paths, relative to /nlmumc/projects/
+        manifest: etl.irodsManager.collectionManifest.CollectionManifest
+            The collection manifest, to tell the selected files from the selected folders
+
+        Returns
+        -------
+        RestrictList
+            The indexed selection, empty if nothing was selected
+        """
+        restrict_list = cls()
+        if not selected_list:
+            return restrict_list
+
+        for path in selected_list.split(",\t"):
+            if PROJECTS_PATH + path in manifest:
+                restrict_list.files.add(path)
+            else:
+                restrict_list.add_folder(path)
+
+        logger.info(f"--\t Restrict list: {len(restrict_list.files)} files, {restrict_list.folders_count} folders")
+
+        return restrict_list
@@ -0,0 +1,117 @@
+import logging
+import threading
+import time
+
+from irods.exception import iRODSException
+
+from etl.irodsManager.irodsUtils import ExporterState
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+
+class StatusReporter:
+    """
+    Report the upload progress in the exporterState AVU, coalesced to at most one update per interval.
+
+    Each exporterState update is a rule round trip: with many small files, reporting every upload would cost about
+    as much as the uploads. The progress is kept in memory, and written only if the interval has elapsed since the
+    previous update. The next export stage status replaces the last progress update anyway.
+
+    The AVU value keeps its 'uploading file - <name>' format, as expected by the AVU readers. The files & bytes
+    counts are published in the progress of the exporterState event, and logged.
+    """
+
+    def __init__(self, irods_client, interval=10.0):
+        """
+        Parameters
+        ----------
+        irods_client: etl.irodsManager.irodsClient.irodsClient
+        interval: float
+            The minimum number of seconds between two progress updates
+        """
+        self.irods_client = irods_client
+        self.interval = interval
+
+        self.current_file = ""
+        self.files_done = 0
+        self.files_total = 0
+        self.bytes_done = 0
+        self.bytes_total = 0
+
+        self._last_update = None
+        self._lock = threading.Lock()
+
+    def start(self, files_total, bytes_total, files_done=0):
+        """
+        Parameters
+        ----------
+        files_total: int
+            The number of files to export
+        bytes_total: int
+            The number of bytes to upload
+        files_done: int
+            The number of files already exported, by a previous attempt of the export
+        """
+        with self._lock:
+            self.files_total = files_total
+            self.bytes_total = bytes_total
+            self.files_done = files_done
+            self.bytes_done = 0
+
+    def uploading(self, file_name):
+        """
+        Parameters
+        ----------
+        file_name: str
+            The name of the file being uploaded
+        """
+        with self._lock:
+            self.current_file = file_name
+            self._report()
+
+    def progress(self, files, size):
+        """
+        Parameters
+        ----------
+        files: int
+            The number of files just validated
+        size: int
+            The number of bytes just uploaded, validated or not
+        """
+        with self._lock:
+            self.files_done += files
+            self.bytes_done += size
+            self._report()
+
+    @property
+    def status(self) -> str:
+        return ExporterState.UPLOADING_FILE.value.format(self.current_file)
+
+    @property
+    def progress_counts(self) -> dict:
+        return {
+            "files_done": self.files_done,
+            "files_total": self.files_total,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+        }
+
+    def _report(self):
+        now = time.monotonic()
+        if self._last_update is not None and now - self._last_update < self.interval:
+            return
+
+        self._write()
+
+    def _write(self):
+        self._last_update = time.monotonic()
+        logger.info(
+            f"{'--':<20}{self.status} ({self.files_done}/{self.files_total} files,"
+            f" {self.bytes_done}/{self.bytes_total} bytes)"
+        )
+        try:
+            self.irods_client.update_metadata_status(
+                ExporterState.ATTRIBUTE.value, self.status, progress=self.progress_counts
+            )
+        except iRODSException as error:
+            logger.error(f"{'--':<20}update_metadata_status failed: {error}")
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# The pipeline stages recorded in the trace
+IRODS_READ = "irods_read"
+COMPRESS = "compress"
+SHA256 = "sha256"
+MD5 = "md5"
+NETWORK = "network"
+
+
+class StageTimes:
+    """Cumulative wall & CPU time of a pipeline stage"""
+
+    __slots__ = ("wall", "cpu", "count")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.count = 0
+
+    def to_json(self) -> dict:
+        return {"wall_seconds": round(self.wall, 6), "cpu_seconds": round(self.cpu, 6), "count": self.count}
+
+
+class ExportProfiler:
+    """
+    Record the cumulative wall & CPU time of the zip/upload pipeline stages, per file and per export.
+
+    The stages are interleaved in the upload workers: for each chunk, the iRODS read and the compression run in the
+    zip generator, then requests sends the chunk. The CPU time is the time of the thread running the stage, so the
+    network stage CPU time is the time spent by requests & urllib3 sending the chunk. The hashing runs on the hashing
+    threads, in parallel with the compression, and the iRODS read stage is the time spent waiting for the read-ahead
+    threads, if enabled.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._start = time.perf_counter()
+        # str: file path => str: stage => StageTimes
+        self._files = defaultdict(lambda: defaultdict(StageTimes))
+        self._lock = threading.Lock()
+        # The file being streamed by each upload worker thread
+        self._local = threading.local()
+
+    def set_current_file(self, file_path):
+        self._local.file_path = file_path
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Record the wall & CPU time of the block, for the current file of the thread.
+
+        Parameters
+        ----------
+        stage: str
+            The pipeline stage
+        """
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            file_path = getattr(self._local, "file_path", None)
+            with self._lock:
+                times = self._files[file_path][stage]
+                times.wall += wall
+                times.cpu += cpu
+                times.count += 1
+
+    def to_json(self) -> dict:
+        totals = defaultdict(StageTimes)
+        files = {}
+        with self._lock:
+            for file_path, stages in self._files.items():
+                for stage, times in stages.items():
+                    total = totals[stage]
+                    total.wall += times.wall
+                    total.cpu += times.cpu
+                    total.count += times.count
+                files[file_path] = {stage: times.to_json() for stage, times in stages.items()}
+
+        return {
+            "started_at": self.started_at.isoformat(),
+            "wall_seconds": round(time.perf_counter() - self._start, 6),
+            "stages": {stage: times.to_json() for stage, times in totals.items()},
+            "files": files,
+        }
+
+    def write(self, directory, name, **context):
+        """
+        Write the JSON trace.
+
+        Parameters
+        ----------
+        directory: str
+            The trace directory
+        name: str
+            The trace file name prefix
+        context:
+            Extra values added to the trace (e.g. the dataset PID)
+        """
+        trace = {**context, **self.to_json()}
+        path = os.path.join(directory, f"{name}_{self.started_at.strftime('%Y%m%dT%H%M%S')}.json")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(trace, f, indent=2)
+        except OSError as error:
+            logger.error(f"{'--':<10}Write profiling trace failed: {error}")
+            return
+
+        logger.info(f"{'--':<10}Profiling trace: {path}")
+
+
+class DisabledExportProfiler:
+    """Profiler used when the profiling is disabled: the spans cost a single function call"""
+
+    enabled = False
+
+    def set_current_file(self, file_path):
+        pass
+
+    def span(self, stage):
+        return nullcontext()
+
+    def write(self, directory, name, **context):
+        pass
+
+
+def get_export_profiler():
+    """
+    Create the profiler of an export. The profiling is enabled, at the start of each export, if:
+        * the environment variable EXPORT_PROFILING is set to 1
+        * or the file EXPORT_PROFILING_FLAG (default /tmp/exporter-profiling.enabled) exists: the profiling can be
+          switched on & off in a running worker, with 'touch' & 'rm'
+
+    Returns
+    -------
+    ExportProfiler | DisabledExportProfiler
+        The export profiler
+    """
+    flag = os.environ.get("EXPORT_PROFILING_FLAG", "/tmp/exporter-profiling.enabled")
+    if os.environ.get("EXPORT_PROFILING") == "1" or os.path.exists(flag):
+        return ExportProfiler()
+
+    return DisabledExportProfiler()
@@ -0,0 +1,104 @@
+import logging
+import os
+
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+# Bucket boundaries in seconds, from a small file upload to a multi-hour export
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400)
+RATIO_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0, 1.05)
+
+IRODS_READ_BYTES = Counter("exporter_irods_read_bytes", "Bytes read from the iRODS data objects")
+DATAVERSE_SENT_BYTES = Counter("exporter_dataverse_sent_bytes", "Bytes of the upload request bodies sent to Dataverse")
+UPLOAD_DURATION = Histogram(
+    "exporter_upload_duration_seconds",
+    "Duration of an upload request, from the first body byte to the Dataverse response",
+    ["files"],
+    buckets=DURATION_BUCKETS,
+)
+COMPRESSION_RATIO = Histogram(
+    "exporter_compression_ratio",
+    "Compressed size divided by the file size, per zip entry",
+    ["method"],
+    buckets=RATIO_BUCKETS,
+)
+HTTP_RESPONSES = Counter("exporter_http_responses", "HTTP responses received", ["host", "method", "status"])
+EXPORTS_IN_FLIGHT = Gauge("exporter_exports_in_flight", "Number of exports running")
+MESSAGE_AGE = Histogram(
+    "exporter_message_age_seconds",
+    "Age of the export request message when the export starts, from its publication timestamp",
+    buckets=DURATION_BUCKETS,
+)
+QUEUE_WAIT = Histogram(
+    "exporter_queue_wait_seconds",
+    "Time between the message delivery and the export start, waiting for a free export worker",
+    buckets=DURATION_BUCKETS,
+)
+STAGE_DURATION = Histogram(
+    "exporter_stage_duration_seconds",
+    "Time spent per exporterState stage",
+    ["stage"],
+    buckets=DURATION_BUCKETS,
+)
+PIPELINE_QUEUE_DEPTH = Gauge(
+    "exporter_pipeline_queue_depth",
+    "Number of bundles waiting in the input queue of an export pipeline stage (upload, validate)",
+    ["stage"],
+)
+PIPELINE_BUSY_WORKERS = Gauge(
+    "exporter_pipeline_busy_workers",
+    "Number of export pipeline stage workers handling a bundle (upload, validate)",
+    ["stage"],
+)
+READ_BUFFER_BYTES = Gauge(
+    "exporter_read_buffer_bytes", "Bytes reserved by the read-ahead & ranged read buffers of the data objects"
+)
+OUTBOX_PENDING = Gauge("exporter_outbox_pending", "Number of outbox messages waiting to be delivered")
+OUTBOX_DELIVERIES = Counter(
+    "exporter_outbox_deliveries", "Outbox message delivery attempts, per message kind & result", ["kind", "result"]
+)
+EVENTS_PUBLISHED = Counter("exporter_events_published", "exporterState events, per publication result", ["result"])
+
+
+def get_upload_files_label(files) -> str:
+    """
+    Parameters
+    ----------
+    files: int
+        The number of files of the upload
+
+    Returns
+    -------
+    str
+        A bounded label value: 'single' or 'bundle'
+    """
+    return "single" if files == 1 else "bundle"
+
+
+def get_stage_label(status) -> str:
+    """
+    Parameters
+    ----------
+    status: str
+        The exporterState value, without the repository prefix
+
+    Returns
+    -------
+    str
+        The stage, without the per-file details of the 'uploading file - ...' values
+    """
+    return status.split(" - ", 1)[0]
+
+
+def start_metrics_server():
+    """
+    Expose the metrics in the Prometheus text format, configured with the environment variable:
+        * EXPORTER_METRICS_PORT: the HTTP port of the /metrics endpoint (default 9400), 0 to disable it
+    """
+    port = int(os.environ.get("EXPORTER_METRICS_PORT", 9400))
+    if port == 0:
+        return
+
+    start_http_server(port)
+    logger.info(f"Metrics endpoint listening on port {port}")
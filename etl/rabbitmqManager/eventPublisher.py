@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import pika
+from pika.exceptions import AMQPError
+
+from etl.httpManager.httpSession import get_backoff_time
+from etl.metricsManager.exporterMetrics import EVENTS_PUBLISHED
+
+logger = logging.getLogger("iRODS to Dataverse")
+
+EVENTS_EXCHANGE = "datahub.events_tx"
+EXPORTER_STATE_ROUTING_KEY = "projectCollection.exporterState.{}"
+
+
+def get_exporter_state_routing_key(state) -> str:
+    """
+    Parameters
+    ----------
+    state: str
+        The exporterState stage, see etl.metricsManager.exporterMetrics.get_stage_label
+
+    Returns
+    -------
+    str
+        The routing key of the state events, e.g. projectCollection.exporterState.uploading-file
+    """
+    return EXPORTER_STATE_ROUTING_KEY.format(state.replace(" ", "-"))
+
+
+class EventPublisher:
+    """
+    Publish the events on the RabbitMQ events exchange, from a dedicated thread owning its own connection.
+
+    pika connections can't be shared between threads: the export threads only queue the events, and the publisher
+    thread publishes them in order. If RabbitMQ can't be reached, the publisher reconnects with exponential backoff
+    and the events wait in the bounded queue. Once the queue is full, the new events are dropped, so the exports never
+    block on the events.
+    """
+
+    enabled = True
+
+    def __init__(self, parameters, exchange=EVENTS_EXCHANGE, queue_size=1000):
+        """
+        Parameters
+        ----------
+        parameters: pika.ConnectionParameters
+            The RabbitMQ connection parameters
+        exchange: str
+            The exchange the events are published to
+        queue_size: int
+            The maximum number of events waiting to be published
+        """
+        self.parameters = parameters
+        self.exchange = exchange
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._closed = threading.Event()
+        self._connection = None
+        self._channel = None
+        self._thread = threading.Thread(target=self._run, name="event-publisher", daemon=True)
+        self._thread.start()
+
+    def publish(self, routing_key, body) -> bool:
+        """
+        Queue an event, to be published by the publisher thread.
+
+        Parameters
+        ----------
+        routing_key: str
+            The event routing key
+        body: dict
+            The JSON serializable event content
+
+        Returns
+        -------
+        bool
+            True, if the event was queued. False, if it was dropped.
+        """
+        try:
+            self._queue.put_nowait((routing_key, body))
+        except queue.Full:
+            logger.warning(f"{'--':<20}Event queue full, event dropped: {routing_key}")
+            EVENTS_PUBLISHED.labels("dropped").inc()
+            return False
+
+        return True
+
+    def close(self, timeout=10.0):
+        """
+        Publish the queued events, and close the connection.
+
+        Parameters
+        ----------
+        timeout: float
+            The maximum number of seconds to wait for the queued events to be published, the events still queued
+            afterwards are lost
+        """
+        self._closed.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        event = None
+        attempt = 0
+        while True:
+            if event is None:
+                try:
+                    event = self._queue.get(timeout=1)
+                except queue.Empty:
+                    if self._closed.is_set():
+                        break
+                    self._process_heartbeats()
+                    continue
+
+            try:
+                self._publish(*event)
+            except AMQPError as error:
+                logger.error(f"{'--':<20}Publish event {event[0]} failed: {error}")
+                EVENTS_PUBLISHED.labels("failed").inc()
+                self._disconnect()
+                # The event is published again, once reconnected
+                time.sleep(get_backoff_time(1, 60, attempt))
+                attempt += 1
+                continue
+
+            EVENTS_PUBLISHED.labels("published").inc()
+            event = None
+            attempt = 0
+
+        self._disconnect()
+
+    def _publish(self, routing_key, body):
+        if self._channel is None:
+            self._connection = pika.BlockingConnection(self.parameters)
+            self._channel = self._connection.channel()
+        self._channel.basic_publish(
+            exchange=self.exchange,
+            routing_key=routing_key,
+            body=json.dumps(body),
+            properties=pika.BasicProperties(content_type="application/json", timestamp=int(time.time())),
+        )
+
+    def _process_heartbeats(self):
+        if self._connection is None:
+            return
+        try:
+            self._connection.process_data_events(time_limit=0)
+        except AMQPError as error:
+            logger.warning(f"{'--':<20}Event publisher connection lost: {error}")
+            self._disconnect()
+
+    def _disconnect(self):
+        connection = self._connection
+        self._connection = None
+        self._channel = None
+        if connection is not None and connection.is_open:
+            try:
+                connection.close()
+            except AMQPError:
+                pass
+
+
+class DisabledEventPublisher:
+    """Publisher used when the events are disabled, or RabbitMQ isn't configured"""
+
+    enabled = False
+
+    def publish(self, routing_key, body) -> bool:
+        return False
+
+    def close(self, timeout=10.0):
+        pass
+
+
+_event_publisher = None
+_event_publisher_lock = threading.Lock()
+
+
+def get_event_publisher():
+    """
+    Get the process-wide event publisher, configured with the environment variables:
+        * EXPORTER_EVENTS: 1 (default) to publish the exporterState events, 0 to disable them
+        * EXPORTER_EVENTS_QUEUE_SIZE: the maximum number of events waiting to be published (default 1000)
+        * RABBITMQ_HOST, RABBITMQ_USER & RABBITMQ_PASS: the RabbitMQ connection, the events are disabled without host
+
+    Returns
+    -------
+    EventPublisher | DisabledEventPublisher
+        The shared event publisher
+    """
+    global _event_publisher
+    with _event_publisher_lock:
+        if _event_publisher is None:
+            if os.environ.get("EXPORTER_EVENTS", "1") != "1" or "RABBITMQ_HOST" not in os.environ:
+                _event_publisher = DisabledEventPublisher()
+            else:
+                parameters = pika.ConnectionParameters(
+                    host=os.environ["RABBITMQ_HOST"],
+                    port=5672,
+                    virtual_host="/",
+                    credentials=pika.PlainCredentials(os.environ["RABBITMQ_USER"], os.environ["RABBITMQ_PASS"]),
+                    heartbeat=600,
+                    blocked_connection_timeout=300,
+                )
+                _event_publisher = EventPublisher(
+                    parameters, queue_size=int(os.environ.get("EXPORTER_EVENTS_QUEUE_SIZE", 1000))
+                )
+                logger.info(f"exporterState events published on {EVENTS_EXCHANGE}")
+
+    return _event_publisher